@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the compliance checks on a seeded fake inventory.
+
+Usage:
+    python -m benchmarks.bench_checks --sgs 10000 --output baseline.json
+    python -m benchmarks.bench_checks --sgs 10000 --compare baseline.json
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from snitch.inventory.inventory import Inventory
+from snitch.policy.policy import compile_policy
+from snitch.resources.process_engine import ProcessRulesEngine
+from snitch.resources.rules_engine import NumpyRulesEngine, numpy_available
+from snitch.resources.security_group import SecurityGroup
+from snitch.resources.server import Server
+from snitch.scanner.exposure import RemoteGroupGraph
+from snitch.scanner.scanner import (
+    check_servers_compliance,
+    check_sg_compliance,
+    return_all_used_sgs,
+    scan_project,
+)
+
+from .generator import FakeConnection, FakeInventory
+
+RESULTS_FORMAT = 1
+
+BENCH_RULES = {
+    "project_1": {
+        "sg": {
+            "mandatory_tags": ["Team", "Department"],
+            "alert_if_not_used": True,
+            "ingress": {
+                "forbid_cidrs": ["0.0.0.0/0", "::/0", "100.64.0.0/10"],
+                "forbid_cidrs_match_subnets": True,
+                "max_netmask_allowed": 16,
+                "forbid_tcp_port": [20, 21, 23, 25, "135-139", 445, "6000-6063"],
+                "forbid_udp_port": [53, "137-138", 161],
+                "max_number_port_per_rule": 100,
+                "forbid_all_ports": True,
+                "forbid_all_protocols": True,
+            },
+            "egress": {
+                "forbid_cidrs": ["0.0.0.0/0", "::/0"],
+                "forbid_cidrs_match_subnets": False,
+            },
+        },
+        "server": {
+            "mandatory_tags": ["Team", "Department"],
+            "mandatory_metadata": ["owner", "app"],
+        },
+    }
+}
+
+
+##############################################################################
+# Benchmarks. Each one returns the number of resources and rules checked
+##############################################################################
+def bench_sg_tags(inventory, policy):
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_sg_tags(
+            policy.sg.mandatory_tags
+        )
+    return len(inventory.security_groups), 0
+
+
+def bench_sg_egress(inventory, policy):
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_egress_rules(
+            policy.sg.egress
+        )
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_sg_ingress(inventory, policy):
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_ingress_rules(
+            policy.sg.ingress
+        )
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def _bench_sg_rules_engine(engine, inventory, policy):
+    security_groups = [
+        SecurityGroup(inventory.project_name, os_sg)
+        for os_sg in inventory.security_groups
+    ]
+    for start in range(0, len(security_groups), engine.batch_size):
+        end = start + engine.batch_size
+        batch = security_groups[start:end]
+        engine.check_rules([rule for sg in batch for rule in sg.rules], policy.sg)
+        for securitygroup in batch:
+            securitygroup.add_rules_violations("egress")
+            securitygroup.add_rules_violations("ingress")
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_sg_rules_numpy(inventory, policy):
+    return _bench_sg_rules_engine(NumpyRulesEngine(), inventory, policy)
+
+
+def bench_sg_rules_process(inventory, policy, engine):
+    return _bench_sg_rules_engine(engine, inventory, policy)
+
+
+def bench_sg_rules_python(inventory, policy):
+    for os_sg in inventory.security_groups:
+        securitygroup = SecurityGroup(inventory.project_name, os_sg)
+        securitygroup.check_egress_rules(policy.sg.egress)
+        securitygroup.check_ingress_rules(policy.sg.ingress)
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_sg_redundant(inventory, _policy):
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_redundant_rules()
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_sg_remote_group_exposure(inventory, policy):
+    remote_groups = RemoteGroupGraph(inventory.security_groups, policy.sg.ingress)
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_remote_group_exposure(
+            remote_groups.exposed_cidrs(os_sg.id)
+        )
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_sg_not_used(inventory, _policy):
+    used_sgs = return_all_used_sgs(Inventory(FakeConnection([inventory])))
+    for os_sg in inventory.security_groups:
+        SecurityGroup(inventory.project_name, os_sg).check_sg_not_used(used_sgs)
+    return len(inventory.security_groups), 0
+
+
+def bench_server_tags(inventory, policy):
+    for os_server in inventory.servers:
+        Server(inventory.project_name, os_server).check_server_tags(
+            policy.server.mandatory_tags
+        )
+    return len(inventory.servers), 0
+
+
+def bench_server_metadata(inventory, policy):
+    for os_server in inventory.servers:
+        Server(inventory.project_name, os_server).check_server_metadata(
+            policy.server.mandatory_metadata
+        )
+    return len(inventory.servers), 0
+
+
+def bench_check_sg_compliance(inventory, policy):
+    check_sg_compliance(Inventory(FakeConnection([inventory])), policy.sg)
+    return len(inventory.security_groups), inventory.rules_count
+
+
+def bench_check_servers_compliance(inventory, policy):
+    check_servers_compliance(Inventory(FakeConnection([inventory])), policy.server)
+    return len(inventory.servers), 0
+
+
+def bench_scan_project(inventory, policy):
+    scan_project(FakeConnection([inventory]), policy, ["sg", "server"])
+    resources = len(inventory.security_groups) + len(inventory.servers)
+    return resources, inventory.rules_count
+
+
+BENCHMARKS = {
+    "sg_tags": bench_sg_tags,
+    "sg_egress": bench_sg_egress,
+    "sg_ingress": bench_sg_ingress,
+    "sg_rules_python": bench_sg_rules_python,
+    "sg_rules_process": bench_sg_rules_process,
+    "sg_redundant": bench_sg_redundant,
+    "sg_remote_group_exposure": bench_sg_remote_group_exposure,
+    "sg_not_used": bench_sg_not_used,
+    "server_tags": bench_server_tags,
+    "server_metadata": bench_server_metadata,
+    "check_sg_compliance": bench_check_sg_compliance,
+    "check_servers_compliance": bench_check_servers_compliance,
+    "scan_project": bench_scan_project,
+}
+if numpy_available():
+    BENCHMARKS["sg_rules_numpy"] = bench_sg_rules_numpy
+
+
+##############################################################################
+# Run benchmarks
+##############################################################################
+def run_benchmark(bench, inventory, policy, repeat):
+    """Return dict with best time, throughput and peak memory of bench."""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        resources, rules = bench(inventory, policy)
+        elapsed.append(time.perf_counter() - start)
+    seconds = min(elapsed)
+
+    # memory is measured apart, as tracing slows down the benchmark
+    tracemalloc.start()
+    try:
+        bench(inventory, policy)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "resources": resources,
+        "rules": rules,
+        "resources_per_sec": resources / seconds if seconds else None,
+        "rules_per_sec": rules / seconds if seconds and rules else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_benchmarks(options):
+    """Return dict with the benchmarks results and their parameters."""
+    policy = compile_policy(BENCH_RULES, "project_1")
+    inventory = FakeInventory(
+        options.seed,
+        sgs=options.sgs,
+        servers=options.servers,
+        max_rules=options.max_rules,
+    )
+    names = options.bench or list(BENCHMARKS)
+    # the worker processes are started once for all the runs, not on each one
+    engine = None
+    if "sg_rules_process" in names:
+        engine = ProcessRulesEngine(sg_policies=[policy.sg])
+    results = {}
+    try:
+        for name in names:
+            bench = BENCHMARKS[name]
+            if bench is bench_sg_rules_process:
+                bench = functools.partial(bench, engine=engine)
+            results[name] = run_benchmark(bench, inventory, policy, options.repeat)
+            print_result(name, results[name])
+    finally:
+        if engine is not None:
+            engine.close()
+
+    return {
+        "format": RESULTS_FORMAT,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "seed": options.seed,
+            "sgs": options.sgs,
+            "servers": options.servers,
+            "max_rules": options.max_rules,
+            "repeat": options.repeat,
+        },
+        "inventory": {
+            "security_groups": len(inventory.security_groups),
+            "rules": inventory.rules_count,
+            "servers": len(inventory.servers),
+            "ports": len(inventory.ports),
+        },
+        "results": results,
+    }
+
+
+def print_result(name, result):
+    rate = f"{result['resources_per_sec']:12.0f} resources/s"
+    if result["rules_per_sec"]:
+        rate += f" {result['rules_per_sec']:12.0f} rules/s"
+    print(
+        f"{name:26} {result['seconds']:9.4f}s {rate} "
+        f"peak {result['peak_memory_bytes'] / 2**20:8.2f} MiB",
+        file=sys.stderr,
+    )
+
+
+def compare_results(baseline, current):
+    """
+    Print time ratio of each benchmark against baseline.
+
+    Return the highest ratio (current / baseline time).
+    """
+    params = {k: v for k, v in current["params"].items() if k != "repeat"}
+    baseline_params = dict(baseline.get("params", {}))
+    baseline_params.pop("repeat", None)
+    if baseline_params != params:
+        print(
+            "Warning: baseline created with different parameters: "
+            f"{baseline.get('params')}",
+            file=sys.stderr,
+        )
+    worst = 0.0
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base["seconds"]:
+            print(f"{name:26} not in baseline", file=sys.stderr)
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        memory_ratio = result["peak_memory_bytes"] / max(base["peak_memory_bytes"], 1)
+        worst = max(worst, ratio)
+        print(
+            f"{name:26} time x{ratio:5.2f}  peak memory x{memory_ratio:5.2f}",
+            file=sys.stderr,
+        )
+    return worst
+
+
+def cli_argparse():
+    parser = argparse.ArgumentParser(
+        description="Benchmark os-snitch compliance checks",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--seed", type=int, default=42, help="(default: %(default)s)")
+    parser.add_argument(
+        "--sgs", type=int, default=1000, help="Security groups (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--servers", type=int, default=1000, help="Servers (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--max-rules",
+        dest="max_rules",
+        type=int,
+        default=200,
+        help="Max rules per security group (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs of each benchmark, the best time is kept (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--bench",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        help="Benchmarks to run (default: all)",
+    )
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file with baseline results")
+    parser.add_argument(
+        "--max-ratio",
+        dest="max_ratio",
+        type=float,
+        default=None,
+        help="Exit with error if a benchmark is slower than baseline by this ratio",
+    )
+    return parser
+
+
+def main(argv=None):
+    options = cli_argparse().parse_args(argv)
+    results = run_benchmarks(options)
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as output_fd:
+            json.dump(results, output_fd, indent=2)
+            output_fd.write("\n")
+
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as baseline_fd:
+            worst = compare_results(json.load(baseline_fd), results)
+        if options.max_ratio is not None and worst > options.max_ratio:
+            print(f"Slower than baseline: x{worst:.2f}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# vim: ts=4
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Measure how long os-snitch takes to answer --help.
+
+Each run imports snitch.os_snitch and calls main(["--help"]) in a new
+interpreter, the best time is kept.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --max-seconds 0.2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# modules that --help must not import, they are loaded when used
+LAZY_MODULES = (
+    "openstack",
+    "rich",
+    "importlib.metadata",
+    "numpy",
+    "snitch.notification.influxdb",
+    "snitch.notification.stdout",
+    "snitch.resources.process_engine",
+)
+
+_IMPORT_SCRIPT = f"""
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+import snitch.os_snitch
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        snitch.os_snitch.main(["--help"])
+    except SystemExit:
+        pass
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "modules": len(sys.modules),
+    "lazy_loaded": [i for i in {LAZY_MODULES!r} if i in sys.modules],
+}}))
+"""
+
+
+def measure_import(python=sys.executable, env=None):
+    """
+    Return dict with the time to import snitch.os_snitch and run --help in a
+    new interpreter.
+    """
+    output = subprocess.run(
+        [python, "-c", _IMPORT_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+    return json.loads(output)
+
+
+def run_startup_benchmark(repeat):
+    """Return the measure with the best time of repeat runs."""
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+    env["PYTHONPATH"] = os.pathsep.join(
+        i for i in (os.path.abspath(src), env.get("PYTHONPATH")) if i
+    )
+    results = [measure_import(env=env) for _ in range(repeat)]
+    return min(results, key=lambda i: i["seconds"])
+
+
+def cli_argparse():
+    parser = argparse.ArgumentParser(
+        description="Benchmark os-snitch startup",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs, the best time is kept"
+    )
+    parser.add_argument(
+        "--max-seconds",
+        dest="max_seconds",
+        type=float,
+        default=None,
+        help="Exit with error if the startup takes longer (startup budget)",
+    )
+    return parser
+
+
+def main(argv=None):
+    options = cli_argparse().parse_args(argv)
+    result = run_startup_benchmark(options.repeat)
+    print(
+        f"os-snitch --help {result['seconds'] * 1e3:8.2f}ms "
+        f"{result['modules']} modules",
+        file=sys.stderr,
+    )
+    status = 0
+    if result["lazy_loaded"]:
+        print(
+            f"Imported at startup: {', '.join(result['lazy_loaded'])}",
+            file=sys.stderr,
+        )
+        status = 1
+    if options.max_seconds is not None and result["seconds"] > options.max_seconds:
+        print(f"Over the startup budget of {options.max_seconds}s", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# vim: ts=4
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake OpenStack API for end to end tests and benchmarks.
+
+It serves Keystone v3 password auth, the project list, and paginated
+Neutron security groups/ports and Nova servers listings from projects made
+by the benchmarks generator. Page size, latency and error rate are
+configurable, and GET /_stats returns the number of requests served.
+
+Usage:
+    python -m benchmarks.fake_cloud --projects 3 --sgs 1000 --page-size 100
+    OS_AUTH_URL=http://127.0.0.1:5000/v3 OS_USERNAME=admin OS_PASSWORD=x \\
+    OS_PROJECT_NAME=project_1 OS_USER_DOMAIN_NAME=Default \\
+    OS_PROJECT_DOMAIN_NAME=Default os-snitch --resource sg server
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from .generator import FakeInventory
+
+DOMAIN = {"id": "default", "name": "Default"}
+USER = {"id": "fake-user-id", "name": "admin", "domain": DOMAIN}
+REGION = "RegionOne"
+
+
+##############################################################################
+# API representation of the generated resources
+##############################################################################
+def sg_body(project_id, os_sg):
+    return {
+        "id": os_sg.id,
+        "name": os_sg.name,
+        "description": "",
+        "project_id": project_id,
+        "tenant_id": project_id,
+        "stateful": True,
+        "created_at": os_sg.created_at,
+        "updated_at": os_sg.updated_at,
+        "revision_number": os_sg.revision_number,
+        "tags": list(os_sg.tags),
+        "security_group_rules": [
+            dict(
+                rule,
+                security_group_id=os_sg.id,
+                project_id=project_id,
+                tenant_id=project_id,
+                description="",
+            )
+            for rule in os_sg.security_group_rules
+        ],
+    }
+
+
+def port_body(project_id, port):
+    return {
+        "id": port.id,
+        "name": "",
+        "project_id": project_id,
+        "tenant_id": project_id,
+        "network_id": "fake-network-id",
+        "mac_address": "fa:16:3e:00:00:00",
+        "admin_state_up": True,
+        "status": "ACTIVE",
+        "device_id": port.device_id,
+        "device_owner": "compute:nova" if port.device_id else "",
+        "fixed_ips": [],
+        "security_groups": list(port.security_group_ids),
+        "tags": [],
+    }
+
+
+def server_body(project_id, os_server, base_url):
+    return {
+        "id": os_server.id,
+        "name": os_server.name,
+        "status": "ACTIVE",
+        "tenant_id": project_id,
+        "user_id": USER["id"],
+        "created": os_server.created_at,
+        "updated": os_server.created_at,
+        "tags": list(os_server.tags),
+        "metadata": dict(os_server.metadata),
+        "addresses": {},
+        "flavor": {"original_name": "m1.small"},
+        "image": "",
+        "links": [
+            {"rel": "self", "href": f"{base_url}/compute/v2.1/servers/{os_server.id}"}
+        ],
+    }
+
+
+##############################################################################
+# Server
+##############################################################################
+class FakeCloud(ThreadingHTTPServer):
+    """
+    HTTP server with the fake OpenStack API.
+
+    Params:
+        address       (tuple): host and port to listen, port 0 picks a free one
+        inventories    (list): FakeInventory instances, one per project
+        page_size       (int): max resources per page. Larger limits from the
+                               client are reduced to it
+        latency       (float): seconds added to each request
+        error_rate    (float): ratio of requests answered with HTTP 503
+        seed            (int): seed to choose the failed requests
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        inventories,
+        *,
+        page_size=1000,
+        latency=0.0,
+        error_rate=0.0,
+        seed=0,
+    ):
+        """FakeCloud."""
+        super().__init__(address, FakeCloudHandler)
+        self.projects = {i.project_id: i for i in inventories}
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.tokens = {}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def inject_error(self):
+        if not self.error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def find_project(self, scope):
+        """Return project FakeInventory from a token scope."""
+        project = scope.get("project", {})
+        for inventory in self.projects.values():
+            if project.get("id", inventory.project_id) != inventory.project_id:
+                continue
+            if project.get("name", inventory.project_name) == inventory.project_name:
+                return inventory
+        return None
+
+    def catalog(self):
+        base_url = self.base_url
+        services = (
+            ("identity", "keystone", f"{base_url}/v3"),
+            ("network", "neutron", f"{base_url}/network"),
+            ("compute", "nova", f"{base_url}/compute/v2.1"),
+        )
+        return [
+            {
+                "id": name,
+                "name": name,
+                "type": service_type,
+                "endpoints": [
+                    {
+                        "id": f"{name}-{interface}",
+                        "interface": interface,
+                        "region": REGION,
+                        "region_id": REGION,
+                        "url": url,
+                    }
+                    for interface in ("public", "internal", "admin")
+                ],
+            }
+            for service_type, name, url in services
+        ]
+
+
+class FakeCloudHandler(BaseHTTPRequestHandler):
+    """Request handler of FakeCloud."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_args):  # pylint: disable=arguments-differ
+        pass
+
+    ##########################################################################
+    # Helpers
+    ##########################################################################
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def token_project(self):
+        return self.server.tokens.get(self.headers.get("X-Auth-Token"))
+
+    def paginate(self, path, query, key, resources, to_body):
+        """Send a page of resources with a next link if there are more."""
+        page_size = self.server.page_size
+        limit = min(int(query.get("limit", [page_size])[0]), page_size)
+        marker = query.get("marker", [None])[0]
+        start = 0
+        if marker is not None:
+            ids = [i.id for i in resources]
+            start = ids.index(marker) + 1 if marker in ids else len(ids)
+        end = start + limit
+        page = resources[start:end]
+        fields = query.get("fields")
+        bodies = [to_body(i) for i in page]
+        if fields:
+            bodies = [{k: v for k, v in i.items() if k in fields} for i in bodies]
+        body = {key: bodies}
+        if end < len(resources):
+            next_query = {
+                k: v for k, v in query.items() if k not in ("limit", "marker")
+            }
+            next_query.update(limit=[str(limit)], marker=[page[-1].id])
+            href = f"{self.server.base_url}{path}?{urlencode(next_query, doseq=True)}"
+            body[f"{key}_links"] = [{"rel": "next", "href": href}]
+        self.send_json(200, body)
+
+    @staticmethod
+    def filter_tags(resources, query):
+        not_tags = query.get("not-tags")
+        if not not_tags:
+            return resources
+        tags = set(",".join(not_tags).split(","))
+        return [i for i in resources if not tags.issubset(i.tags)]
+
+    ##########################################################################
+    # Keystone
+    ##########################################################################
+    def identity_version(self):
+        base_url = self.server.base_url
+        return {
+            "id": "v3.14",
+            "status": "stable",
+            "updated": "2020-04-07T00:00:00Z",
+            "links": [{"rel": "self", "href": f"{base_url}/v3/"}],
+            "media-types": [
+                {
+                    "base": "application/json",
+                    "type": "application/vnd.openstack.identity-v3+json",
+                }
+            ],
+        }
+
+    def post_token(self):
+        body = self.read_json()
+        inventory = self.server.find_project(body.get("auth", {}).get("scope", {}))
+        if inventory is None:
+            self.send_json(401, {"error": {"code": 401, "message": "Unknown project"}})
+            return
+        token = uuid.uuid4().hex
+        self.server.tokens[token] = inventory
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.send_json(
+            201,
+            {
+                "token": {
+                    "methods": ["password"],
+                    "user": USER,
+                    "issued_at": now.isoformat(),
+                    "expires_at": (now + datetime.timedelta(hours=1)).isoformat(),
+                    "project": {
+                        "id": inventory.project_id,
+                        "name": inventory.project_name,
+                        "domain": DOMAIN,
+                    },
+                    "roles": [{"id": "admin", "name": "admin"}],
+                    "catalog": self.server.catalog(),
+                }
+            },
+            {"X-Subject-Token": token},
+        )
+
+    def get_projects(self):
+        self.send_json(
+            200,
+            {
+                "projects": [
+                    {
+                        "id": i.project_id,
+                        "name": i.project_name,
+                        "domain_id": DOMAIN["id"],
+                        "enabled": True,
+                    }
+                    for i in self.server.projects.values()
+                ],
+                "links": {"self": f"{self.server.base_url}/v3/projects", "next": None},
+            },
+        )
+
+    ##########################################################################
+    # Neutron and Nova
+    ##########################################################################
+    def list_project(self, query):
+        """Return FakeInventory of the project_id filter or of the token."""
+        project_id = query.get("project_id", query.get("tenant_id", [None]))[0]
+        if project_id is not None:
+            return self.server.projects.get(project_id)
+        return self.token_project()
+
+    def network(self, path, query):
+        if path in ("/network", "/network/"):
+            href = f"{self.server.base_url}/network/v2.0/"
+            self.send_json(
+                200,
+                {
+                    "versions": [
+                        {
+                            "id": "v2.0",
+                            "status": "CURRENT",
+                            "links": [{"rel": "self", "href": href}],
+                        }
+                    ]
+                },
+            )
+            return
+        inventory = self.list_project(query)
+        project_id = inventory.project_id if inventory else None
+        if path == "/network/v2.0/security-groups":
+            resources = inventory.security_groups if inventory else []
+            self.paginate(
+                path,
+                query,
+                "security_groups",
+                self.filter_tags(resources, query),
+                lambda i: sg_body(project_id, i),
+            )
+        elif path == "/network/v2.0/ports":
+            resources = inventory.ports if inventory else []
+            self.paginate(
+                path, query, "ports", resources, lambda i: port_body(project_id, i)
+            )
+        else:
+            self.send_json(404, {"NeutronError": {"message": f"{path} not found"}})
+
+    def compute(self, path, query):
+        version = {
+            "id": "v2.1",
+            "status": "CURRENT",
+            "version": "2.96",
+            "min_version": "2.1",
+            "updated": "2013-07-23T11:33:21Z",
+            "links": [{"rel": "self", "href": f"{self.server.base_url}/compute/v2.1/"}],
+        }
+        if path in ("/compute", "/compute/"):
+            self.send_json(200, {"versions": [version]})
+        elif path in ("/compute/v2.1", "/compute/v2.1/"):
+            self.send_json(200, {"version": version})
+        elif path in ("/compute/v2.1/servers/detail", "/compute/v2.1/servers"):
+            inventory = self.list_project(query)
+            project_id = inventory.project_id if inventory else None
+            resources = self.filter_tags(inventory.servers if inventory else [], query)
+            self.paginate(
+                path,
+                query,
+                "servers",
+                resources,
+                lambda i: server_body(project_id, i, self.server.base_url),
+            )
+        else:
+            self.send_json(404, {"itemNotFound": {"message": f"{path} not found"}})
+
+    ##########################################################################
+    # Dispatch
+    ##########################################################################
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/") or "/"
+        query = parse_qs(url.query)
+
+        if path == "/_stats":
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+            return
+
+        self.server.count(f"{method} {path}")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.inject_error():
+            self.server.count("errors")
+            self.send_json(503, {"message": "Injected error"})
+            return
+
+        if method == "POST":
+            if path == "/v3/auth/tokens":
+                self.post_token()
+            else:
+                self.send_json(404, {"error": {"message": f"{path} not found"}})
+        elif path == "/":
+            self.send_json(300, {"versions": {"values": [self.identity_version()]}})
+        elif path == "/v3":
+            self.send_json(200, {"version": self.identity_version()})
+        elif self.token_project() is None:
+            self.send_json(401, {"error": {"code": 401, "message": "Invalid token"}})
+        elif path == "/v3/projects":
+            self.get_projects()
+        elif path.startswith("/network"):
+            self.network(path, query)
+        elif path.startswith("/compute"):
+            self.compute(path, query)
+        else:
+            self.send_json(404, {"error": {"message": f"{path} not found"}})
+
+    def do_GET(self):  # noqa: N802 pylint: disable=invalid-name
+        self.handle_request("GET")
+
+    def do_POST(self):  # noqa: N802 pylint: disable=invalid-name
+        self.handle_request("POST")
+
+
+##############################################################################
+# Command line
+##############################################################################
+def create_inventories(seed, projects, **kwargs):
+    """Return a FakeInventory for each project, named project_1, project_2, ..."""
+    return [
+        FakeInventory(seed + i, f"project_{i + 1}", **kwargs) for i in range(projects)
+    ]
+
+
+def cli_argparse():
+    parser = argparse.ArgumentParser(
+        description="Fake OpenStack API for os-snitch tests",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="(default: %(default)s)")
+    parser.add_argument("--port", type=int, default=5000, help="(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="(default: %(default)s)")
+    parser.add_argument(
+        "--projects", type=int, default=1, help="Projects (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--sgs",
+        type=int,
+        default=1000,
+        help="Security groups per project (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--servers",
+        type=int,
+        default=1000,
+        help="Servers per project (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--page-size",
+        dest="page_size",
+        type=int,
+        default=1000,
+        help="Max resources per page (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to each request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        dest="error_rate",
+        type=float,
+        default=0.0,
+        help="Ratio of requests answered with HTTP 503 (default: %(default)s)",
+    )
+    return parser
+
+
+def main(argv=None):
+    options = cli_argparse().parse_args(argv)
+    inventories = create_inventories(
+        options.seed, options.projects, sgs=options.sgs, servers=options.servers
+    )
+    server = FakeCloud(
+        (options.host, options.port),
+        inventories,
+        page_size=options.page_size,
+        latency=options.latency,
+        error_rate=options.error_rate,
+        seed=options.seed,
+    )
+    print(f"Fake OpenStack API on {server.base_url}/v3", file=sys.stderr)
+    for inventory in inventories:
+        print(
+            f"  {inventory.project_name}: {len(inventory.security_groups)} sgs, "
+            f"{inventory.rules_count} rules, {len(inventory.servers)} servers",
+            file=sys.stderr,
+        )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.stats), indent=2), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+# vim: ts=4
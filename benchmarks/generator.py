@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Seeded generator of fake OpenStack projects for the benchmarks."""
+
+import ipaddress
+import random
+import uuid
+from types import SimpleNamespace
+
+TAGS = ("Team", "Department", "CostCenter", "Env", "Owner", "App")
+METADATA_KEYS = ("owner", "app", "env", "backup", "ha")
+PROTOCOLS = ("tcp", "tcp", "tcp", "udp", "icmp", None)
+IPV4_PREFIXES = ("0.0.0.0/0", "10.0.0.0/8", "100.64.0.0/10", "192.168.0.0/16")
+CREATED_AT = "2020-01-01T00:00:00Z"
+
+
+##############################################################################
+# Fake resources
+##############################################################################
+class FakeInventory:  # pylint: disable=too-few-public-methods
+    """
+    Fake resources of a project, generated from a seed.
+
+    Params:
+        seed           (int): random seed, the same seed gives the same resources
+        project_name   (str): project name
+        sgs            (int): number of security groups
+        servers        (int): number of servers
+        max_rules      (int): max rules per security group. Rule counts are
+                              skewed: most groups have a few rules, some many
+        ipv6_ratio   (float): ratio of rules with IPv6 prefixes
+        unused_ratio (float): ratio of security groups not used by any port
+    """
+
+    def __init__(
+        self,
+        seed,
+        project_name="project_1",
+        *,
+        sgs=1000,
+        servers=1000,
+        max_rules=200,
+        ipv6_ratio=0.2,
+        unused_ratio=0.1,
+    ):
+        """FakeInventory."""
+        self.random = random.Random(seed)
+        self.project_id = self._uuid()
+        self.project_name = project_name
+        self.max_rules = max_rules
+        self.ipv6_ratio = ipv6_ratio
+        self.security_groups = [self._security_group() for _ in range(sgs)]
+        self.servers = [self._server() for _ in range(servers)]
+        self.ports = self._ports(unused_ratio)
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _tags(self):
+        # most resources have the usual tags, some miss one or all of them
+        return self.random.sample(TAGS, self.random.choice((0, 2, 3, 3, 4, 4, 5)))
+
+    def _rules_count(self):
+        return min(self.max_rules, int(self.random.paretovariate(1.2)))
+
+    def _network(self, network_class, prefix_len):
+        bits = 32 if network_class is ipaddress.IPv4Network else 128
+        address = (
+            self.random.getrandbits(bits) >> (bits - prefix_len) << (bits - prefix_len)
+        )
+        return str(network_class((address, prefix_len)))
+
+    def _remote_ip_prefix(self):
+        if self.random.random() < self.ipv6_ratio:
+            prefix_len = self.random.choice((0, 32, 48, 56, 64, 128))
+            return self._network(ipaddress.IPv6Network, prefix_len)
+        if self.random.random() < 0.3:
+            return self.random.choice(IPV4_PREFIXES)
+        prefix_len = self.random.choice((8, 16, 24, 24, 28, 32))
+        return self._network(ipaddress.IPv4Network, prefix_len)
+
+    def _ports_range(self, protocol):
+        if protocol not in ("tcp", "udp"):
+            return None, None
+        kind = self.random.random()
+        if kind < 0.1:
+            # all ports
+            return None, None
+        port = self.random.randint(1, 65535)
+        if kind < 0.7:
+            return port, port
+        # wide ranges
+        return port, min(65535, port + self.random.choice((10, 100, 1000, 30000)))
+
+    def _rule(self, sg_id):
+        direction = "ingress" if self.random.random() < 0.8 else "egress"
+        protocol = self.random.choice(PROTOCOLS)
+        port_range_min, port_range_max = self._ports_range(protocol)
+        remote_group_id = None
+        remote_ip_prefix = self._remote_ip_prefix()
+        ethertype = "IPv6" if ":" in remote_ip_prefix else "IPv4"
+        if self.random.random() < 0.1:
+            remote_group_id, remote_ip_prefix = sg_id, None
+        return {
+            "id": self._uuid(),
+            "direction": direction,
+            "ethertype": ethertype,
+            "protocol": protocol,
+            "port_range_min": port_range_min,
+            "port_range_max": port_range_max,
+            "remote_ip_prefix": remote_ip_prefix,
+            "remote_group_id": remote_group_id,
+        }
+
+    def _security_group(self):
+        sg_id = self._uuid()
+        return SimpleNamespace(
+            id=sg_id,
+            name=f"sg-{sg_id[:8]}",
+            created_at=CREATED_AT,
+            updated_at=CREATED_AT,
+            revision_number=self.random.randint(1, 10),
+            tags=self._tags(),
+            security_group_rules=[
+                self._rule(sg_id) for _ in range(self._rules_count())
+            ],
+        )
+
+    def _server(self):
+        server_id = self._uuid()
+        metadata_keys = self.random.sample(
+            METADATA_KEYS, self.random.randint(0, len(METADATA_KEYS))
+        )
+        return SimpleNamespace(
+            id=server_id,
+            name=f"server-{server_id[:8]}",
+            created_at=CREATED_AT,
+            tags=self._tags(),
+            metadata={key: "x" for key in metadata_keys},
+        )
+
+    def _ports(self, unused_ratio):
+        used_sgs = [
+            i.id for i in self.security_groups if self.random.random() >= unused_ratio
+        ]
+        ports = [
+            SimpleNamespace(
+                id=self._uuid(),
+                security_group_ids=self.random.sample(used_sgs, min(len(used_sgs), 2)),
+                device_id=server.id,
+            )
+            for server in self.servers
+        ]
+        # each used group has at least one port
+        ports.extend(
+            SimpleNamespace(id=self._uuid(), security_group_ids=[sg_id], device_id="")
+            for sg_id in used_sgs
+        )
+        return ports
+
+    @property
+    def rules_count(self):
+        """Return number of security group rules."""
+        return sum(len(i.security_group_rules) for i in self.security_groups)
+
+
+##############################################################################
+# Fake openstacksdk connection
+##############################################################################
+def _not_tags(resources, not_tags):
+    """Filter resources like the API not-tags filter."""
+    if not not_tags:
+        return list(resources)
+    tags = set(not_tags.split(","))
+    return [i for i in resources if not tags.issubset(i.tags)]
+
+
+class FakeConnection:
+    """
+    Connection scoped to a FakeInventory project, with the openstacksdk
+    methods used by the scanner.
+    """
+
+    def __init__(self, inventories, project_name=None):
+        """FakeConnection."""
+        self.inventories = {i.project_name: i for i in inventories}
+        inventory = self.inventories[project_name or next(iter(self.inventories))]
+        self.config = SimpleNamespace(name="fake", region_name="RegionOne")
+        self.current_project = SimpleNamespace(
+            id=inventory.project_id, name=inventory.project_name
+        )
+        self.network = SimpleNamespace(
+            ports=lambda **_query: list(inventory.ports),
+            security_groups=lambda not_tags=None, **_query: _not_tags(
+                inventory.security_groups, not_tags
+            ),
+        )
+        self.compute = SimpleNamespace(
+            servers=lambda not_tags=None, **_query: _not_tags(
+                inventory.servers, not_tags
+            )
+        )
+        self.identity = SimpleNamespace(
+            projects=lambda: [
+                SimpleNamespace(
+                    id=i.project_id, name=i.project_name, domain_id="default"
+                )
+                for i in self.inventories.values()
+            ]
+        )
+
+    def connect_as_project(self, project):
+        project_name = project["name"] if isinstance(project, dict) else project
+        return FakeConnection(self.inventories.values(), project_name)
+
+
+# vim: ts=4
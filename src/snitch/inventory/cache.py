@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Module to cache OpenStack API listings on disk."""
+
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from types import SimpleNamespace
+
+LOG = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def _safe_name(value):
+    """Return value usable as file name (no path separators, no dot names)."""
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(value))
+    return name if name.strip(".") else "_" * max(len(name), 1)
+
+
+class ListingCache:
+    """
+    On disk cache of resource listings.
+
+    Each listing is stored in a gzip file with one JSON array per resource,
+    holding only the fields the checks need, in this path:
+    cache_dir/cloud/region/project_id/resource_type.jsonl.gz
+
+    Params:
+        cache_dir  (str): directory to store the listings
+        max_age  (float): max listing age in seconds. Older listings are
+                          fetched again from the API
+    """
+
+    def __init__(self, cache_dir, max_age):
+        """ListingCache."""
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        """Return file path for key (tuple with cloud, region, project, type)."""
+        *dirs, name = [_safe_name(i) for i in key]
+        return os.path.join(self.cache_dir, *dirs, f"{name}.jsonl.gz")
+
+    def _open(self, path, fields):
+        """Return cache file positioned on the first record, or None if missing."""
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        if age > self.max_age:
+            LOG.debug("Cache expired (%.0fs): %s", age, path)
+            return None
+
+        cache_fd = gzip.open(path, "rt", encoding="utf-8")
+        try:
+            header = json.loads(cache_fd.readline())
+        except (OSError, ValueError, EOFError):
+            LOG.debug("Invalid cache file: %s", path, exc_info=True)
+            cache_fd.close()
+            return None
+        if header != {"version": CACHE_VERSION, "fields": list(fields)}:
+            LOG.debug("Cache with different format: %s", path)
+            cache_fd.close()
+            return None
+        return cache_fd
+
+    @staticmethod
+    def _read(cache_fd, fields):
+        with cache_fd:
+            for line in cache_fd:
+                yield SimpleNamespace(**dict(zip(fields, json.loads(line))))
+
+    def _fetch_and_store(self, path, fields, fetch):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        complete = False
+        try:
+            with os.fdopen(tmp_fd, "wb") as raw_fd, gzip.open(
+                raw_fd, "wt", encoding="utf-8"
+            ) as cache_fd:
+                json.dump({"version": CACHE_VERSION, "fields": list(fields)}, cache_fd)
+                cache_fd.write("\n")
+                for resource in fetch():
+                    record = [getattr(resource, i, None) for i in fields]
+                    cache_fd.write(json.dumps(record, separators=(",", ":")))
+                    cache_fd.write("\n")
+                    yield resource
+            complete = True
+        finally:
+            # only complete listings are stored
+            if complete:
+                os.replace(tmp_path, path)
+            else:
+                os.unlink(tmp_path)
+
+    def listing(self, key, fields, fetch):
+        """
+        Return resources from cache, or from fetch() storing them in cache.
+
+        Params:
+            key    (tuple): cloud, region, project and resource type
+            fields (tuple): resource attributes to store
+            fetch   (func): return an iterable with the resources from the API
+
+        Resources from cache have only the attributes in fields. Resources
+        from the API are yielded while they are stored.
+        """
+        path = self.path(key)
+        cache_fd = self._open(path, fields)
+        if cache_fd is not None:
+            LOG.debug("Using cache: %s", path)
+            self.hits += 1
+            return self._read(cache_fd, fields)
+        LOG.debug("Cache miss: %s", path)
+        self.misses += 1
+        return self._fetch_and_store(path, fields, fetch)
+
+
+# vim: ts=4
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Module to list OpenStack resources of a project."""
+
+import functools
+import hashlib
+import logging
+
+from ..utils.profiler import PROFILER
+
+LOG = logging.getLogger(__name__)
+
+# resource attributes used by the checks (and stored in the cache)
+PORT_FIELDS = ("id", "security_group_ids", "device_id")
+# the same port attributes with their API names, so neutron returns only them
+PORT_API_FIELDS = ("id", "security_groups", "device_id")
+SG_FIELDS = (
+    "id",
+    "name",
+    "created_at",
+    "updated_at",
+    "revision_number",
+    "tags",
+    "security_group_rules",
+)
+SERVER_FIELDS = ("id", "name", "created_at", "tags", "metadata")
+
+
+def _iter_timed(name, fetch):
+    return PROFILER.iter_timed(name, fetch())
+
+
+def connection_region(os_conn):
+    """Return tuple with the cloud and region names of os_conn ("" if not set)."""
+    config = getattr(os_conn, "config", None)
+    return (
+        getattr(config, "name", None) or "",
+        getattr(config, "region_name", None) or "",
+    )
+
+
+class Inventory:
+    """
+    Resource listings of the project os_conn is scoped to.
+
+    Params:
+        os_conn (openstack.connection.Connection): project scoped connection
+        cache                       (ListingCache): optional listings cache
+    """
+
+    def __init__(self, os_conn, cache=None):
+        """Inventory."""
+        self.os_conn = os_conn
+        self.cache = cache
+        self.project_id = os_conn.current_project.id
+        self.project_name = os_conn.current_project.name
+
+    def scope(self):
+        """Return tuple with cloud, region and project id."""
+        return (*connection_region(self.os_conn), self.project_id)
+
+    def cache_key(self, resource_type):
+        """Return cache key for a resource listing of the project."""
+        return (*self.scope(), resource_type)
+
+    def _listing(self, resource_type, fields, fetch):
+        if PROFILER.enabled:
+            # the not-tags listings are timed with the full ones
+            name = f"api.{resource_type.split('-', 1)[0]}"
+            fetch = functools.partial(_iter_timed, name, fetch)
+        if self.cache is None:
+            return fetch()
+        return self.cache.listing(self.cache_key(resource_type), fields, fetch)
+
+    @staticmethod
+    def _tags_filter(resource_type, not_tags):
+        """Return listing name and API query to list resources missing a tag."""
+        if not not_tags:
+            return resource_type, {}
+        # neutron and nova tags cannot have commas
+        value = ",".join(not_tags)
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+        return f"{resource_type}-not-tags-{digest}", {"not_tags": value}
+
+    def ports(self):
+        """Return project ports, with only the attributes in PORT_FIELDS."""
+        return self._listing(
+            "ports",
+            PORT_FIELDS,
+            lambda: self.os_conn.network.ports(
+                project_id=self.project_id, fields=list(PORT_API_FIELDS)
+            ),
+        )
+
+    def security_groups(self, not_tags=None):
+        """
+        Return project security groups.
+
+        If not_tags is set, only security groups missing at least one of
+        these tags are listed (filtered by the API).
+        """
+        name, query = self._tags_filter("security_groups", not_tags)
+        return self._listing(
+            name,
+            SG_FIELDS,
+            lambda: self.os_conn.network.security_groups(
+                project_id=self.project_id, **query
+            ),
+        )
+
+    def servers(self, not_tags=None):
+        """
+        Return project servers.
+
+        If not_tags is set, only servers missing at least one of these tags
+        are listed (filtered by the API).
+        """
+        name, query = self._tags_filter("servers", not_tags)
+        return self._listing(
+            name,
+            SERVER_FIELDS,
+            lambda: self.os_conn.compute.servers(project_id=self.project_id, **query),
+        )
+
+
+# vim: ts=4
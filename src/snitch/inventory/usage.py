@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Module with the index of the security groups used by ports."""
+
+
+class SgUsageIndex:
+    """
+    Ports and devices using each security group.
+
+    It supports "sg_id in index" to know if a security group is used, and
+    reverse lookups to know which ports and devices (servers, routers, ...)
+    use it.
+
+    Params:
+        ports (iterable): ports with id, security_group_ids and device_id
+    """
+
+    __slots__ = ("_sg_ports", "_port_device")
+
+    def __init__(self, ports=()):
+        """SgUsageIndex."""
+        self._sg_ports = {}
+        self._port_device = {}
+        for port in ports:
+            self.add(port)
+
+    def add(self, port):
+        """Add a port to the index."""
+        if not port.security_group_ids:
+            return
+        if port.device_id:
+            self._port_device[port.id] = port.device_id
+        for sg_id in port.security_group_ids:
+            self._sg_ports.setdefault(sg_id, []).append(port.id)
+
+    def __contains__(self, sg_id):
+        return sg_id in self._sg_ports
+
+    def __len__(self):
+        return len(self._sg_ports)
+
+    def __iter__(self):
+        return iter(self._sg_ports)
+
+    @property
+    def used_sg_ids(self):
+        """Return a set-like view with the used security group ids."""
+        return self._sg_ports.keys()
+
+    def ports_of(self, sg_id):
+        """Return a tuple with the ids of the ports using the security group."""
+        return tuple(self._sg_ports.get(sg_id, ()))
+
+    def devices_of(self, sg_id):
+        """Return a set with the ids of the devices using the security group."""
+        return {
+            self._port_device[port_id]
+            for port_id in self._sg_ports.get(sg_id, ())
+            if port_id in self._port_device
+        }
+
+
+# vim: ts=4
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Module to send violations to several notification backends concurrently."""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .notificationbase import SendAbandoned
+
+LOG = logging.getLogger(__name__)
+
+# max number of violations waiting to be sent to each backend
+QUEUE_MAXSIZE = 1000
+
+_END = object()
+
+
+@dataclass
+class DeliveryReport:
+    """Result of sending violations to a notification backend."""
+
+    backend: str
+    delivered: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+
+class _BackendWorker:
+    """
+    Thread that feeds a notification backend from a bounded queue.
+
+    The report is written by the worker thread until the backend is
+    abandoned (timeout), and then only by the dispatcher, under lock.
+    """
+
+    def __init__(self, name, notification, maxsize):
+        self.report = DeliveryReport(name)
+        self.notification = notification
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.abandoned = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name=f"snitch-{name}", daemon=True
+        )
+        self.start = None
+
+    def violations(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                item = None
+            if self.abandoned.is_set():
+                # raised in the backend, so it does not flush a partial output
+                raise SendAbandoned()
+            if item is _END:
+                return
+            if item is None:
+                continue
+            yield item
+            with self.lock:
+                if not self.abandoned.is_set():
+                    self.report.delivered += 1
+
+    def begin(self):
+        self.start = time.monotonic()
+        self.thread.start()
+
+    def run(self):
+        error = None
+        try:
+            self.notification.send_violations(self.violations())
+        except SendAbandoned:
+            LOG.debug("Abandoned notification backend %s", self.report.backend)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug(
+                "Error sending violations to %s", self.report.backend, exc_info=True
+            )
+            error = str(exc) or type(exc).__name__
+        finally:
+            with self.lock:
+                if not self.abandoned.is_set():
+                    self.report.error = error
+                    self.report.elapsed = time.monotonic() - self.start
+                self.done.set()
+
+    def put(self, item, timeout):
+        """Put item in the queue. Return False if the backend is not alive."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.done.is_set():
+            if deadline is None:
+                timeout = 0.1
+            else:
+                timeout = min(0.1, deadline - time.monotonic())
+                if timeout <= 0:
+                    self.timeout()
+                    return False
+            try:
+                self.queue.put(item, timeout=timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def timeout(self):
+        """Abandon the backend if it is still running."""
+        with self.lock:
+            if not self.done.is_set():
+                self.report.error = "timeout"
+                self.report.elapsed = time.monotonic() - self.start
+                self.abandoned.set()
+
+
+def dispatch_violations(
+    notifications, violations, *, timeout=None, maxsize=QUEUE_MAXSIZE
+):
+    """
+    Send violations to all notification backends concurrently.
+
+    Each backend runs in its own thread and receives the violations from a
+    bounded queue, so a slow backend does not delay the others until its
+    queue is full.
+
+    Params:
+        notifications (dict): backend name as key and NotificationBase as value
+        violations (iterable): Violation objects, it can be a generator
+        timeout       (float): max seconds a backend can take to accept a
+                               violation when its queue is full, and to finish
+                               after the last violation. None waits forever.
+                               A backend that times out is abandoned
+        maxsize         (int): max violations waiting in each backend queue
+
+    Return a list with a DeliveryReport for each backend.
+    """
+    workers = [
+        _BackendWorker(name, notification, maxsize)
+        for name, notification in notifications.items()
+    ]
+    for worker in workers:
+        worker.begin()
+
+    alive = list(workers)
+    try:
+        for violation in violations:
+            alive = [i for i in alive if i.put(violation, timeout)]
+            if not alive:
+                LOG.debug("No notification backend alive")
+                break
+    finally:
+        # let backends flush what they received, even if the scan failed
+        alive = [i for i in alive if i.put(_END, timeout)]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for worker in alive:
+            if deadline is None:
+                worker.done.wait()
+            else:
+                worker.done.wait(max(0, deadline - time.monotonic()))
+            worker.timeout()
+
+    return [worker.report for worker in workers]
+
+
+# vim: ts=4
@@ -3,37 +3,169 @@
 
 import logging
 import os
+import time
 
 from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+from influxdb.line_protocol import make_line
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
 
 from .notificationbase import NotificationBase
 
 LOG = logging.getLogger(__name__)
 
+# InfluxDB client error status worth retrying (server errors are retried too)
+RETRY_STATUS = (429,)
 
-def fmt_violation_payload(violation):
-    """Format violation object to influxdb payload."""
-    return [
-        {
-            "measurement": violation.resource_type,
-            "tags": {
-                "project_name": violation.project_name,
-                "resource_name": violation.resource_name,
-                "resource_id": violation.resource_id,
-                "message": violation.message,
-            },
-            "fields": {
-                "resource_created_at": violation.resource_created_at,
-            },
-        }
-    ]
+
+class InfluxdbError(Exception):
+    """Error writing points to InfluxDB."""
+
+
+def fmt_violation_line(violation, timestamp):
+    """
+    Format violation object to influxdb line protocol.
+
+    Params:
+        violation (Violation): Violation object
+        timestamp       (int): timestamp in seconds
+    """
+    # empty tag values are left out, line protocol does not accept them
+    return make_line(
+        violation.resource_type,
+        tags={
+            "cloud": violation.cloud,
+            "region": violation.region,
+            "project_name": violation.project_name,
+            "resource_name": violation.resource_name,
+            "resource_id": violation.resource_id,
+            "message": violation.message,
+        },
+        fields={"resource_created_at": str(violation.resource_created_at)},
+        time=timestamp,
+        precision="s",
+    )
+
+
+##############################################################################
+# Batched writer
+##############################################################################
+class InfluxdbWriter:
+    """
+    Write line protocol points to InfluxDB in batches.
+
+    Points are buffered until batch_bytes bytes and written when flush() is
+    called, with at most batch_size points per request. Transient errors
+    (connection errors, HTTP 429 and 5xx) are retried with exponential
+    backoff. Points rewritten by a retry are the same points (same series
+    and timestamp), so InfluxDB overwrites them. A batch that still fails
+    is dropped, so the next flush() does not send it again.
+
+    Params:
+        client (InfluxDBClient): client of the database to write to, with
+                                 retries=1 to let the writer retry
+    Keyword arguments (opt):
+        batch_size   (int): max points per request (default 5000)
+        batch_bytes  (int): max bytes buffered before writing (default 1MiB)
+        retries      (int): max retries per batch (default 3)
+        backoff    (float): first retry delay in seconds, doubled on each
+                            retry (default 0.5)
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        batch_size=5000,
+        batch_bytes=1024 * 1024,
+        retries=3,
+        backoff=0.5,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.retries = retries
+        self.backoff = backoff
+
+        self.batch = []
+        self.batch_len = 0
+        self.points_written = 0
+        self.points_dropped = 0
+        self.elapsed = 0.0
+
+    def write(self, line):
+        """Add a line protocol point to the batch."""
+        size = len(line.encode("utf-8")) + 1
+        if self.batch and self.batch_len + size > self.batch_bytes:
+            self.flush()
+        self.batch.append(line)
+        self.batch_len += size
+
+    def flush(self):
+        """Send points waiting in the batch."""
+        if not self.batch:
+            return
+        points = self.batch
+        self.batch = []
+        self.batch_len = 0
+
+        start = time.monotonic()
+        try:
+            self._write_points(points)
+        except InfluxdbError:
+            # retries are exhausted, close() must not retry the batch again
+            self.points_dropped += len(points)
+            raise
+        finally:
+            self.elapsed += time.monotonic() - start
+
+        LOG.debug("Wrote %s points to InfluxDB", len(points))
+        self.points_written += len(points)
+
+    def _write_points(self, points):
+        attempt = 0
+        while True:
+            try:
+                self.client.write_points(
+                    points,
+                    time_precision="s",
+                    batch_size=self.batch_size,
+                    protocol="line",
+                )
+                return
+            except InfluxDBClientError as error:
+                message = f"InfluxDB write failed: HTTP {error.code} {error.content}"
+                if error.code not in RETRY_STATUS:
+                    raise InfluxdbError(message) from None
+            except InfluxDBServerError as error:
+                message = f"InfluxDB write failed: {error}"
+            except (RequestsConnectionError, Timeout) as error:
+                message = f"InfluxDB write failed: {error}"
+
+            if attempt >= self.retries:
+                raise InfluxdbError(message)
+            delay = self.backoff * 2**attempt
+            attempt += 1
+            LOG.debug("%s. Retry %s in %.2fs", message, attempt, delay)
+            time.sleep(delay)
+
+    def points_per_second(self):
+        """Return points written per second spent on requests."""
+        return self.points_written / self.elapsed if self.elapsed else 0.0
 
 
 class InfluxdbClient(NotificationBase):
     """
     Class to send violations to influxdb.
-    Args:
-        violations  (list): List with Violation object
+
+    Mandatory environment variables: INFLUX_HOST, INFLUX_PORT,
+    INFLUX_USERNAME, INFLUX_PASSWORD and INFLUX_DATABASE.
+    Optional environment variables: INFLUX_BATCH_SIZE (default 5000
+    points), INFLUX_BATCH_BYTES (default 1048576), INFLUX_GZIP (default
+    true) and INFLUX_RETRIES (default 3).
+
+    All violations of a scan are written with the same timestamp.
     """
 
     # pylint: disable=W0613
@@ -44,19 +176,41 @@ class InfluxdbClient(NotificationBase):
             username=self.get_env("INFLUX_USERNAME"),
             password=self.get_env("INFLUX_PASSWORD"),
             database=self.get_env("INFLUX_DATABASE"),
+            gzip=self.get_env_bool("INFLUX_GZIP", True),
+            # retries with backoff are done by InfluxdbWriter
+            retries=1,
+        )
+        self.writer = InfluxdbWriter(
+            self.client,
+            batch_size=self.get_env_int("INFLUX_BATCH_SIZE", 5000),
+            batch_bytes=self.get_env_int("INFLUX_BATCH_BYTES", 1024 * 1024),
+            retries=self.get_env_int("INFLUX_RETRIES", 3),
         )
+        self.timestamp = None
 
-    def send_violations(self, violations):
+    def open(self):
+        self.timestamp = int(time.time())
+
+    def write_violation(self, violation):
         """
-        Write violations to InfluxDB.
+        Write violation to InfluxDB.
 
         Args:
-            violations  (list): List with Violation object
+            violation  (Violation): Violation object
         """
-        for v in violations:
-            LOG.debug("Writing violations %s", v)
-            payload = fmt_violation_payload(v)
-            self.client.write_points(payload)
+        LOG.debug("Writing violations %s", violation)
+        if self.timestamp is None:
+            self.open()
+        self.writer.write(fmt_violation_line(violation, self.timestamp))
+
+    def close(self):
+        self.writer.flush()
+        LOG.info(
+            "InfluxDB: wrote %s points (%.0f points/s), %s points dropped",
+            self.writer.points_written,
+            self.writer.points_per_second(),
+            self.writer.points_dropped,
+        )
 
     @staticmethod
     def get_env(var):
@@ -64,5 +218,24 @@ class InfluxdbClient(NotificationBase):
             raise ValueError(f"Error: You must export environment variable {var}")
         return os.environ.get(var)
 
+    @staticmethod
+    def get_env_int(var, default):
+        value = os.environ.get(var)
+        if not value:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(
+                f"Error: environment variable {var} must be an integer"
+            ) from None
+
+    @staticmethod
+    def get_env_bool(var, default):
+        value = os.environ.get(var)
+        if not value:
+            return default
+        return value.lower() in ("1", "true", "yes", "on")
+
 
 # vim: ts=4
@@ -1,17 +1,74 @@
 # -*- coding: utf-8 -*-
 """Module to create notification class object."""
 
-from . import influxdb, stdout
+import functools
+import importlib
+
+# built-in notification systems, imported only when they are used
+BACKENDS = {
+    "influxdb": "snitch.notification.influxdb:InfluxdbClient",
+    "stdout": "snitch.notification.stdout:Stdout",
+}
+
+# entry points group of the notification systems of other packages
+ENTRY_POINT_GROUP = "snitch.notification"
+
+
+@functools.lru_cache(maxsize=None)
+def _entry_points():
+    """
+    Return dict with name and entry point of the installed plugins.
+
+    Scanning the installed packages is slow, it is done once.
+    """
+    # pylint: disable=import-outside-toplevel
+    # importlib.metadata is only needed to find the plugins
+    try:
+        from importlib import metadata
+    except ImportError:  # python < 3.8
+        return {}
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, ())
+    # built-in notification systems cannot be replaced
+    return {i.name: i for i in entry_points if i.name not in BACKENDS}
+
+
+def available_notifications():
+    """Return list with the name of the built-in and plugin notification systems."""
+    return list(BACKENDS) + sorted(_entry_points())
+
+
+def unknown_notifications(systems):
+    """
+    Return list with the systems that are not notification systems.
+
+    The plugins are only looked up if a system is not a built-in one.
+    """
+    unknown = [i for i in systems if i not in BACKENDS]
+    if unknown:
+        plugins = _entry_points()
+        unknown = [i for i in unknown if i not in plugins]
+    return unknown
+
+
+def load_notification(system):
+    """Import and return the NotificationBase subclass of system."""
+    if system in BACKENDS:
+        module_name, class_name = BACKENDS[system].split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+    entry_point = _entry_points().get(system)
+    if entry_point is None:
+        raise ValueError(f"Unknown notification system: {system}")
+    return entry_point.load()
 
 
 def create_notification(system, **kwargs):
     """Return notificationbase class object."""
-    supported = {
-        "influxdb": influxdb.InfluxdbClient,
-        "stdout": stdout.Stdout,
-    }
-
-    return supported[system](**kwargs)
+    return load_notification(system)(**kwargs)
 
 
 # vim: ts=4
@@ -4,19 +4,60 @@
 from abc import ABC, abstractmethod
 
 
-# pylint: disable=R0903
+class SendAbandoned(Exception):
+    """
+    Raised by the violations iterable when the sender gave up on the
+    backend (e.g. timeout). The backend is not closed, so it does not
+    flush a partial output as a complete one.
+    """
+
+
 class NotificationBase(ABC):
-    """Notification abstract class."""
+    """
+    Notification abstract class.
+
+    Violations are pushed to the backend one by one as soon as they are
+    found: open() is called before the first violation, write_violation()
+    for each violation and close() after the last one.
+    """
+
+    def open(self):
+        """Prepare backend to receive violations."""
 
     @abstractmethod
+    def write_violation(self, violation):
+        """
+        Write a violation to backend.
+
+        Args:
+            violation  (Violation): Violation object
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Flush violations buffered by the backend."""
+
     def send_violations(self, violations):
         """
         Write violations to backend.
 
         Args:
-            violations  (list): List with Violation object
+            violations  (iterable): Violation objects. It can be a generator,
+                                    violations are written as they are yielded
+
+        The backend is closed even if violations raises an exception, except
+        SendAbandoned.
         """
-        raise NotImplementedError()
+        self.open()
+        try:
+            for violation in violations:
+                self.write_violation(violation)
+        except SendAbandoned:
+            raise
+        except BaseException:
+            self.close()
+            raise
+        self.close()
 
 
 # vim: ts=4
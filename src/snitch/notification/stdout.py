@@ -1,44 +1,118 @@
 # -*- coding: utf-8 -*-
 """Module to handle notification to stdout."""
 
+import csv
+import io
+import json
 import logging
+import sys
 
-from rich.console import Console
-from rich.table import Table
-
+from ..violation.violation import Violation, ViolationStore
 from .notificationbase import NotificationBase
 
 LOG = logging.getLogger(__name__)
 
+FORMATS = ("table", "dict", "jsonl", "csv")
+
+# write jsonl/csv output to stdout in chunks of this size
+BUFFER_SIZE = 64 * 1024
+
 
 class Stdout(NotificationBase):
     """
-    Class to send violations to influxdb.
+    Class to send violations to stdout.
+
+    Formats:
+        table - rich table rendered after the last violation
+        dict  - python dict for each violation
+        jsonl - JSON object for each violation, one per line
+        csv   - CSV with header, one line for each violation
+
+    jsonl and csv are written as the violations arrive, in chunks of
+    BUFFER_SIZE.
 
     Args:  **conf: kwargs with options for this class
+               stdout_fmt      (str): output format (default: table)
+               stdout_max_rows (int): max rows in the table. Other violations
+                                      are only counted (default: no limit)
+               stdout_stream  (file): where to write (default: sys.stdout)
     """
 
     def __init__(self, **conf):
-        self.format = conf.get("stdout_fmt", "table")
+        self.format = conf.get("stdout_fmt") or "table"
+        if self.format not in FORMATS:
+            raise ValueError(f"Invalid stdout format: {self.format}")
+        self.max_rows = conf.get("stdout_max_rows")
+        self.stream = conf.get("stdout_stream") or sys.stdout
+        self.violations = ViolationStore()
+        self.total = 0
+        self.buffer = io.StringIO()
+        self.csv_writer = csv.writer(self.buffer, lineterminator="\n")
+
+    def open(self):
+        self.violations.clear()
+        self.total = 0
+        if self.format == "csv":
+            self.csv_writer.writerow(Violation._fields)
 
-    def send_violations(self, violations):
+    def write_violation(self, violation):
         """
-        Write violations to stdout.
+        Write violation to stdout.
+
+        The table format needs all violations to render the table, so they
+        are kept until close() is called.
 
         Args:
-            violations  (list): List with Violation object
+            violation  (Violation): Violation object
         """
+        self.total += 1
         if self.format == "table":
-            self.table(violations)
-        elif self.format == "dict":
-            for v in violations:
-                print(v.to_dict)
+            if self.max_rows is None or len(self.violations) < self.max_rows:
+                self.violations.append(violation)
+        elif self.format == "jsonl":
+            self.buffer.write(json.dumps(violation.to_dict, separators=(",", ":")))
+            self.buffer.write("\n")
+        elif self.format == "csv":
+            self.csv_writer.writerow(violation)
         else:
-            for v in violations:
-                print(v)
+            self.flush()
+            print(violation.to_dict, file=self.stream)
+            return
+        if self.buffer.tell() >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write buffered output to the stream."""
+        if self.buffer.tell():
+            self.stream.write(self.buffer.getvalue())
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        self.stream.flush()
+
+    def close(self):
+        if self.format == "table":
+            self.table(self.violations)
+            if self.total > len(self.violations):
+                print(
+                    f"Showing {len(self.violations)} of {self.total} violations",
+                    file=self.stream,
+                )
+            self.violations.clear()
+        self.flush()
 
     def table(self, violations):
+        # pylint: disable=import-outside-toplevel
+        # only the table format needs rich
+        from rich.console import Console
+        from rich.table import Table
+
+        # scans of several clouds/regions show where each violation is
+        regions = len({(v.cloud, v.region) for v in violations}) > 1
+
         table = Table(title="OpenStack Violations")
+        if regions:
+            table.add_column("Cloud", style="blue")
+            table.add_column("Region", style="blue")
         table.add_column("Resource ID", style="cyan", no_wrap=True)
         table.add_column("Resource Name", style="magenta")
         table.add_column("Resource Type", justify="center", style="green")
@@ -47,6 +121,7 @@ class Stdout(NotificationBase):
 
         for v in violations:
             table.add_row(
+                *((v.cloud, v.region) if regions else ()),
                 v.resource_id,
                 v.resource_name,
                 v.resource_type,
@@ -54,7 +129,7 @@ class Stdout(NotificationBase):
                 v.message,
             )
 
-        console = Console()
+        console = Console(file=self.stream)
         console.print(table, justify="center")
 
 
@@ -2,16 +2,37 @@
 """os-snitch - OpenStack compliance rules checker."""
 
 import argparse
+import functools
 import logging
 import os
 import pprint
-
-import openstack
-
-from .notification.notification import create_notification
-from .resources.security_group import SecurityGroup
-from .resources.server import Server
-from .utils.utils import color_dic, read_yaml_file, setup_logging
+import signal
+import sys
+import threading
+import time
+
+import yaml
+
+from .inventory.cache import ListingCache
+from .notification.dispatcher import dispatch_violations
+from .notification.notification import (
+    BACKENDS,
+    available_notifications,
+    create_notification,
+    unknown_notifications,
+)
+from .policy.policy import PolicyError, load_policies
+from .scanner.scanner import (
+    connection_region,
+    enable_profiling,
+    iter_project_violations,
+    scan_projects,
+    scan_regions,
+)
+from .scanner.state import SgStateStore
+from .utils.profiler import PROFILER
+from .utils.utils import setup_logging
+from .utils.watch import FileWatcher, run_every
 
 LOG = setup_logging()
 
@@ -28,6 +49,18 @@ def cli_argparse():
         %(prog)s --resource server sg
         %(prog)s --resource server sg --sendto influxdb
         %(prog)s --resource server --sendto stdout influxdb
+        %(prog)s --resource server sg --stdout-fmt jsonl | jq .message
+        %(prog)s --resource server sg --projects listed --workers 16
+        %(prog)s --resource sg --cache-dir ~/.cache/os-snitch --max-age 600
+        %(prog)s --resource sg server --projects listed --watch 300
+        %(prog)s --resource sg server --projects listed --profile
+        %(prog)s --resource sg --projects all --engine numpy
+        %(prog)s --resource sg --projects all --engine process --rule-workers 8
+        %(prog)s --resource sg server --projects listed --clouds prod:RegionOne \
+            prod:RegionTwo staging
+
+    The openstacksdk options (--os-cloud, --os-region-name, --os-auth-url, ...)
+    are accepted too.
     """
 
     parser = argparse.ArgumentParser(
@@ -53,171 +86,705 @@ def cli_argparse():
         "--sendto",
         nargs="*",
         default=["stdout"],
-        choices=["influxdb", "stdout"],
-        help="Send violations found to",
+        metavar="SYSTEM",
+        help=f"Send violations found to: {', '.join(BACKENDS)} or a notification "
+        "plugin (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sendto-timeout",
+        dest="sendto_timeout",
+        type=float,
+        default=None,
+        help="Max seconds a notification system can take to accept a violation, "
+        "or to finish after the scan. Slower ones are abandoned "
+        "(default: no timeout)",
     )
     parser.add_argument(
         "--stdout-fmt",
         nargs="?",
         default="table",
-        choices=("table", "dict"),
-        help="Format to show violation on stdout",
+        choices=("table", "dict", "jsonl", "csv"),
+        help="Format to show violation on stdout. jsonl and csv are written as "
+        "violations are found (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stdout-max-rows",
+        dest="stdout_max_rows",
+        type=int,
+        default=None,
+        help="Max violations shown in the stdout table, the others are only "
+        "counted (default: no limit)",
+    )
+    parser.add_argument(
+        "--projects",
+        default="current",
+        choices=("current", "listed", "all"),
+        help="Projects to scan: current - project of the credential, "
+        "listed - all projects in the compliance file, "
+        "all - all projects visible to the credential that have compliance "
+        "rules (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--clouds",
+        nargs="+",
+        default=None,
+        metavar="CLOUD[:REGION]",
+        help="Clouds of clouds.yaml scanned in parallel, each one with its own "
+        "connection. CLOUD:REGION scans a region of the cloud, CLOUD its default "
+        "region (default: the cloud of the --os-* options)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of projects scanned in parallel, in each cloud/region "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Directory to cache the OpenStack API listings. Cached listings "
+        "newer than --max-age are used instead of querying the API",
+    )
+    parser.add_argument(
+        "--max-age",
+        dest="max_age",
+        type=float,
+        default=300,
+        help="Max age in seconds of the cached listings (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--state-file",
+        dest="state_file",
+        default=None,
+        help="SQLite file with the security group violations of the previous "
+        "scans. Security groups not changed since are not checked again",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        type=float,
+        default=None,
+        metavar="INTERVAL",
+        help="Keep running and scan every INTERVAL seconds. The compliance file "
+        "is reloaded when it changes",
+    )
+    parser.add_argument(
+        "--engine",
+        default="python",
+        choices=("python", "numpy", "process"),
+        help="How security group rules are checked: python - rule by rule, "
+        "numpy - many security groups at once with numpy arrays, "
+        "process - rule by rule in --rule-workers processes. numpy and process "
+        "are faster for large scans (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rule-workers",
+        dest="rule_workers",
+        type=int,
+        default=None,
+        help="Number of processes checking rules with --engine process "
+        "(default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        help="Print to stderr the time spent in the API requests, listings and "
+        "checks, with their count",
     )
 
     return parser
 
 
 ##############################################################################
-# Return a list with all security groups ids used
+# Load compliance rules for the projects to scan
 ##############################################################################
-def return_all_used_sgs(os_conn):
-    all_used_sgs_ids = set()
-    for port in os_conn.network.ports(project_id=os_conn.current_project.id):
-        if port.security_group_ids:
-            all_used_sgs_ids.update(port.security_group_ids)
+def read_compliance_policies(compliance_file, project_names, resources, errors=None):
+    """
+    Load and validate compliance rules, raising PolicyError if not valid,
+    and OSError if the file cannot be read.
 
-    return list(all_used_sgs_ids)
+    Only the rules of project_names are compiled, so an invalid section of
+    another project does not stop the scan.
 
+    Params:
+        compliance_file (str): yaml file with the compliance rules
+        project_names  (list): projects to return. None returns all projects
+        resources      (list): resources that must have compliance rules
+        errors         (dict): if set, the projects with invalid rules are
+                               left out and their PolicyError stored in it
+                               (project name as key), instead of raised
 
-#############################################################################
-# Check all security group rules
-#############################################################################
-def check_sg_compliance(os_conn, compliance_rules):
-    LOG.debug("%s", pprint.pformat(compliance_rules))
+    Return a dict with project name as key and CompliancePolicy as value.
+    """
+    policies = load_policies(compliance_file, project_names, errors)
+    for project_name, policy in list(policies.items()):
+        for resource in resources:
+            if getattr(policy, resource) is None:
+                error = PolicyError(
+                    f"{project_name}.{resource}: compliance rules not defined"
+                )
+                if errors is None:
+                    raise error
+                errors[project_name] = error
+                del policies[project_name]
+                break
+    return policies
+
+
+def load_compliance_policies(compliance_file, project_names, resources, errors=None):
+    """Load compliance rules before querying the cloud, exit if not valid."""
+    try:
+        return read_compliance_policies(
+            compliance_file, project_names, resources, errors
+        )
+    except (PolicyError, OSError) as error:
+        print(f"Error: {compliance_file}: {error}")
+        sys.exit(1)
 
-    # If alert_if_not_used option is enabled, get a list with all used sgs
-    all_used_sgs_ids = (
-        return_all_used_sgs(os_conn) if compliance_rules["alert_if_not_used"] else []
-    )
 
-    sgs = []
-    for os_sg in os_conn.network.security_groups(project_id=os_conn.current_project.id):
-        LOG.debug(
-            "%s #########################################################%s",
-            color_dic["blue"],
-            color_dic["nocolor"],
-        )
-        if os_sg.id in compliance_rules["ignore_sg_ids"]:
-            LOG.debug("Ignoring sg: %s - %s", os_sg.id, os_sg.name)
+##############################################################################
+# Return (cloud, region) for all clouds/regions to scan
+##############################################################################
+def parse_cloud_targets(clouds):
+    """
+    Return list with (cloud, region) tuples, without duplicates.
+
+    Params:
+        clouds (list): CLOUD or CLOUD:REGION strings. region is None for
+                       CLOUD, the default region of the cloud
+
+    Raise ValueError if a cloud name is empty.
+    """
+    targets = []
+    for value in clouds:
+        cloud, _, region = value.partition(":")
+        if not cloud:
+            raise ValueError(f"cloud name not defined in {value!r}")
+        targets.append((cloud, region or None))
+    return list(dict.fromkeys(targets))
+
+
+def region_label(cloud, region):
+    """Return cloud/region name for the messages."""
+    return "/".join(i for i in (cloud, region) if i) or "default"
+
+
+##############################################################################
+# Return (project, policy) for all projects to scan
+##############################################################################
+def return_scan_targets(os_conn, policies, projects, policy_errors=None):
+    if projects == "listed":
+        return list(policies.items())
+
+    targets = []
+    for project in os_conn.identity.projects():
+        if policy_errors and project.name in policy_errors:
+            print(
+                f"Project {project.name}: invalid compliance rules: "
+                f"{policy_errors[project.name]}",
+                file=sys.stderr,
+            )
             continue
-        LOG.debug(
-            "%s #### Checking rules for sg: %s - %s%s",
-            color_dic["blue"],
-            os_sg.id,
-            os_sg.name,
-            color_dic["nocolor"],
-        )
-        LOG.debug(
-            "%s #########################################################%s",
-            color_dic["blue"],
-            color_dic["nocolor"],
-        )
+        if project.name not in policies:
+            LOG.debug("Ignoring project without compliance rules: %s", project.name)
+            continue
+        project_info = {
+            "id": project.id,
+            "name": project.name,
+            "domain_id": project.domain_id,
+        }
+        targets.append((project_info, policies[project.name]))
+
+    return targets
+
+
+##############################################################################
+# Return cache for API listings if enabled
+##############################################################################
+def return_listing_cache(cmd_options_parsed):
+    if not cmd_options_parsed.cache_dir:
+        return None
+    return ListingCache(
+        os.path.expanduser(cmd_options_parsed.cache_dir), cmd_options_parsed.max_age
+    )
+
+
+##############################################################################
+# Return security group state store if enabled
+##############################################################################
+def return_state_store(cmd_options_parsed):
+    if not cmd_options_parsed.state_file:
+        return None
+    return SgStateStore(os.path.expanduser(cmd_options_parsed.state_file))
+
+
+def close_state_store(state):
+    if state is None:
+        return
+    state.close()
+    print(
+        f"{state.checked} security groups checked, {state.replayed} unchanged",
+        file=sys.stderr,
+    )
 
-        securitygroup = SecurityGroup(os_conn.current_project.name, os_sg)
-        if compliance_rules["alert_if_not_used"]:
-            securitygroup.check_sg_not_used(all_used_sgs_ids)
-        securitygroup.check_sg_tags(compliance_rules["mandatory_tags"])
-        securitygroup.check_egress_rules(compliance_rules["egress"])
-        securitygroup.check_ingress_rules(compliance_rules["ingress"])
-        sgs.append(securitygroup)
-
-        LOG.debug(
-            "%s#### Violation for %s %s%s",
-            color_dic["red"],
-            os_sg.name,
-            securitygroup.return_violations(),
-            color_dic["nocolor"],
+
+##############################################################################
+# Return security group rules engine if not the default one
+##############################################################################
+def return_rules_engine(cmd_options_parsed, policies):
+    """
+    Return NumpyRulesEngine, ProcessRulesEngine or None (python).
+
+    The security group policies are sent to the ProcessRulesEngine workers.
+
+    Raise RuntimeError for the numpy engine without numpy.
+    """
+    # pylint: disable=import-outside-toplevel
+    # the engines are imported only when used, numpy is optional and slow to import
+    if cmd_options_parsed.engine == "numpy":
+        from .resources.rules_engine import NumpyRulesEngine
+
+        return NumpyRulesEngine()
+    if cmd_options_parsed.engine == "process":
+        from .resources.process_engine import ProcessRulesEngine
+
+        return ProcessRulesEngine(
+            workers=cmd_options_parsed.rule_workers,
+            sg_policies=[i.sg for i in policies.values()],
         )
+    return None
+
 
-    return sgs
+def close_rules_engine(engine):
+    if engine is not None:
+        engine.close()
 
 
-#############################################################################
-# Check all servers rules
-#############################################################################
-def check_servers_compliance(os_conn, compliance_rules):
+##############################################################################
+# Scan several projects in parallel
+##############################################################################
+def print_project_result(result, regions=False):
+    name = result.project_name
+    if regions:
+        name = f"{name} ({region_label(result.cloud, result.region)})"
+    if result.error:
+        print(
+            f"Project {name}: error after {result.elapsed:.2f}s: {result.error}",
+            file=sys.stderr,
+        )
+    else:
+        print(
+            f"Project {name}: {result.violations_count} "
+            f"violations in {result.elapsed:.2f}s",
+            file=sys.stderr,
+        )
 
-    servers = []
-    for os_server in os_conn.compute.servers(project_id=os_conn.current_project.id):
-        LOG.debug(
-            "%s #########################################################%s",
-            color_dic["blue"],
-            color_dic["nocolor"],
+
+def print_region_result(result):
+    name = region_label(result.cloud, result.region)
+    if result.error:
+        print(
+            f"Region {name}: error after {result.elapsed:.2f}s: {result.error}",
+            file=sys.stderr,
         )
-        if os_server.id in compliance_rules["ignore_server_ids"]:
-            LOG.debug("Ignoring sg: %s - %s", os_server.id, os_server.name)
-            continue
-        LOG.debug(
-            "%s #### Checking rules for server: %s - %s%s",
-            color_dic["blue"],
-            os_server.id,
-            os_server.name,
-            color_dic["nocolor"],
+    else:
+        print(
+            f"Region {name}: {result.violations_count} "
+            f"violations in {result.elapsed:.2f}s",
+            file=sys.stderr,
         )
-        server = Server(os_conn.current_project.name, os_server)
-        server.check_server_tags(compliance_rules["mandatory_tags"])
-        server.check_server_metadata(compliance_rules["mandatory_metadata"])
-        servers.append(server)
 
-    return servers
+
+def check_projects_compliance(
+    os_conn,
+    cmd_options_parsed,
+    policies,
+    *,
+    cache=None,
+    state=None,
+    connections=None,
+    engine=None,
+    policy_errors=None,
+):
+    """
+    Yield violations of all projects as soon as they are found.
+
+    Projects in policy_errors (project name as key and PolicyError as value)
+    are reported and not scanned.
+    """
+    targets = return_scan_targets(
+        os_conn, policies, cmd_options_parsed.projects, policy_errors
+    )
+    regions = bool(cmd_options_parsed.clouds)
+
+    start = time.monotonic()
+    yield from scan_projects(
+        os_conn,
+        targets,
+        cmd_options_parsed.resource,
+        workers=cmd_options_parsed.workers,
+        on_project_done=functools.partial(print_project_result, regions=regions),
+        cache=cache,
+        state=state,
+        connections=connections,
+        engine=engine,
+    )
+    where = f" of {region_label(*connection_region(os_conn))}" if regions else ""
+    print(
+        f"Scanned {len(targets)} projects{where} in "
+        f"{time.monotonic() - start:.2f}s",
+        file=sys.stderr,
+    )
 
 
 ##############################################################################
 # Send violations
 ##############################################################################
 def send_violations(cmd_options_parsed, violations):
+    """Send violations to the notification systems. Return False on failure."""
     if not cmd_options_parsed.sendto:
         LOG.debug("Notification system not specified.")
-        return
+        # violations are found while the scan is consumed
+        for _ in violations:
+            pass
+        return True
+
+    conf = {
+        "stdout_fmt": cmd_options_parsed.stdout_fmt,
+        "stdout_max_rows": cmd_options_parsed.stdout_max_rows,
+    }
+
+    LOG.debug("Sending violations to %s", ", ".join(cmd_options_parsed.sendto))
+    notifications = {
+        i: create_notification(i, **conf)
+        for i in dict.fromkeys(cmd_options_parsed.sendto)
+    }
+    if PROFILER.enabled:
+        for notification in notifications.values():
+            PROFILER.instrument(type(notification), ["write_violation", "close"])
+    reports = dispatch_violations(
+        notifications, violations, timeout=cmd_options_parsed.sendto_timeout
+    )
 
-    conf = {"stdout_fmt": cmd_options_parsed.stdout_fmt}
+    for report in reports:
+        if report.failed or len(reports) > 1:
+            status = f"failed ({report.error})" if report.failed else "ok"
+            print(
+                f"Notification {report.backend}: {status}, "
+                f"{report.delivered} violations in {report.elapsed:.2f}s",
+                file=sys.stderr,
+            )
+    return not any(report.failed for report in reports)
 
-    for i in cmd_options_parsed.sendto:
-        LOG.debug("Sending violations to %s", i)
-        notification = create_notification(i, **conf)
-        notification.send_violations(violations)
+
+##############################################################################
+# Scan and send violations
+##############################################################################
+def scan_region(os_conn, cmd_options_parsed, policies, **kwargs):
+    """
+    Return iterable with the violations of the projects of os_conn region.
+
+    Raise PolicyError if the current project has no valid compliance rules.
+    """
+    if cmd_options_parsed.projects == "current":
+        project_name = os_conn.current_project.name
+        policy_errors = kwargs.get("policy_errors") or {}
+        if project_name in policy_errors:
+            raise policy_errors[project_name]
+        if project_name not in policies:
+            raise PolicyError(f"Project {project_name} not found in compliance rules")
+        return iter_project_violations(
+            os_conn,
+            policies[project_name],
+            cmd_options_parsed.resource,
+            kwargs.get("cache"),
+            kwargs.get("state"),
+            kwargs.get("engine"),
+        )
+    return check_projects_compliance(os_conn, cmd_options_parsed, policies, **kwargs)
+
+
+def run_scan(os_conns, cmd_options_parsed, policies, **kwargs):
+    """
+    Scan the projects of all clouds/regions and send the violations found.
+
+    Params:
+        os_conns (list): a connection for each cloud/region. With --clouds,
+                         they are scanned in parallel, and their violations
+                         sent to the same notification systems. A region
+                         that fails (e.g. authentication) does not stop the
+                         others
+
+    kwargs (cache, state, connections, engine and policy_errors) are passed
+    to the scanner.
+    connections keeps the project scoped connections of each cloud/region.
+    Return False if a notification system failed.
+    """
+    connections = kwargs.pop("connections", None)
+
+    def region_kwargs(os_conn):
+        if connections is None:
+            return kwargs
+        region_connections = connections.setdefault(connection_region(os_conn), {})
+        return {**kwargs, "connections": region_connections}
+
+    if not cmd_options_parsed.clouds:
+        violations = scan_region(
+            os_conns[0], cmd_options_parsed, policies, **region_kwargs(os_conns[0])
+        )
+    else:
+        scans = [
+            (
+                os_conn,
+                functools.partial(
+                    scan_region,
+                    os_conn,
+                    cmd_options_parsed,
+                    policies,
+                    **region_kwargs(os_conn),
+                ),
+            )
+            for os_conn in os_conns
+        ]
+        violations = scan_regions(scans, on_region_done=print_region_result)
+
+    start = time.monotonic()
+    with PROFILER.timer("scan.total"):
+        sent = send_violations(cmd_options_parsed, violations)
+    if cmd_options_parsed.clouds:
+        print(
+            f"Scanned {len(os_conns)} clouds/regions in "
+            f"{time.monotonic() - start:.2f}s",
+            file=sys.stderr,
+        )
+    return sent
+
+
+##############################################################################
+# Print profile of the last scans
+##############################################################################
+def print_profile(os_conns, connections=None):
+    """Print profile to stderr and reset it for the next scan."""
+    project_conns = [
+        conn
+        for region_connections in (connections or {}).values()
+        for conn in region_connections.values()
+    ]
+    for conn in [*os_conns, *project_conns]:
+        PROFILER.record_http_timings(conn)
+    print(PROFILER.report(), file=sys.stderr)
+    PROFILER.reset()
+
+
+##############################################################################
+# Scan periodically
+##############################################################################
+def watch_compliance(os_conns, cmd_options_parsed, policies, project_names, **kwargs):
+    """
+    Run a scan every --watch seconds until SIGTERM or Ctrl-C.
+
+    The connection, the listing cache, the state store and the project scoped
+    connections are kept between scans. The compliance file is loaded again
+    only when it changes, and kept as it was if the new one is not valid.
+    The projects with invalid rules are updated too if policy_errors is set.
+    """
+    compliance_file = cmd_options_parsed.compliance_file
+    watcher = FileWatcher(compliance_file)
+    state = kwargs.get("state")
+    engine = kwargs.get("engine")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    def cycle(number):
+        nonlocal policies
+        start = time.monotonic()
+        notes = []
+        if watcher.changed():
+            try:
+                errors = {} if kwargs.get("policy_errors") is not None else None
+                policies = read_compliance_policies(
+                    compliance_file, project_names, cmd_options_parsed.resource, errors
+                )
+                if errors is not None:
+                    kwargs["policy_errors"] = errors
+                if engine is not None:
+                    engine.set_policies([i.sg for i in policies.values()])
+                notes.append("compliance rules reloaded")
+            except OSError as error:
+                # e.g. being replaced, read again on the next scan
+                watcher.forget()
+                print(
+                    f"Error: {compliance_file}: {error}, "
+                    "using the previous compliance rules",
+                    file=sys.stderr,
+                )
+            except (PolicyError, yaml.YAMLError) as error:
+                print(
+                    f"Error: {compliance_file}: {error}, "
+                    "using the previous compliance rules",
+                    file=sys.stderr,
+                )
+        if state is not None:
+            state_before = (state.checked, state.replayed)
+
+        try:
+            sent = run_scan(os_conns, cmd_options_parsed, policies, **kwargs)
+            status = "ok" if sent else "failed"
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.debug("Scan %s failed", number, exc_info=True)
+            status = f"failed ({error})"
+        if PROFILER.enabled:
+            print_profile(os_conns, kwargs.get("connections"))
+
+        if state is not None:
+            notes.append(
+                f"{state.checked - state_before[0]} security groups checked, "
+                f"{state.replayed - state_before[1]} unchanged"
+            )
+        print(
+            f"Scan {number}: {status} in {time.monotonic() - start:.2f}s"
+            + "".join(f", {i}" for i in notes),
+            file=sys.stderr,
+        )
+
+    try:
+        run_every(cmd_options_parsed.watch, cycle, stop=stop)
+    except KeyboardInterrupt:
+        pass
 
 
 ##############################################################################
 # Main
 ##############################################################################
-def main():
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    cmd_options = cli_argparse()
+    # --help and errors in our options are handled before the SDK, which is
+    # slow to import, is loaded. Its --os-* options are left for it
+    cmd_options.parse_known_args(argv)
+
+    # pylint: disable=import-outside-toplevel
+    import openstack
 
     # disable openstacksdk logs
     openstack.enable_logging(debug=False)
 
-    cmd_options = cli_argparse()
-    # openstacksdk parser
-    os_conn = openstack.connect(options=cmd_options)
+    # openstacksdk --os-* options, parsed with ours
+    os_config = openstack.config.OpenStackConfig()
+    os_config.register_argparse_arguments(cmd_options, argv)
 
     # parser arguments
-    cmd_options_parsed = cmd_options.parse_args()
+    cmd_options_parsed = cmd_options.parse_args(argv)
 
     if not cmd_options_parsed.debug:
         logging.getLogger("snitch").setLevel(logging.CRITICAL)
 
-    # load compliance rules
-    compliance_rules = read_yaml_file(cmd_options_parsed.compliance_file)[
-        os_conn.current_project.name
-    ]
-    LOG.debug("compliance_rules: %s", pprint.pformat(compliance_rules))
+    if cmd_options_parsed.workers < 1:
+        cmd_options.error("--workers must be greater than zero")
+    if cmd_options_parsed.watch is not None and cmd_options_parsed.watch <= 0:
+        cmd_options.error("--watch must be greater than zero")
+    if cmd_options_parsed.rule_workers is not None and (
+        cmd_options_parsed.rule_workers < 1
+    ):
+        cmd_options.error("--rule-workers must be greater than zero")
+    if cmd_options_parsed.stdout_max_rows is not None and (
+        cmd_options_parsed.stdout_max_rows < 0
+    ):
+        cmd_options.error("--stdout-max-rows must not be negative")
+    unknown = unknown_notifications(cmd_options_parsed.sendto)
+    if unknown:
+        cmd_options.error(
+            f"argument --sendto: invalid choice: {', '.join(unknown)} "
+            f"(choose from {', '.join(available_notifications())})"
+        )
 
-    sgs = (
-        check_sg_compliance(os_conn, compliance_rules["sg"])
-        if "sg" in cmd_options_parsed.resource
-        else []
+    if cmd_options_parsed.clouds:
+        # isolated connections, the --os-* options are not used
+        try:
+            os_conns = [
+                openstack.connect(
+                    cloud=cloud, region_name=region, timing=cmd_options_parsed.profile
+                )
+                for cloud, region in parse_cloud_targets(cmd_options_parsed.clouds)
+            ]
+        except (ValueError, openstack.exceptions.ConfigException) as error:
+            cmd_options.error(f"--clouds: {error}")
+    else:
+        # With --profile, the session times each request
+        os_conns = [
+            openstack.connection.Connection(
+                config=os_config.get_one(
+                    argparse=cmd_options_parsed, timing=cmd_options_parsed.profile
+                )
+            )
+        ]
+
+    project_names = None
+    if cmd_options_parsed.projects == "current" and not cmd_options_parsed.clouds:
+        project_names = [os_conns[0].current_project.name]
+    # with --clouds, the current project of each region is found when it is
+    # scanned, so a region that cannot authenticate does not stop the others
+    # and, as with --projects all, a project with invalid rules is reported
+    # only if it is scanned
+    policy_errors = None
+    if project_names is None and cmd_options_parsed.projects != "listed":
+        policy_errors = {}
+    policies = load_compliance_policies(
+        cmd_options_parsed.compliance_file,
+        project_names,
+        cmd_options_parsed.resource,
+        policy_errors,
     )
-    servers = (
-        check_servers_compliance(os_conn, compliance_rules["server"])
-        if "server" in cmd_options_parsed.resource
-        else []
-    )
-
-    # compute all violations into a list
-    violations_by_resource = [v.return_violations() for v in sgs + servers]
-    violations = [item for elem in violations_by_resource for item in elem]
-
-    send_violations(cmd_options_parsed, violations)
+    LOG.debug("compliance policy: %s", pprint.pformat(policies))
+
+    if cmd_options_parsed.profile:
+        enable_profiling()
+
+    try:
+        engine = return_rules_engine(cmd_options_parsed, policies)
+    except RuntimeError as error:
+        cmd_options.error(str(error))
+
+    cache = return_listing_cache(cmd_options_parsed)
+    state = return_state_store(cmd_options_parsed)
+    try:
+        if cmd_options_parsed.watch is None:
+            connections = {}
+            sent = run_scan(
+                os_conns,
+                cmd_options_parsed,
+                policies,
+                cache=cache,
+                state=state,
+                connections=connections,
+                engine=engine,
+                policy_errors=policy_errors,
+            )
+            if PROFILER.enabled:
+                print_profile(os_conns, connections)
+        else:
+            sent = True
+            watch_compliance(
+                os_conns,
+                cmd_options_parsed,
+                policies,
+                project_names,
+                cache=cache,
+                state=state,
+                connections={},
+                engine=engine,
+                policy_errors=policy_errors,
+            )
+    finally:
+        close_rules_engine(engine)
+        close_state_store(state)
+    if not sent:
+        sys.exit(1)
 
 
 ##############################################################################
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""Module to compile and validate compliance rules."""
+
+from dataclasses import dataclass
+from typing import FrozenSet, Optional, Tuple
+
+from ..utils.cidrtrie import CidrMatcher
+from ..utils.intervals import PortIntervals
+from ..utils.utils import load_yaml_file
+
+_MISSING = object()
+
+
+class PolicyError(ValueError):
+    """Invalid compliance rules."""
+
+
+@dataclass(frozen=True)
+class EgressPolicy:
+    """Security group egress compliance rules."""
+
+    forbid_cidrs: CidrMatcher
+    forbid_cidrs_match_subnets: bool
+
+    @property
+    def checks_enabled(self):
+        """Return True if any egress rule check is enabled."""
+        return bool(self.forbid_cidrs)
+
+
+@dataclass(frozen=True)
+class IngressPolicy:
+    """
+    Security group ingress compliance rules.
+
+    max_netmask_allowed and max_number_port_per_rule set to None
+    disable the check. forbid_ports holds (protocol, PortIntervals)
+    pairs only for protocols with forbidden ports.
+    """
+
+    forbid_cidrs: CidrMatcher
+    forbid_cidrs_match_subnets: bool
+    max_netmask_allowed: Optional[int]
+    forbid_ports: Tuple[Tuple[str, PortIntervals], ...]
+    max_number_port_per_rule: Optional[int]
+    forbid_all_ports: bool
+    forbid_all_protocols: bool
+
+    @property
+    def forbid_ports_protocols(self):
+        """Return protocols with forbidden ports."""
+        return frozenset(protocol for protocol, _ in self.forbid_ports)
+
+    @property
+    def checks_enabled(self):
+        """Return True if any ingress rule check is enabled."""
+        return bool(
+            self.forbid_cidrs
+            or self.forbid_ports
+            or self.max_netmask_allowed is not None
+            or self.max_number_port_per_rule is not None
+            or self.forbid_all_ports
+            or self.forbid_all_protocols
+        )
+
+
+@dataclass(frozen=True)
+class SgPolicy:
+    """Security group compliance rules."""
+
+    mandatory_tags: Tuple[str, ...]
+    alert_if_not_used: bool
+    ingress: IngressPolicy
+    egress: EgressPolicy
+    ignore_sg_ids: FrozenSet[str]
+    forbid_redundant_rules: bool = False
+    forbid_remote_group_exposure: bool = False
+
+    @property
+    def only_tag_checks(self):
+        """Return True if mandatory_tags is the only check enabled."""
+        return bool(
+            self.mandatory_tags
+            and not self.alert_if_not_used
+            and not self.forbid_redundant_rules
+            and not self.forbid_remote_group_exposure
+            and not self.ingress.checks_enabled
+            and not self.egress.checks_enabled
+        )
+
+
+@dataclass(frozen=True)
+class ServerPolicy:
+    """Server compliance rules."""
+
+    mandatory_tags: Tuple[str, ...]
+    mandatory_metadata: Tuple[str, ...]
+    ignore_server_ids: FrozenSet[str]
+
+    @property
+    def only_tag_checks(self):
+        """Return True if mandatory_tags is the only check enabled."""
+        return bool(self.mandatory_tags and not self.mandatory_metadata)
+
+
+@dataclass(frozen=True)
+class CompliancePolicy:
+    """Compliance rules for a project. sg/server is None if not defined."""
+
+    project_name: str
+    sg: Optional[SgPolicy]
+    server: Optional[ServerPolicy]
+
+
+##############################################################################
+# Helpers to validate yaml values
+##############################################################################
+def _check_keys(section, path, allowed):
+    if not isinstance(section, dict):
+        raise PolicyError(f"{path}: expected a mapping, got {type(section).__name__}")
+    unknown = sorted(set(section) - set(allowed))
+    if unknown:
+        raise PolicyError(f"{path}: unknown option(s) {', '.join(map(str, unknown))}")
+
+
+def _get(section, key, path, default=_MISSING):
+    value = section.get(key, default)
+    if value is _MISSING:
+        raise PolicyError(f"{path}.{key}: mandatory option not defined")
+    return value
+
+
+def _bool(section, key, path, default=_MISSING):
+    value = _get(section, key, path, default)
+    if not isinstance(value, bool):
+        raise PolicyError(f"{path}.{key}: expected true/false, got {value!r}")
+    return value
+
+
+def _int_or_none(section, key, path, *, minimum, maximum):
+    value = _get(section, key, path)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise PolicyError(f"{path}.{key}: expected an integer, got {value!r}")
+    if not minimum <= value <= maximum:
+        raise PolicyError(
+            f"{path}.{key}: expected a value between {minimum} and {maximum}, "
+            f"got {value}"
+        )
+    return value
+
+
+def _list(section, key, path, default=_MISSING):
+    value = _get(section, key, path, default)
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise PolicyError(f"{path}.{key}: expected a list, got {value!r}")
+    return value
+
+
+def _str_tuple(section, key, path, default=_MISSING):
+    values = _list(section, key, path, default)
+    for value in values:
+        if not isinstance(value, str):
+            raise PolicyError(
+                f"{path}.{key}: expected a list of strings, got {value!r}"
+            )
+    # remove duplicated items keeping the order
+    return tuple(dict.fromkeys(values))
+
+
+def _cidrs(section, key, path):
+    cidrs = _str_tuple(section, key, path)
+    try:
+        return CidrMatcher(cidrs)
+    except ValueError as error:
+        raise PolicyError(f"{path}.{key}: {error}") from None
+
+
+def _ports(section, key, path):
+    ports = _list(section, key, path)
+    try:
+        return PortIntervals(ports)
+    except ValueError as error:
+        raise PolicyError(f"{path}.{key}: {error}") from None
+
+
+##############################################################################
+# Compile compliance rules
+##############################################################################
+def compile_egress_policy(egress, path):
+    """Return EgressPolicy from yaml egress section."""
+    _check_keys(egress, path, ("forbid_cidrs", "forbid_cidrs_match_subnets"))
+    return EgressPolicy(
+        forbid_cidrs=_cidrs(egress, "forbid_cidrs", path),
+        forbid_cidrs_match_subnets=_bool(egress, "forbid_cidrs_match_subnets", path),
+    )
+
+
+def compile_ingress_policy(ingress, path):
+    """Return IngressPolicy from yaml ingress section."""
+    _check_keys(
+        ingress,
+        path,
+        (
+            "forbid_cidrs",
+            "forbid_cidrs_match_subnets",
+            "max_netmask_allowed",
+            "forbid_tcp_port",
+            "forbid_udp_port",
+            "max_number_port_per_rule",
+            "forbid_all_ports",
+            "forbid_all_protocols",
+        ),
+    )
+    forbid_ports = (
+        ("tcp", _ports(ingress, "forbid_tcp_port", path)),
+        ("udp", _ports(ingress, "forbid_udp_port", path)),
+    )
+    return IngressPolicy(
+        forbid_cidrs=_cidrs(ingress, "forbid_cidrs", path),
+        forbid_cidrs_match_subnets=_bool(ingress, "forbid_cidrs_match_subnets", path),
+        max_netmask_allowed=_int_or_none(
+            ingress, "max_netmask_allowed", path, minimum=0, maximum=128
+        ),
+        forbid_ports=tuple(i for i in forbid_ports if i[1]),
+        max_number_port_per_rule=_int_or_none(
+            ingress, "max_number_port_per_rule", path, minimum=1, maximum=65536
+        ),
+        forbid_all_ports=_bool(ingress, "forbid_all_ports", path),
+        forbid_all_protocols=_bool(ingress, "forbid_all_protocols", path),
+    )
+
+
+def compile_sg_policy(sg_rules, path):
+    """Return SgPolicy from yaml sg section."""
+    _check_keys(
+        sg_rules,
+        path,
+        (
+            "mandatory_tags",
+            "alert_if_not_used",
+            "forbid_redundant_rules",
+            "forbid_remote_group_exposure",
+            "ingress",
+            "egress",
+            "ignore_sg_ids",
+        ),
+    )
+    return SgPolicy(
+        mandatory_tags=_str_tuple(sg_rules, "mandatory_tags", path),
+        alert_if_not_used=_bool(sg_rules, "alert_if_not_used", path),
+        ingress=compile_ingress_policy(
+            _get(sg_rules, "ingress", path), f"{path}.ingress"
+        ),
+        egress=compile_egress_policy(_get(sg_rules, "egress", path), f"{path}.egress"),
+        ignore_sg_ids=frozenset(_str_tuple(sg_rules, "ignore_sg_ids", path, [])),
+        forbid_redundant_rules=_bool(sg_rules, "forbid_redundant_rules", path, False),
+        forbid_remote_group_exposure=_bool(
+            sg_rules, "forbid_remote_group_exposure", path, False
+        ),
+    )
+
+
+def compile_server_policy(server_rules, path):
+    """Return ServerPolicy from yaml server section."""
+    _check_keys(
+        server_rules,
+        path,
+        ("mandatory_tags", "mandatory_metadata", "ignore_server_ids"),
+    )
+    return ServerPolicy(
+        mandatory_tags=_str_tuple(server_rules, "mandatory_tags", path),
+        mandatory_metadata=_str_tuple(server_rules, "mandatory_metadata", path),
+        ignore_server_ids=frozenset(
+            _str_tuple(server_rules, "ignore_server_ids", path, [])
+        ),
+    )
+
+
+def compile_policy(compliance_rules, project_name):
+    """
+    Compile and validate the compliance rules of a project.
+
+    Params:
+        compliance_rules (dict): compliance rules file content
+        project_name      (str): project name
+
+    Return a CompliancePolicy instance. It raises PolicyError if the rules
+    are not valid.
+    """
+    if not isinstance(compliance_rules, dict):
+        raise PolicyError("Compliance rules file must be a mapping of projects")
+    if project_name not in compliance_rules:
+        raise PolicyError(f"Project {project_name} not found in compliance rules")
+
+    project_rules = compliance_rules[project_name]
+    path = str(project_name)
+    _check_keys(project_rules, path, ("sg", "server"))
+
+    sg_rules = project_rules.get("sg")
+    server_rules = project_rules.get("server")
+    return CompliancePolicy(
+        project_name=project_name,
+        sg=compile_sg_policy(sg_rules, f"{path}.sg") if sg_rules is not None else None,
+        server=(
+            compile_server_policy(server_rules, f"{path}.server")
+            if server_rules is not None
+            else None
+        ),
+    )
+
+
+def compile_policies(compliance_rules, project_names=None, errors=None):
+    """
+    Compile and validate the compliance rules of several projects.
+
+    Params:
+        compliance_rules (dict): compliance rules file content
+        project_names    (list): projects to compile. None compiles all of them
+        errors           (dict): if set, the projects with invalid rules are
+                                 left out and their PolicyError stored in it
+                                 (project name as key), instead of raised
+
+    Return a dict with project name as key and CompliancePolicy as value.
+    """
+    if not isinstance(compliance_rules, dict):
+        raise PolicyError("Compliance rules file must be a mapping of projects")
+    if project_names is None:
+        project_names = list(compliance_rules)
+    missing = [i for i in project_names if i not in compliance_rules]
+    if missing:
+        raise PolicyError(f"Project {', '.join(missing)} not found in compliance rules")
+
+    policies = {}
+    for project_name in project_names:
+        try:
+            policies[project_name] = compile_policy(compliance_rules, project_name)
+        except PolicyError as error:
+            if errors is None:
+                raise
+            errors[project_name] = error
+    return policies
+
+
+def load_policy(filename, project_name):
+    """
+    Read compliance rules file and return project CompliancePolicy.
+
+    Raise OSError if the file cannot be read.
+    """
+    return compile_policy(load_yaml_file(filename), project_name)
+
+
+def load_policies(filename, project_names=None, errors=None):
+    """
+    Read compliance rules file and return CompliancePolicy of the projects.
+
+    See compile_policies for project_names and errors. Raise OSError if the
+    file cannot be read.
+    """
+    return compile_policies(load_yaml_file(filename), project_names, errors)
+
+
+# vim: ts=4
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Module to check security group rules in a pool of processes."""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .security_group import SecurityGroupRule
+
+LOG = logging.getLogger(__name__)
+
+# rule attributes sent to the worker processes, in this order
+RULE_FIELDS = (
+    "id",
+    "direction",
+    "protocol",
+    "port_range_min",
+    "port_range_max",
+    "remote_ip_prefix",
+    "remote_group_id",
+)
+
+
+def rule_tuple(rule):
+    """Return tuple with the RULE_FIELDS of rule (SecurityGroupRule)."""
+    return tuple(rule.rule[i] for i in RULE_FIELDS)
+
+
+def check_rule_tuples(sg_policy, rule_tuples):
+    """
+    Check rules and return a list with the issues of each one.
+
+    It runs in the worker processes, with the same checks as
+    SecurityGroup.check_egress_rules and check_ingress_rules.
+
+    Params:
+        sg_policy (SgPolicy): security group compliance rules
+        rule_tuples   (list): rules as tuples, see rule_tuple
+    """
+    all_issues = []
+    for values in rule_tuples:
+        rule = SecurityGroupRule(dict(zip(RULE_FIELDS, values)))
+        if rule.rule["direction"] == "egress":
+            rule.check_egress(sg_policy.egress)
+        elif rule.rule["direction"] == "ingress":
+            rule.check_ingress(sg_policy.ingress)
+        all_issues.append(rule.issues)
+    return all_issues
+
+
+# security group policies of a worker process, set by _init_worker
+_WORKER_SG_POLICIES = ()
+
+
+def _init_worker(sg_policies):
+    """Keep the policies in the worker process, they are sent only once."""
+    global _WORKER_SG_POLICIES  # pylint: disable=global-statement
+    _WORKER_SG_POLICIES = sg_policies
+
+
+def _check_worker_rule_tuples(policy_index, rule_tuples):
+    """Run check_rule_tuples with a policy sent by _init_worker."""
+    return check_rule_tuples(_WORKER_SG_POLICIES[policy_index], rule_tuples)
+
+
+class ProcessRulesEngine:
+    """
+    Check the ingress and egress rules of many security groups in a pool
+    of processes, to use more than one CPU.
+
+    The policies are sent once to each worker, when the pool is started,
+    and the rules are sent as tuples (see RULE_FIELDS) in chunks, with the
+    index of their policy. The issues are appended to each
+    SecurityGroupRule in the order of the rules, so the violations are the
+    same as the ones of SecurityGroup.check_egress_rules and
+    check_ingress_rules.
+
+    The pool is started again when a rule of a policy not sent yet is
+    checked, so pass the policies of the scan to the constructor or to
+    set_policies.
+
+    The workers are started with "spawn", as the scanner runs threads.
+
+    Params:
+        workers    (int): number of worker processes (default: CPU count)
+        batch_size (int): security groups checked together by the scanner
+        chunk_size (int): max rules sent to a worker at once
+        sg_policies (list): SgPolicy instances to send to the workers
+    """
+
+    def __init__(self, workers=None, batch_size=1000, chunk_size=2000, sg_policies=()):
+        """ProcessRulesEngine."""
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.sg_policies = []
+        # id(sg_policy): index in sg_policies, which keeps the policy alive
+        self.policy_index = {}
+        self.executor = None
+        # pools started for previous policies, stopped by close()
+        self.stopped_executors = []
+        self.lock = threading.Lock()
+        self.set_policies(sg_policies)
+
+    def _start_pool(self):
+        if self.executor is not None:
+            # chunks already sent are still checked
+            self.executor.shutdown(wait=False)
+            self.stopped_executors.append(self.executor)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(tuple(self.sg_policies),),
+        )
+
+    def _add_policies(self, sg_policies):
+        added = False
+        for sg_policy in sg_policies:
+            if sg_policy is not None and id(sg_policy) not in self.policy_index:
+                self.policy_index[id(sg_policy)] = len(self.sg_policies)
+                self.sg_policies.append(sg_policy)
+                added = True
+        if added:
+            self._start_pool()
+
+    def set_policies(self, sg_policies):
+        """
+        Send the policies of the next scans to the workers, starting the pool
+        again. Call it between scans, the previous policies are dropped.
+
+        Params:
+            sg_policies (list): SgPolicy instances, None is ignored
+        """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            self.sg_policies = []
+            self.policy_index = {}
+            self._add_policies(sg_policies)
+
+    def check_rules(self, rules, sg_policy):
+        """
+        Append the issues of each rule to its issues list.
+
+        Params:
+            rules      (list): SecurityGroupRule instances
+            sg_policy (SgPolicy): security group compliance rules
+        """
+        if not rules:
+            return
+        # small enough to spread a batch over all workers
+        chunk_size = min(self.chunk_size, -(-len(rules) // self.workers))
+        chunks = []
+        for start in range(0, len(rules), chunk_size):
+            end = start + chunk_size
+            chunks.append([rule_tuple(i) for i in rules[start:end]])
+        with self.lock:
+            self._add_policies([sg_policy])
+            policy_index = self.policy_index[id(sg_policy)]
+            # the chunks are sent before the pool can be started again, and
+            # map returns the results in the order of the chunks
+            results = self.executor.map(
+                _check_worker_rule_tuples, [policy_index] * len(chunks), chunks
+            )
+        rules_issues = (issues for chunk in results for issues in chunk)
+        for rule, issues in zip(rules, rules_issues):
+            rule.issues.extend(issues)
+        LOG.debug("%s rules checked in %s chunks", len(rules), len(chunks))
+
+    def close(self):
+        """Stop the worker processes."""
+        for executor in [*self.stopped_executors, self.executor]:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+
+# vim: ts=4
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""Module to check security group rules of many groups with numpy arrays."""
+
+import ipaddress
+import logging
+import re
+
+from ..utils.cidrtrie import CidrMatcher
+from ..utils.intervals import PortIntervals
+from .security_group import (
+    SG_INGRESS_FORBIDDEN_ALL_PORTS_RULE,
+    SG_INGRESS_FORBIDDEN_ALL_PROTOCOLS_RULE,
+    SG_INGRESS_FORBIDDEN_PORT,
+    SG_INGRESS_MAX_NETMASK,
+    SG_INGRESS_MAX_NUM_PORT_PER_RULE,
+    SG_RULE_FORBIDDEN_CIDR,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOG = logging.getLogger(__name__)
+
+# rule without remote_ip_prefix allows any address
+DEFAULT_PREFIX = "0.0.0.0/0"
+
+# IPv4 networks in canonical form, the other ones are parsed by ipaddress
+_IPV4_NETWORK = re.compile(
+    r"^(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})"
+    r"\.(0|[1-9][0-9]{0,2})(?:/(0|[1-9][0-9]?))?$",
+    re.ASCII,
+)
+
+
+def numpy_available():
+    """Return True if numpy is installed."""
+    return numpy is not None
+
+
+class RuleColumns:  # pylint: disable=too-few-public-methods
+    """
+    Security group rules as columns, one array item per rule.
+
+    The remote_ip_prefix and protocol columns are dictionary encoded:
+    prefix and protocol hold the index of the rule value in prefixes and
+    protocols, so the checks on them run once per distinct value.
+
+    Params:
+        rules (list): SecurityGroupRule instances
+    """
+
+    def __init__(self, rules):
+        """RuleColumns."""
+        self.prefixes = []
+        self.protocols = []
+        prefix_codes = {}
+        protocol_codes = {}
+        egress = []
+        prefix = []
+        protocol = []
+        port_min = []
+        port_max = []
+        remote_group = []
+        for rule in rules:
+            rule = rule.rule
+            egress.append(rule["direction"] == "egress")
+            value = rule["remote_ip_prefix"]
+            code = prefix_codes.get(value)
+            if code is None:
+                code = prefix_codes[value] = len(self.prefixes)
+                self.prefixes.append(value)
+            prefix.append(code)
+            value = rule["protocol"]
+            code = protocol_codes.get(value)
+            if code is None:
+                code = protocol_codes[value] = len(self.protocols)
+                self.protocols.append(value)
+            protocol.append(code)
+            # None and 0 mean all ports, as in SecurityGroupRule
+            port_min.append(rule["port_range_min"] or 0)
+            value = rule["port_range_max"]
+            port_max.append(-1 if value is None else value)
+            remote_group.append(bool(rule["remote_group_id"]))
+
+        self.egress = numpy.array(egress, dtype=bool)
+        self.ingress = ~self.egress
+        self.prefix = numpy.array(prefix, dtype=numpy.int64)
+        self.protocol = numpy.array(protocol, dtype=numpy.int64)
+        self.port_min = numpy.array(port_min, dtype=numpy.int64)
+        self.port_max = numpy.array(port_max, dtype=numpy.int64)
+        self.remote_group = numpy.array(remote_group, dtype=bool)
+
+    def prefix_mask(self, func, where):
+        """
+        Return bool array with func(remote_ip_prefix) of the rules in where.
+
+        func is called only for the prefixes of these rules, like the
+        SecurityGroupRule checks, which parse only the prefixes they check.
+        """
+        values = numpy.zeros(len(self.prefixes), dtype=bool)
+        for code in numpy.unique(self.prefix[where]).tolist():
+            values[code] = func(self.prefixes[code])
+        return values[self.prefix] & where
+
+    def protocol_mask(self, func):
+        """Return bool array with func(protocol) of each rule."""
+        values = numpy.array([func(i) for i in self.protocols], dtype=bool)
+        return values[self.protocol]
+
+
+def _parse_ipv4_network(prefix):
+    """
+    Return (address, prefixlen) of a canonical IPv4 network, or None.
+
+    None is returned for anything else (IPv6, host bits set, leading zeros),
+    which is left to ipaddress.
+    """
+    match = _IPV4_NETWORK.match(prefix)
+    if match is None:
+        return None
+    octets = [int(i) for i in match.group(1, 2, 3, 4)]
+    prefixlen = 32 if match.group(5) is None else int(match.group(5))
+    if max(octets) > 255 or prefixlen > 32:
+        return None
+    address = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    if address & ((1 << (32 - prefixlen)) - 1):
+        return None
+    return address, prefixlen
+
+
+def _forbidden_cidr_mask(columns, forbidden_cidrs, match_subnets, where):
+    """
+    Return bool array, True if the rule remote_ip_prefix is forbidden.
+
+    With match_subnets, canonical IPv4 prefixes are compared with all
+    forbidden IPv4 networks with array operations: two networks overlap
+    if their addresses are equal up to the shortest prefix length. Other
+    prefixes are looked up in the CidrMatcher tries.
+    """
+    if not match_subnets:
+        return columns.prefix_mask(
+            lambda prefix: (prefix or DEFAULT_PREFIX) in forbidden_cidrs, where
+        )
+    if not isinstance(forbidden_cidrs, CidrMatcher):
+        forbidden_cidrs = CidrMatcher(forbidden_cidrs)
+
+    values = numpy.zeros(len(columns.prefixes), dtype=bool)
+    codes, addresses, prefixlens = [], [], []
+    for code in numpy.unique(columns.prefix[where]).tolist():
+        prefix = columns.prefixes[code] or DEFAULT_PREFIX
+        network = _parse_ipv4_network(prefix)
+        if network is None:
+            values[code] = forbidden_cidrs.find_overlap(prefix) is not None
+        else:
+            codes.append(code)
+            addresses.append(network[0])
+            prefixlens.append(network[1])
+
+    if codes:
+        addresses = numpy.array(addresses, dtype=numpy.int64)
+        prefixlens = numpy.array(prefixlens, dtype=numpy.int64)
+        overlap = numpy.zeros(len(codes), dtype=bool)
+        for cidr in forbidden_cidrs.cidrs:
+            network = ipaddress.ip_network(cidr)
+            if network.version != 4:
+                continue
+            shift = 32 - numpy.minimum(prefixlens, network.prefixlen)
+            overlap |= (addresses >> shift) == (int(network.network_address) >> shift)
+        values[codes] = overlap
+    return values[columns.prefix] & where
+
+
+def _ports_overlap(columns, forbidden_ports):
+    """Return bool array, True if the rule ports overlap forbidden_ports."""
+    starts = numpy.array(forbidden_ports.starts, dtype=numpy.int64)
+    ends = numpy.array(forbidden_ports.ends, dtype=numpy.int64)
+    first = columns.port_min
+    last = numpy.where(columns.port_max < 0, first, columns.port_max)
+    # same search as PortIntervals.overlapping: first interval that ends at
+    # or after the first port, and starts before the last one
+    idx = numpy.searchsorted(ends, first, side="left")
+    found = idx < len(starts)
+    overlap = found & (starts[numpy.minimum(idx, len(starts) - 1)] <= last)
+    # rules without ports allow all of them
+    return overlap | (first == 0)
+
+
+class NumpyRulesEngine:
+    """
+    Check the ingress and egress rules of many security groups at once.
+
+    The rules are loaded into RuleColumns and each check is a few array
+    operations over all of them. The issues appended to each
+    SecurityGroupRule are the same, and in the same order, as the ones of
+    SecurityGroup.check_egress_rules and check_ingress_rules.
+
+    Params:
+        batch_size (int): security groups checked together by the scanner
+    """
+
+    def __init__(self, batch_size=1000):
+        """NumpyRulesEngine."""
+        if numpy is None:
+            raise RuntimeError("numpy engine requires numpy")
+        self.batch_size = batch_size
+
+    def check_rules(self, rules, sg_policy):
+        """
+        Append the issues of each rule to its issues list.
+
+        Params:
+            rules      (list): SecurityGroupRule instances
+            sg_policy (SgPolicy): security group compliance rules
+        """
+        if not rules:
+            return
+        columns = RuleColumns(rules)
+        egress, ingress = sg_policy.egress, sg_policy.ingress
+
+        # (mask, issue) in the order of the SecurityGroupRule checks
+        checks = [
+            (
+                _forbidden_cidr_mask(
+                    columns,
+                    egress.forbid_cidrs,
+                    egress.forbid_cidrs_match_subnets,
+                    columns.egress,
+                ),
+                f"{SG_RULE_FORBIDDEN_CIDR} egress",
+            ),
+            (
+                _forbidden_cidr_mask(
+                    columns,
+                    ingress.forbid_cidrs,
+                    ingress.forbid_cidrs_match_subnets,
+                    columns.ingress,
+                ),
+                f"{SG_RULE_FORBIDDEN_CIDR} ingress",
+            ),
+        ]
+
+        if ingress.max_netmask_allowed is not None:
+            # rules allowing a remote group have no netmask
+            no_prefix = columns.prefix_mask(lambda prefix: not prefix, columns.ingress)
+            netmask = columns.prefix_mask(
+                lambda prefix: int((prefix or DEFAULT_PREFIX).split("/")[-1])
+                < ingress.max_netmask_allowed,
+                columns.ingress & ~(no_prefix & columns.remote_group),
+            )
+            checks.append((netmask, SG_INGRESS_MAX_NETMASK))
+
+        is_icmp = columns.protocol_mask(lambda protocol: protocol == "icmp")
+        if ingress.max_number_port_per_rule is not None:
+            ports = (columns.port_max + 1) - columns.port_min
+            too_many = (
+                (columns.port_min == 0)
+                | (columns.port_max <= 0)
+                | (ports > ingress.max_number_port_per_rule)
+            )
+            checks.append(
+                (
+                    columns.ingress & ~is_icmp & too_many,
+                    SG_INGRESS_MAX_NUM_PORT_PER_RULE,
+                )
+            )
+
+        for protocol, forbidden_ports in ingress.forbid_ports:
+            if not forbidden_ports:
+                continue
+            if not isinstance(forbidden_ports, PortIntervals):
+                forbidden_ports = PortIntervals(forbidden_ports)
+            # pylint: disable=cell-var-from-loop
+            same_protocol = columns.protocol_mask(lambda i: i == protocol)
+            checks.append(
+                (
+                    columns.ingress
+                    & same_protocol
+                    & _ports_overlap(columns, forbidden_ports),
+                    f"{SG_INGRESS_FORBIDDEN_PORT} {protocol}",
+                )
+            )
+
+        if ingress.forbid_all_protocols:
+            checks.append(
+                (
+                    columns.ingress & columns.protocol_mask(lambda i: not i),
+                    SG_INGRESS_FORBIDDEN_ALL_PROTOCOLS_RULE,
+                )
+            )
+
+        if ingress.forbid_all_ports:
+            checks.append(
+                (
+                    columns.ingress & ~is_icmp & (columns.port_min == 0),
+                    SG_INGRESS_FORBIDDEN_ALL_PORTS_RULE,
+                )
+            )
+
+        # checks are in order, so are the issues of each rule
+        for mask, issue in checks:
+            for idx in numpy.flatnonzero(mask).tolist():
+                rules[idx].issues.append(issue)
+        LOG.debug("%s rules checked", len(rules))
+
+    def set_policies(self, sg_policies):
+        """Nothing to prepare, see ProcessRulesEngine.set_policies."""
+
+    def close(self):
+        """Nothing to release, see ProcessRulesEngine.close."""
+
+
+# vim: ts=4
@@ -4,6 +4,9 @@
 import ipaddress
 import logging
 
+from ..utils.cidrtrie import CidrMatcher
+from ..utils.intervals import MAX_PORT, PortIntervals, format_port_intervals
+from ..utils.sweep import find_covered
 from ..utils.utils import color_dic
 from ..violation.violation import Violation
 
@@ -18,6 +21,44 @@ SG_INGRESS_MAX_NUM_PORT_PER_RULE = "Violation of ingress max number port per rul
 SG_INGRESS_FORBIDDEN_PORT = "Violation of ingress forbidden port"
 SG_INGRESS_FORBIDDEN_ALL_PORTS_RULE = "Violation of ingress all ports"
 SG_INGRESS_FORBIDDEN_ALL_PROTOCOLS_RULE = "Violation of ingress all protocols"
+SG_REDUNDANT_RULE = "Redundant rule, covered by rule id"
+SG_REMOTE_GROUP_EXPOSURE = "Ingress exposed through remote groups to forbidden cidr"
+
+# protocols where port_range_min/max are ports, and where they are icmp
+# type/code. Other protocols have no ports
+PORT_PROTOCOLS = frozenset(
+    ("tcp", "udp", "sctp", "udplite", "dccp", "6", "17", "33", "132", "136")
+)
+ICMP_PROTOCOLS = frozenset(("icmp", "icmpv6", "ipv6-icmp", "1", "58"))
+
+
+def _rule_range(rule):
+    """
+    Return (first, last) range of what the rule allows for its protocol.
+
+    Ports are a range of ports. ICMP type and code are mapped to
+    type * 256 + code, so a type without code is the range of all its
+    codes. None (all ports / all types) is the full range.
+    """
+    protocol = rule["protocol"]
+    first, last = rule["port_range_min"], rule["port_range_max"]
+    if first is None:
+        return 0, MAX_PORT
+    if protocol in PORT_PROTOCOLS:
+        return first, last if last is not None else first
+    if protocol in ICMP_PROTOCOLS:
+        if last is None:
+            return first * 256, first * 256 + 255
+        return first * 256 + last, first * 256 + last
+    return 0, MAX_PORT
+
+
+def _rule_network(rule):
+    """Return rule remote network, any address if it allows a remote group."""
+    prefix = rule["remote_ip_prefix"]
+    if not prefix:
+        prefix = "::/0" if rule.get("ethertype") == "IPv6" else "0.0.0.0/0"
+    return ipaddress.ip_network(prefix)
 
 
 class SecurityGroupRule:
@@ -38,13 +79,44 @@ class SecurityGroupRule:
         """Return rule details."""
         return f"{self.rule}"
 
+    def check_egress(self, egress):
+        """
+        Run all egress checks.
+
+        Params:  egress (EgressPolicy): egress compliance rules.
+        """
+        self.check_cidr(
+            direction="egress",
+            forbidden_cidrs=egress.forbid_cidrs,
+            match_subnets=egress.forbid_cidrs_match_subnets,
+        )
+
+    def check_ingress(self, ingress):
+        """
+        Run all ingress checks.
+
+        Params:  ingress (IngressPolicy): ingress compliance rules.
+        """
+        self.check_cidr(
+            direction="ingress",
+            forbidden_cidrs=ingress.forbid_cidrs,
+            match_subnets=ingress.forbid_cidrs_match_subnets,
+        )
+        self.check_ingress_max_netmask(ingress.max_netmask_allowed)
+        self.check_ingress_max_number_port(ingress.max_number_port_per_rule)
+        for protocol, forbidden_ports in ingress.forbid_ports:
+            self.check_ingress_port(protocol, forbidden_ports)
+        self.check_ingress_all_protocols(ingress.forbid_all_protocols)
+        self.check_ingress_all_ports(ingress.forbid_all_ports)
+
     def check_cidr(self, *, direction, forbidden_cidrs, match_subnets):
         """
         Check rule CIDR.
 
         Params:
             direction              (str): ingress / egress
-            forbidden_cidrs       (list): list with forbidden cidrs
+            forbidden_cidrs (CidrMatcher): forbidden cidrs. It also accepts a
+                                          list with cidrs
             match_subnets   (True/False): False - alarm match exactly cidr only, i.e.,
                                                   string comparation
                                           True  - alarm match if rule uses a subnet of
@@ -57,17 +129,18 @@ class SecurityGroupRule:
         )
 
         if match_subnets:
-            remote_network = ipaddress.ip_network(remote_ip_prefix)
-            for cidr in forbidden_cidrs:
-                cidr_network = ipaddress.ip_network(cidr)
-                if cidr_network.overlaps(remote_network):
-                    LOG.debug(
-                        "Violation of %s cidr. SG rule cidr - %s",
-                        direction,
-                        remote_ip_prefix,
-                    )
-                    self.issues.append(f"{SG_RULE_FORBIDDEN_CIDR} {direction}")
-                    return
+            if not isinstance(forbidden_cidrs, CidrMatcher):
+                forbidden_cidrs = CidrMatcher(forbidden_cidrs)
+            forbidden_network = forbidden_cidrs.find_overlap(remote_ip_prefix)
+            if forbidden_network is not None:
+                LOG.debug(
+                    "Violation of %s cidr. SG rule cidr - %s overlaps %s",
+                    direction,
+                    remote_ip_prefix,
+                    forbidden_network,
+                )
+                self.issues.append(f"{SG_RULE_FORBIDDEN_CIDR} {direction}")
+                return
         else:
             if remote_ip_prefix in forbidden_cidrs:
                 LOG.debug(
@@ -81,6 +154,10 @@ class SecurityGroupRule:
         LOG.debug("cidr %s ok: %s", direction, remote_ip_prefix)
 
     def check_ingress_max_netmask(self, max_netmask):
+        if max_netmask is None:
+            LOG.debug("Check disabled")
+            return
+
         remote_ip_prefix = (
             self.rule["remote_ip_prefix"]
             if self.rule["remote_ip_prefix"]
@@ -101,6 +178,9 @@ class SecurityGroupRule:
             LOG.debug("netmask ok: /%s", netmask)
 
     def check_ingress_max_number_port(self, max_number_port_per_rule):
+        if max_number_port_per_rule is None:
+            LOG.debug("Check disabled")
+            return
         if self.rule["protocol"] == "icmp":
             LOG.debug("max_number_port_per_rule ok: icmp protocol")
             return
@@ -126,6 +206,14 @@ class SecurityGroupRule:
                 LOG.debug("max_number_port_per_rule ok: %s", num_ports)
 
     def check_ingress_port(self, protocol, forbidden_ports):
+        """
+        Check if rule permits access to a forbidden port.
+
+        Params:
+            protocol                  (str): tcp / udp
+            forbidden_ports (PortIntervals): forbidden ports. It also accepts a
+                                             list with ports or port ranges
+        """
         if self.rule["protocol"] != protocol:
             LOG.debug("Not %s protocol rule: %s", protocol, self.rule["protocol"])
             return
@@ -134,31 +222,31 @@ class SecurityGroupRule:
             LOG.debug("No port forbidden for protocol %s", protocol)
             return
 
+        if not isinstance(forbidden_ports, PortIntervals):
+            forbidden_ports = PortIntervals(forbidden_ports)
+
         port_range_min = self.rule["port_range_min"]
         port_range_max = self.rule["port_range_max"]
 
         if not port_range_min:
+            hits = list(forbidden_ports)
+        else:
+            hits = forbidden_ports.overlapping(
+                port_range_min,
+                port_range_max if port_range_max is not None else port_range_min,
+            )
+
+        if hits:
             self.issues.append(f"{SG_INGRESS_FORBIDDEN_PORT} {protocol}")
             LOG.debug(
-                "Violation of ingress %s port: %s - %s",
+                "Violation of ingress %s port: %s - %s. Forbidden ports: %s",
                 protocol,
                 port_range_min,
                 port_range_max,
+                format_port_intervals(hits),
             )
         else:
-            for port in range(port_range_min, port_range_max + 1, 1):
-                if port in forbidden_ports:
-                    self.issues.append(f"{SG_INGRESS_FORBIDDEN_PORT} {protocol}")
-                    LOG.debug(
-                        "Violation of ingress %s port: %s - %s",
-                        protocol,
-                        port_range_min,
-                        port_range_max,
-                    )
-                else:
-                    LOG.debug(
-                        "%s port ok: %s - %s", protocol, port_range_min, port_range_max
-                    )
+            LOG.debug("%s port ok: %s - %s", protocol, port_range_min, port_range_max)
 
     def check_ingress_all_protocols(self, check_all_protocols):
         if not check_all_protocols:
@@ -210,12 +298,14 @@ class SecurityGroup:
             SecurityGroupRule(rule) for rule in self.os_sg.security_group_rules
         ]
         self.violations = []
+        # violations already in the list, to keep it without duplicates
+        self.violations_seen = set()
 
     def check_egress_rules(self, egress):
         """
         Verify all egress rules.
 
-        Params:  egress (dict): Dictionary with egress compliance rules.
+        Params:  egress (EgressPolicy): egress compliance rules.
         """
         LOG.debug(
             "%s #### Checking egress rules %s", color_dic["cyan"], color_dic["nocolor"]
@@ -223,17 +313,14 @@ class SecurityGroup:
         for rule in self.rules:
             if rule.rule["direction"] == "egress":
                 LOG.debug("#### Checking egress rules - rule id: %s", rule.rule_id)
-                rule.check_cidr(
-                    direction=rule.rule["direction"],
-                    forbidden_cidrs=egress["forbid_cidrs"],
-                    match_subnets=egress["forbid_cidrs_match_subnets"],
-                )
+                rule.check_egress(egress)
+                self.add_rule_violation(rule)
 
     def check_ingress_rules(self, ingress):
         """
         Verify all ingress rules.
 
-        Params:  ingress (dict): Dictionary with ingress compliance rules.
+        Params:  ingress (IngressPolicy): ingress compliance rules.
         """
         LOG.debug(
             "%s #### Checking ingress rules %s", color_dic["cyan"], color_dic["nocolor"]
@@ -241,73 +328,131 @@ class SecurityGroup:
         for rule in self.rules:
             if rule.rule["direction"] == "ingress":
                 LOG.debug("#### Checking ingress rules - rule id: %s", rule.rule_id)
-                rule.check_cidr(
-                    direction=rule.rule["direction"],
-                    forbidden_cidrs=ingress["forbid_cidrs"],
-                    match_subnets=ingress["forbid_cidrs_match_subnets"],
-                )
-                rule.check_ingress_max_netmask(ingress["max_netmask_allowed"])
-                rule.check_ingress_max_number_port(ingress["max_number_port_per_rule"])
-                rule.check_ingress_port("tcp", ingress["forbid_tcp_port"])
-                rule.check_ingress_port("udp", ingress["forbid_udp_port"])
-                rule.check_ingress_all_protocols(ingress["forbid_all_protocols"])
-                rule.check_ingress_all_ports(ingress["forbid_all_ports"])
+                rule.check_ingress(ingress)
+                self.add_rule_violation(rule)
 
     def check_sg_tags(self, mandatory_tags):
         """Verify if security group has all mandatory tags."""
-        sg_tags = self.os_sg.tags
+        sg_tags = set(self.os_sg.tags)
         missing_sg_tags = [i for i in mandatory_tags if i not in sg_tags]
 
         if missing_sg_tags:
             message = f"{SG_MISSING_TAGS} {', '.join(missing_sg_tags)}"
-            self.violations.append(
-                Violation(
-                    self.project_name,
-                    VIOLATION_TYPE,
-                    self.name,
-                    self.id,
-                    self.os_sg.created_at,
-                    message,
-                )
-            )
+            self.add_violation(message)
             LOG.debug("SG id: %s - Violation of sg tags: %s", self.id, message)
 
     def check_sg_not_used(self, all_used_sgs_ids):
         """Verify if security group is in use."""
         if self.id not in all_used_sgs_ids:
-            self.violations.append(
-                # pylint: disable=duplicate-code
-                Violation(
-                    self.project_name,
-                    VIOLATION_TYPE,
-                    self.name,
-                    self.id,
-                    self.os_sg.created_at,
-                    SG_NOT_USED,
-                )
-            )
+            self.add_violation(SG_NOT_USED)
             LOG.debug("SG id: %s - Violation SG not used", self.id)
 
-    def compute_rules_violations(self):
-        """Append all security group rules violations."""
+    def check_remote_group_exposure(self, exposed_cidrs):
+        """
+        Verify if the remote groups of ingress rules reach forbidden cidrs.
+
+        Params:
+            exposed_cidrs (list): forbidden cidrs reached through the remote
+                                  groups, see RemoteGroupGraph.exposed_cidrs
+        """
+        if exposed_cidrs:
+            message = f"{SG_REMOTE_GROUP_EXPOSURE} {', '.join(exposed_cidrs)}"
+            self.add_violation(message)
+            LOG.debug("SG id: %s - %s", self.id, message)
+
+    def check_redundant_rules(self):
+        """
+        Verify if rules are covered by other rules of the security group.
+
+        A rule is covered by another one with the same direction and
+        remote group, the same protocol (or any protocol), ports (or icmp
+        type/code) that include its ports, and a remote cidr that includes
+        its cidr. See find_covered, rules are not compared in pairs.
+        """
+        # (first, last, network, rule) of each direction, remote group and
+        # protocol
+        domains = {}
         for rule in self.rules:
-            if rule.issues:
-                message = f"rule id {rule.rule_id} - {', '.join(rule.issues)}"
-                violation = Violation(
-                    self.project_name,
-                    VIOLATION_TYPE,
-                    self.name,
-                    self.id,
-                    self.os_sg.created_at,
-                    message,
+            try:
+                network = _rule_network(rule.rule)
+            except ValueError:
+                LOG.debug("Invalid remote_ip_prefix, rule id: %s", rule.rule_id)
+                continue
+            key = (rule.rule["direction"], rule.rule["remote_group_id"])
+            protocol = rule.rule["protocol"]
+            first, last = _rule_range(rule.rule)
+            domains.setdefault((*key, protocol), []).append(
+                (first, last, network, rule)
+            )
+
+        covering = {}
+        for (direction, remote_group_id, protocol), rules in domains.items():
+            items = [(first, last, network, True) for first, last, network, _ in rules]
+            if protocol is not None:
+                # rules of any protocol cover all ports of this protocol, but
+                # they are not covered by its rules
+                any_rules = domains.get((direction, remote_group_id, None), [])
+                items.extend((0, MAX_PORT, i[2], False) for i in any_rules)
+                rules = rules + any_rules
+            for idx, other in find_covered(items).items():
+                covering[rules[idx][3].rule_id] = rules[other][3].rule_id
+
+        for rule in self.rules:
+            if rule.rule_id in covering:
+                message = (
+                    f"rule id {rule.rule_id} - "
+                    f"{SG_REDUNDANT_RULE} {covering[rule.rule_id]}"
                 )
-                if violation not in self.violations:
-                    self.violations.append(violation)
+                self.add_violation(message)
+                LOG.debug("SG id: %s - %s", self.id, message)
+
+    def add_violation(self, message):
+        """Append a Violation instance for the security group."""
+        violation = Violation(
+            self.project_name,
+            VIOLATION_TYPE,
+            self.name,
+            self.id,
+            self.os_sg.created_at,
+            message,
+        )
+        if violation not in self.violations_seen:
+            self.violations_seen.add(violation)
+            self.violations.append(violation)
+
+    def add_rule_violation(self, rule):
+        """Append a Violation instance for the rule issues, if any."""
+        if rule.issues:
+            self.add_violation(f"rule id {rule.rule_id} - {', '.join(rule.issues)}")
+
+    def add_rules_violations(self, direction):
+        """
+        Append violations of the rules of direction (ingress / egress).
+
+        Used when the rules issues are found by a rules engine, instead of
+        check_egress_rules and check_ingress_rules.
+        """
+        for rule in self.rules:
+            if rule.rule["direction"] == direction:
+                self.add_rule_violation(rule)
+
+    def compute_rules_violations(self):
+        """
+        Append all security group rules violations.
+
+        check_egress_rules and check_ingress_rules already append them, it is
+        only needed if the rules are checked directly.
+        """
+        for rule in self.rules:
+            self.add_rule_violation(rule)
 
     def return_violations(self):
-        """Return list with all Violation instances for the security group."""
-        self.compute_rules_violations()
-        return list(set(self.violations))
+        """
+        Return list with all Violation instances for the security group.
+
+        Violations are in the order they were found, without duplicates.
+        """
+        return list(self.violations)
 
 
 # vim: ts=4
@@ -29,23 +29,16 @@ class Server:
         self.name = os_server.name
         self.id = os_server.id
         self.violations = []
+        # violations already in the list, to keep it without duplicates
+        self.violations_seen = set()
 
     def check_server_tags(self, mandatory_tags):
         """Verify if server has all mandatory tags."""
-        missing_tags = [i for i in mandatory_tags if i not in self.os_server.tags]
+        server_tags = set(self.os_server.tags)
+        missing_tags = [i for i in mandatory_tags if i not in server_tags]
         if missing_tags:
             message = f"{SERVER_MISSING_TAGS} {', '.join(missing_tags)}"
-            # pylint: disable=duplicate-code
-            self.violations.append(
-                Violation(
-                    self.project_name,
-                    VIOLATION_TYPE,
-                    self.name,
-                    self.id,
-                    self.os_server.created_at,
-                    message,
-                )
-            )
+            self.add_violation(message)
             LOG.debug(
                 "Server id: %s - Violation of server tags: missing tags: %s",
                 self.id,
@@ -58,26 +51,35 @@ class Server:
         missing_metadata = [i for i in mandatory_metadata if i not in server_metadata]
         if missing_metadata:
             message = f"{SERVER_MISSING_METADATA} {', '.join(missing_metadata)}"
-            # pylint: disable=duplicate-code
-            self.violations.append(
-                Violation(
-                    self.project_name,
-                    VIOLATION_TYPE,
-                    self.name,
-                    self.id,
-                    self.os_server.created_at,
-                    message,
-                )
-            )
+            self.add_violation(message)
             LOG.debug(
                 "Server id: %s - Violation of server metadata: missing metadata: %s",
                 self.id,
                 missing_metadata,
             )
 
+    def add_violation(self, message):
+        """Append a Violation instance for the server."""
+        # pylint: disable=duplicate-code
+        violation = Violation(
+            self.project_name,
+            VIOLATION_TYPE,
+            self.name,
+            self.id,
+            self.os_server.created_at,
+            message,
+        )
+        if violation not in self.violations_seen:
+            self.violations_seen.add(violation)
+            self.violations.append(violation)
+
     def return_violations(self):
-        """Return list with all Violation instances for the server."""
-        return list(set(self.violations))
+        """
+        Return list with all Violation instances for the server.
+
+        Violations are in the order they were found, without duplicates.
+        """
+        return list(self.violations)
 
 
 # vim: ts=4
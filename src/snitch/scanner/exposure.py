@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Module to find ingress exposure granted through remote security groups."""
+
+from ..resources.security_group import _rule_network
+from ..utils.cidrtrie import CidrMatcher
+
+
+def _strongly_connected_components(graph):
+    """
+    Return list with the strongly connected components of graph.
+
+    Iterative Tarjan algorithm, so long chains of groups do not hit the
+    recursion limit. Components are returned after all the components
+    they reach, i.e., in reverse topological order.
+
+    Params:
+        graph (dict): node as key and list of nodes it reaches as value
+    """
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph[successor])))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class RemoteGroupGraph:
+    """
+    Security groups of a project and the groups their ingress rules refer to.
+
+    An ingress rule with remote_group_id allows the ports of that group,
+    so a group is effectively exposed to the forbidden cidrs its own
+    ingress rules allow, and to the ones of every group it refers to,
+    transitively. They are resolved once for all groups: cycles are
+    collapsed into their strongly connected components, and each
+    component reuses the result of the components it refers to.
+
+    Remote groups that are not in the listing (other projects) are ignored.
+
+    Params:
+        os_sgs        (list): security groups of the project
+        ingress (IngressPolicy): ingress compliance rules, with the
+                                 forbidden cidrs
+    """
+
+    def __init__(self, os_sgs, ingress):
+        """RemoteGroupGraph."""
+        forbidden_cidrs = ingress.forbid_cidrs
+        if ingress.forbid_cidrs_match_subnets and not isinstance(
+            forbidden_cidrs, CidrMatcher
+        ):
+            forbidden_cidrs = CidrMatcher(forbidden_cidrs)
+
+        self.remote_groups = {}
+        direct = {}
+        for os_sg in os_sgs:
+            remote_groups = set()
+            cidrs = set()
+            for rule in os_sg.security_group_rules:
+                if rule["direction"] != "ingress":
+                    continue
+                if rule["remote_group_id"] and not rule["remote_ip_prefix"]:
+                    remote_groups.add(rule["remote_group_id"])
+                    continue
+                # without remote_ip_prefix, any address of the rule ethertype
+                try:
+                    network = _rule_network(rule)
+                except ValueError:
+                    continue
+                if ingress.forbid_cidrs_match_subnets:
+                    network = forbidden_cidrs.find_overlap(network)
+                    if network is not None:
+                        cidrs.add(str(network))
+                else:
+                    prefix = rule["remote_ip_prefix"] or str(network)
+                    if prefix in forbidden_cidrs:
+                        cidrs.add(prefix)
+            self.remote_groups[os_sg.id] = remote_groups
+            direct[os_sg.id] = frozenset(cidrs)
+
+        graph = {
+            sg_id: [i for i in remote_groups if i in self.remote_groups]
+            for sg_id, remote_groups in self.remote_groups.items()
+        }
+        # forbidden cidrs reached by each group, directly or transitively
+        self.reached = {}
+        for component in _strongly_connected_components(graph):
+            cidrs = set()
+            for sg_id in component:
+                cidrs.update(direct[sg_id])
+                for remote_group in graph[sg_id]:
+                    # components referred to are already resolved
+                    cidrs.update(self.reached.get(remote_group, ()))
+            cidrs = frozenset(cidrs)
+            for sg_id in component:
+                self.reached[sg_id] = cidrs
+
+    def exposed_cidrs(self, sg_id):
+        """
+        Return sorted list of forbidden cidrs sg_id reaches through its
+        remote groups (the ones allowed by its own rules are not included,
+        unless a remote group also reaches them).
+        """
+        cidrs = set()
+        for remote_group in self.remote_groups.get(sg_id, ()):
+            if remote_group != sg_id:
+                cidrs.update(self.reached.get(remote_group, ()))
+        return sorted(cidrs)
+
+
+# vim: ts=4
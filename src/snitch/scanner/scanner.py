@@ -0,0 +1,642 @@
+# -*- coding: utf-8 -*-
+"""Module to scan OpenStack projects for compliance violations."""
+
+import functools
+import itertools
+import logging
+import pprint
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Optional
+
+from ..inventory.inventory import Inventory, connection_region
+from ..inventory.usage import SgUsageIndex
+from ..resources.security_group import SecurityGroup, SecurityGroupRule
+from ..resources.server import Server
+from ..utils.profiler import PROFILER
+from ..utils.utils import color_dic
+from .exposure import RemoteGroupGraph
+from .state import sg_policy_hash, sg_rules_hash
+
+LOG = logging.getLogger(__name__)
+
+# max number of violations waiting to be consumed
+QUEUE_MAXSIZE = 1000
+# seconds a producer waits for another one before checking if the scan stopped
+PRODUCER_WAIT = 0.1
+
+
+@dataclass
+class ProjectScanResult:
+    """Number of violations found in a project and how long the scan took."""
+
+    project_name: str
+    violations_count: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    cloud: str = ""
+    region: str = ""
+
+
+@dataclass
+class RegionScanResult:
+    """Number of violations found in a cloud region and how long the scan took."""
+
+    cloud: str
+    region: str
+    violations_count: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+##############################################################################
+# Time the checks with --profile
+##############################################################################
+def enable_profiling():
+    """
+    Enable PROFILER and time each check of the resources classes.
+
+    The classes are only instrumented here, so the checks run without
+    any profiling code when --profile is not given.
+    """
+    PROFILER.enable()
+    PROFILER.instrument(
+        SecurityGroupRule,
+        [i for i in vars(SecurityGroupRule) if i.startswith("check_")],
+    )
+    PROFILER.instrument(
+        SecurityGroup,
+        ["__init__"] + [i for i in vars(SecurityGroup) if i.startswith("check_")],
+    )
+    PROFILER.instrument(
+        Server, ["__init__"] + [i for i in vars(Server) if i.startswith("check_")]
+    )
+
+
+##############################################################################
+# Run producers in threads and merge what they emit
+##############################################################################
+class _ConsumerGone(Exception):
+    """Consumer stopped reading the items."""
+
+
+class ScanStopped(Exception):
+    """Scan stopped before a listing other checks wait for was done."""
+
+
+class _ProducerDone:  # pylint: disable=too-few-public-methods
+    """Producer finished, with error if it raised an exception."""
+
+    def __init__(self, error=None):
+        self.error = error
+
+
+def merge_producers(
+    producers, *, workers=None, maxsize=QUEUE_MAXSIZE, stop=None, on_skip=None
+):
+    """
+    Run producers in threads and yield the items as soon as they are emitted.
+
+    Params:
+        producers (list): callables that receive an emit(item) function
+        workers    (int): max number of producers running at the same time
+                          default is one thread per producer
+        maxsize    (int): max number of items waiting to be consumed. A producer
+                          blocks in emit() when the consumer is behind
+        stop (threading.Event): set when the generator stops (closed, a
+                                producer error or all done), for producers
+                                waiting for another one. Default is a new event
+        on_skip (callable): called with each producer that is not started
+                            because the generator stopped before
+
+    If a producer raises an exception, it is raised by the generator. If the
+    generator is closed, producers stop on the next emit() call.
+    """
+    producers = list(producers)
+    if not producers:
+        return
+
+    items = queue.Queue(maxsize=maxsize)
+    if stop is None:
+        stop = threading.Event()
+
+    def emit(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _ConsumerGone()
+
+    def run(producer):
+        if stop.is_set():
+            if on_skip is not None:
+                on_skip(producer)
+            return
+        try:
+            producer(emit)
+            emit(_ProducerDone())
+        except _ConsumerGone:
+            pass
+        except Exception as error:  # pylint: disable=broad-except
+            try:
+                emit(_ProducerDone(error))
+            except _ConsumerGone:
+                pass
+
+    executor = ThreadPoolExecutor(max_workers=workers or len(producers))
+    try:
+        for producer in producers:
+            executor.submit(run, producer)
+        pending = len(producers)
+        while pending:
+            item = items.get()
+            if isinstance(item, _ProducerDone):
+                pending -= 1
+                if item.error is not None:
+                    raise item.error
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+##############################################################################
+# Return an index with all security groups used by ports
+##############################################################################
+def return_all_used_sgs(inventory):
+    """Return SgUsageIndex built from the project ports."""
+    return SgUsageIndex(inventory.ports())
+
+
+#############################################################################
+# Check all security group rules
+#############################################################################
+def _batches(iterable, size):
+    """Yield lists with up to size items of iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_sg_compliance(
+    inventory, sg_policy, get_used_sgs=None, state=None, engine=None
+):
+    """
+    Check compliance rules for all security groups of the project.
+
+    Params:
+        inventory     (Inventory): project resources
+        sg_policy      (SgPolicy): security group compliance rules
+        get_used_sgs   (callable): return SgUsageIndex (or a set with the used
+                                   sgs ids). It is called only when the first
+                                   not used check is done, so ports can be
+                                   listed in parallel. Default lists ports
+                                   from inventory.
+        state     (SgStateStore): optional store with the violations of the
+                                  previous scans. Unchanged security groups
+                                  are not checked again
+        engine (NumpyRulesEngine): optional engine that checks the rules of
+                                   engine.batch_size security groups at once.
+                                   Default checks each rule in Python
+
+    If the tags check is the only one enabled, only the security groups
+    missing a mandatory tag are listed, and the state store is not used.
+    With forbid_remote_group_exposure, all security groups are listed
+    before the first one is checked, to build the RemoteGroupGraph.
+
+    Yield a SecurityGroup instance as soon as its security group is checked
+    (as soon as its batch is checked, with engine).
+    """
+    LOG.debug("%s", pprint.pformat(sg_policy))
+
+    if get_used_sgs is None:
+        get_used_sgs = functools.partial(return_all_used_sgs, inventory)
+
+    not_tags = None
+    if sg_policy.only_tag_checks:
+        LOG.debug("Listing only sgs without tags: %s", sg_policy.mandatory_tags)
+        not_tags = sg_policy.mandatory_tags
+        # compliant groups are not listed, so they would be pruned
+        state = None
+
+    if state is not None:
+        scope = inventory.scope()
+        policy_hash = sg_policy_hash(sg_policy)
+        seen_sg_ids = set()
+
+    os_sgs = inventory.security_groups(not_tags=not_tags)
+    remote_groups = None
+    if sg_policy.forbid_remote_group_exposure:
+        # groups refer to groups listed after them
+        os_sgs = list(os_sgs)
+        remote_groups = RemoteGroupGraph(os_sgs, sg_policy.ingress)
+
+    all_used_sgs_ids = None
+    batch_size = 1 if engine is None else engine.batch_size
+    for batch in _batches(os_sgs, batch_size):
+        # (SecurityGroup, rules hash, stored messages) of the batch
+        checks = []
+        for os_sg in batch:
+            LOG.debug(
+                "%s #########################################################%s",
+                color_dic["blue"],
+                color_dic["nocolor"],
+            )
+            if os_sg.id in sg_policy.ignore_sg_ids:
+                LOG.debug("Ignoring sg: %s - %s", os_sg.id, os_sg.name)
+                continue
+            LOG.debug(
+                "%s #### Checking rules for sg: %s - %s%s",
+                color_dic["blue"],
+                os_sg.id,
+                os_sg.name,
+                color_dic["nocolor"],
+            )
+            LOG.debug(
+                "%s #########################################################%s",
+                color_dic["blue"],
+                color_dic["nocolor"],
+            )
+
+            securitygroup = SecurityGroup(inventory.project_name, os_sg)
+            rules_hash = messages = None
+            if state is not None:
+                seen_sg_ids.add(os_sg.id)
+                rules_hash = sg_rules_hash(os_sg)
+                messages = state.lookup(scope, os_sg, rules_hash, policy_hash)
+            checks.append((securitygroup, rules_hash, messages))
+
+        if engine is not None:
+            engine.check_rules(
+                [
+                    rule
+                    for securitygroup, _, messages in checks
+                    if messages is None
+                    for rule in securitygroup.rules
+                ],
+                sg_policy,
+            )
+
+        for securitygroup, rules_hash, messages in checks:
+            if messages is not None:
+                LOG.debug("Unchanged sg, using stored violations: %s", securitygroup.id)
+                for message in messages:
+                    securitygroup.add_violation(message)
+            else:
+                securitygroup.check_sg_tags(sg_policy.mandatory_tags)
+                if engine is None:
+                    securitygroup.check_egress_rules(sg_policy.egress)
+                    securitygroup.check_ingress_rules(sg_policy.ingress)
+                else:
+                    securitygroup.add_rules_violations("egress")
+                    securitygroup.add_rules_violations("ingress")
+                if sg_policy.forbid_redundant_rules:
+                    securitygroup.check_redundant_rules()
+                if state is not None:
+                    state.store(
+                        scope,
+                        securitygroup.os_sg,
+                        rules_hash,
+                        policy_hash,
+                        [i.message for i in securitygroup.return_violations()],
+                    )
+            # ports change without changing the security group, never stored
+            if sg_policy.alert_if_not_used:
+                if all_used_sgs_ids is None:
+                    all_used_sgs_ids = get_used_sgs()
+                securitygroup.check_sg_not_used(all_used_sgs_ids)
+            # depends on the other groups, never stored
+            if remote_groups is not None:
+                securitygroup.check_remote_group_exposure(
+                    remote_groups.exposed_cidrs(securitygroup.id)
+                )
+
+            LOG.debug(
+                "%s#### Violation for %s %s%s",
+                color_dic["red"],
+                securitygroup.name,
+                securitygroup.return_violations(),
+                color_dic["nocolor"],
+            )
+            yield securitygroup
+
+    # only reached when the listing is complete
+    if state is not None:
+        state.prune(scope, seen_sg_ids)
+
+
+def check_sg_compliance(
+    inventory, sg_policy, get_used_sgs=None, state=None, engine=None
+):
+    """Return a list with SecurityGroup instances, see iter_sg_compliance."""
+    return list(iter_sg_compliance(inventory, sg_policy, get_used_sgs, state, engine))
+
+
+#############################################################################
+# Check all servers rules
+#############################################################################
+def iter_servers_compliance(inventory, server_policy):
+    """
+    Check compliance rules for all servers of the project.
+
+    If the tags check is the only one enabled, only the servers missing a
+    mandatory tag are listed.
+
+    Yield a Server instance as soon as its server is checked.
+    """
+    not_tags = None
+    if server_policy.only_tag_checks:
+        LOG.debug("Listing only servers without tags: %s", server_policy.mandatory_tags)
+        not_tags = server_policy.mandatory_tags
+
+    for os_server in inventory.servers(not_tags=not_tags):
+        LOG.debug(
+            "%s #########################################################%s",
+            color_dic["blue"],
+            color_dic["nocolor"],
+        )
+        if os_server.id in server_policy.ignore_server_ids:
+            LOG.debug("Ignoring sg: %s - %s", os_server.id, os_server.name)
+            continue
+        LOG.debug(
+            "%s #### Checking rules for server: %s - %s%s",
+            color_dic["blue"],
+            os_server.id,
+            os_server.name,
+            color_dic["nocolor"],
+        )
+        server = Server(inventory.project_name, os_server)
+        server.check_server_tags(server_policy.mandatory_tags)
+        server.check_server_metadata(server_policy.mandatory_metadata)
+        yield server
+
+
+def check_servers_compliance(inventory, server_policy):
+    """Return a list with Server instances, see iter_servers_compliance."""
+    return list(iter_servers_compliance(inventory, server_policy))
+
+
+##############################################################################
+# Check all compliance rules of a project
+##############################################################################
+class _PortsListing:
+    """
+    Ports listing producer, for the security groups check waiting for it.
+
+    Params:
+        inventory     (Inventory): project resources
+        stop (threading.Event): set when the scan stops, see merge_producers
+    """
+
+    def __init__(self, inventory, stop):
+        """_PortsListing."""
+        self.inventory = inventory
+        self.stop = stop
+        self.future = Future()
+
+    def list_ports(self, _emit):
+        """Producer that builds the SgUsageIndex."""
+        try:
+            self.future.set_result(return_all_used_sgs(self.inventory))
+        except Exception as error:
+            self.future.set_exception(error)
+            raise
+
+    def skipped(self, producer):
+        """on_skip of merge_producers."""
+        if producer == self.list_ports:
+            self.future.set_exception(ScanStopped("ports not listed"))
+
+    def used_sgs(self):
+        """Return SgUsageIndex. Raise ScanStopped if the scan stopped before."""
+        # list_ports may not run, or not finish, when the scan stops
+        while True:
+            try:
+                return self.future.result(timeout=PRODUCER_WAIT)
+            except FutureTimeoutError:
+                if self.stop.is_set():
+                    raise ScanStopped("ports not listed") from None
+
+
+def iter_project_violations(
+    os_conn, policy, resources, cache=None, state=None, engine=None
+):
+    """
+    Check compliance rules for the project os_conn is scoped to.
+
+    Params:
+        os_conn       (openstack.connection.Connection): project scoped connection
+        policy (CompliancePolicy): project compliance rules
+        resources           (list): resources to check (sg and/or server)
+        cache       (ListingCache): optional cache for the API listings
+        state       (SgStateStore): optional security group verdicts store
+        engine  (NumpyRulesEngine): optional security group rules engine
+
+    Ports, security groups and servers are listed at the same time, and
+    each check starts as soon as its listing returns the first resources.
+    Resources are not kept after they are checked.
+
+    The listings share os_conn and its keystoneauth session, which is
+    thread safe: requests go through the connection pool of urllib3, and
+    the token is fetched under a lock, once for all the listings.
+
+    Yield Violation instances, with the cloud and region of os_conn, as soon
+    as each resource is checked.
+    """
+    inventory = Inventory(os_conn, cache)
+    cloud, region = connection_region(os_conn)
+    producers = []
+    stop = threading.Event()
+
+    ports = None
+    get_used_sgs = None
+    if "sg" in resources and policy.sg.alert_if_not_used:
+        ports = _PortsListing(inventory, stop)
+        get_used_sgs = ports.used_sgs
+        producers.append(ports.list_ports)
+
+    if "sg" in resources:
+
+        def check_sgs(emit):
+            for securitygroup in iter_sg_compliance(
+                inventory, policy.sg, get_used_sgs, state, engine
+            ):
+                for violation in securitygroup.return_violations():
+                    emit(violation._replace(cloud=cloud, region=region))
+
+        producers.append(check_sgs)
+
+    if "server" in resources:
+
+        def check_servers(emit):
+            for server in iter_servers_compliance(inventory, policy.server):
+                for violation in server.return_violations():
+                    emit(violation._replace(cloud=cloud, region=region))
+
+        producers.append(check_servers)
+
+    return merge_producers(
+        producers, stop=stop, on_skip=ports.skipped if ports is not None else None
+    )
+
+
+def scan_project(os_conn, policy, resources, cache=None, state=None, engine=None):
+    """Return a list with all Violation instances, see iter_project_violations."""
+    return list(
+        iter_project_violations(os_conn, policy, resources, cache, state, engine)
+    )
+
+
+def scan_projects(
+    os_conn,
+    targets,
+    resources,
+    *,
+    workers=8,
+    on_project_done=None,
+    cache=None,
+    state=None,
+    connections=None,
+    engine=None,
+):
+    """
+    Scan several projects in parallel.
+
+    Params:
+        os_conn (openstack.connection.Connection): connection used to create
+                                                   the project scoped connections
+        targets          (list): (project, CompliancePolicy) tuples. project is
+                                 the project name or a dict with id, name and
+                                 domain_id
+        resources        (list): resources to check (sg and/or server)
+        workers           (int): max number of projects scanned at the same time
+        on_project_done  (func): called with a ProjectScanResult instance when
+                                 each project scan finishes
+        cache    (ListingCache): optional cache for the API listings
+        state    (SgStateStore): optional security group verdicts store
+        connections      (dict): optional dict to keep the project scoped
+                                 connections, so they are reused by the next
+                                 calls with the same dict
+        engine (NumpyRulesEngine): optional security group rules engine
+
+    Yield Violation instances of all projects as soon as they are found.
+    """
+
+    def connect(project):
+        if connections is None:
+            return os_conn.connect_as_project(project)
+        key = project["id"] if isinstance(project, dict) else project
+        if key not in connections:
+            connections[key] = os_conn.connect_as_project(project)
+        return connections[key]
+
+    cloud, region = connection_region(os_conn)
+
+    def scan(project, policy, emit):
+        result = ProjectScanResult(policy.project_name, cloud=cloud, region=region)
+        start = time.monotonic()
+        try:
+            # each worker uses its own connection scoped to the project
+            project_conn = connect(project)
+            for violation in iter_project_violations(
+                project_conn, policy, resources, cache, state, engine
+            ):
+                emit(violation)
+                result.violations_count += 1
+        except _ConsumerGone:
+            raise
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.debug("Error scanning project %s", policy.project_name, exc_info=True)
+            result.error = str(error)
+        result.elapsed = time.monotonic() - start
+        if PROFILER.enabled:
+            PROFILER.record("scan.project", result.elapsed)
+        emit(result)
+
+    producers = [
+        functools.partial(scan, project, policy) for project, policy in targets
+    ]
+    for item in merge_producers(producers, workers=workers):
+        if isinstance(item, ProjectScanResult):
+            LOG.debug(
+                "Project %s scanned in %.2fs: %s violations",
+                item.project_name,
+                item.elapsed,
+                item.violations_count,
+            )
+            if on_project_done:
+                on_project_done(item)
+        else:
+            yield item
+
+
+##############################################################################
+# Scan several clouds and regions
+##############################################################################
+def scan_regions(scans, *, on_region_done=None):
+    """
+    Scan several clouds/regions in parallel, each one with its own connection.
+
+    Params:
+        scans          (list): (os_conn, scan) tuples. scan is a callable that
+                               returns an iterable with the Violation instances
+                               of the cloud and region of os_conn, e.g., a
+                               partial of scan_projects
+        on_region_done (func): called with a RegionScanResult instance when
+                               each region scan finishes
+
+    A region that fails does not stop the others, its error is reported in
+    its RegionScanResult.
+
+    Yield Violation instances of all regions as soon as they are found.
+    """
+
+    def run(os_conn, scan, emit):
+        result = RegionScanResult(*connection_region(os_conn))
+        start = time.monotonic()
+        try:
+            for violation in scan():
+                emit(violation)
+                result.violations_count += 1
+        except _ConsumerGone:
+            raise
+        except Exception as error:  # pylint: disable=broad-except
+            LOG.debug(
+                "Error scanning region %s/%s",
+                result.cloud,
+                result.region,
+                exc_info=True,
+            )
+            result.error = str(error)
+        result.elapsed = time.monotonic() - start
+        if PROFILER.enabled:
+            PROFILER.record("scan.region", result.elapsed)
+        emit(result)
+
+    producers = [functools.partial(run, os_conn, scan) for os_conn, scan in scans]
+    for item in merge_producers(producers):
+        if isinstance(item, RegionScanResult):
+            LOG.debug(
+                "Region %s/%s scanned in %.2fs: %s violations",
+                item.cloud,
+                item.region,
+                item.elapsed,
+                item.violations_count,
+            )
+            if on_region_done:
+                on_region_done(item)
+        else:
+            yield item
+
+
+# vim: ts=4
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Module to keep security group verdicts between scans."""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from ..utils.cidrtrie import CidrMatcher
+from ..utils.intervals import PortIntervals
+
+LOG = logging.getLogger(__name__)
+
+# change it when security group checks change, so stored verdicts are not used
+CHECKS_VERSION = 1
+
+# rule attributes used by the checks
+RULE_KEYS = (
+    "id",
+    "direction",
+    "ethertype",
+    "protocol",
+    "port_range_min",
+    "port_range_max",
+    "remote_ip_prefix",
+    "remote_group_id",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sg_state (
+    cloud TEXT NOT NULL,
+    region TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    sg_id TEXT NOT NULL,
+    revision_number INTEGER NOT NULL,
+    rules_hash TEXT NOT NULL,
+    policy_hash TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (cloud, region, project_id, sg_id)
+)
+"""
+
+
+def _hash(value):
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _canonical(value):
+    """Return value as JSON types, with sets sorted, to hash it."""
+    if dataclasses.is_dataclass(value):
+        return {
+            field.name: _canonical(getattr(value, field.name))
+            for field in dataclasses.fields(value)
+        }
+    if isinstance(value, CidrMatcher):
+        return sorted(value.cidrs)
+    if isinstance(value, PortIntervals):
+        return [list(interval) for interval in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(i) for i in value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(i) for i in value]
+    return value
+
+
+def sg_policy_hash(sg_policy):
+    """
+    Return hash of the security group compliance rules used by cached checks.
+
+    ignore_sg_ids, alert_if_not_used and forbid_remote_group_exposure are
+    not part of it, as ignored groups are skipped and the not used and
+    remote group exposure checks are never cached.
+    """
+    return _hash(
+        [
+            CHECKS_VERSION,
+            list(sg_policy.mandatory_tags),
+            sg_policy.forbid_redundant_rules,
+            _canonical(sg_policy.ingress),
+            _canonical(sg_policy.egress),
+        ]
+    )
+
+
+def sg_rules_hash(os_sg):
+    """Return hash of the security group tags and rules."""
+    rules = sorted(
+        ([rule.get(key) for key in RULE_KEYS] for rule in os_sg.security_group_rules),
+        key=lambda rule: str(rule[0]),
+    )
+    return _hash([sorted(os_sg.tags or []), rules])
+
+
+class SgStateStore:
+    """
+    SQLite store with the verdict of each security group.
+
+    It records the security group revision_number, a hash of its tags and
+    rules, a hash of the compliance rules and the violation messages found,
+    so a group is checked again only if one of them changed.
+
+    Params:
+        path (str): SQLite database file
+    """
+
+    def __init__(self, path):
+        """SgStateStore."""
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(SCHEMA)
+        self.replayed = 0
+        self.checked = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def lookup(self, scope, os_sg, rules_hash, policy_hash):
+        """
+        Return stored violation messages, or None if the group must be checked.
+
+        Params:
+            scope        (tuple): cloud, region and project id
+            os_sg               : security group resource
+            rules_hash     (str): hash of the group tags and rules, see sg_rules_hash
+            policy_hash    (str): hash of the compliance rules, see sg_policy_hash
+        """
+        if os_sg.revision_number is None:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT revision_number, rules_hash, policy_hash, messages "
+                "FROM sg_state WHERE cloud=? AND region=? AND project_id=? "
+                "AND sg_id=?",
+                (*scope, os_sg.id),
+            ).fetchone()
+        if row is None:
+            return None
+        if row[:3] != (os_sg.revision_number, rules_hash, policy_hash):
+            return None
+        with self.lock:
+            self.replayed += 1
+        return json.loads(row[3])
+
+    def store(self, scope, os_sg, rules_hash, policy_hash, messages):
+        """Store violation messages of a checked security group."""
+        with self.lock:
+            self.checked += 1
+            if os_sg.revision_number is None:
+                return
+            # committed by prune() and close(), not on each security group
+            self.db.execute(
+                "INSERT OR REPLACE INTO sg_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *scope,
+                    os_sg.id,
+                    os_sg.revision_number,
+                    rules_hash,
+                    policy_hash,
+                    json.dumps(list(messages)),
+                    time.time(),
+                ),
+            )
+
+    def prune(self, scope, sg_ids):
+        """Remove security groups of the project that are not in sg_ids."""
+        sg_ids = set(sg_ids)
+        with self.lock, self.db:
+            stored = self.db.execute(
+                "SELECT sg_id FROM sg_state WHERE cloud=? AND region=? "
+                "AND project_id=?",
+                scope,
+            ).fetchall()
+            removed = [(*scope, i) for (i,) in stored if i not in sg_ids]
+            self.db.executemany(
+                "DELETE FROM sg_state WHERE cloud=? AND region=? AND project_id=? "
+                "AND sg_id=?",
+                removed,
+            )
+        LOG.debug("Removed %s security groups from state store", len(removed))
+
+
+# vim: ts=4
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Module to handle binary prefix trie of networks."""
+
+import ipaddress
+
+# trie node layout: [child bit 0, child bit 1, network stored on the node]
+_ZERO, _ONE, _NETWORK = 0, 1, 2
+
+
+def _new_node():
+    return [None, None, None]
+
+
+class CidrTrie:
+    """
+    Binary prefix trie of networks of one address family.
+
+    A network overlaps another one only if one of them is a prefix of the
+    other, so an overlap query walks at most prefixlen nodes, regardless
+    of how many networks the trie holds.
+
+    Params:
+        version (int): 4 or 6
+    """
+
+    def __init__(self, version):
+        """CidrTrie."""
+        self.version = version
+        self.max_prefixlen = 32 if version == 4 else 128
+        self.root = _new_node()
+        self.size = 0
+
+    def __len__(self):
+        """Return number of networks in the trie."""
+        return self.size
+
+    def _bits(self, network):
+        """Yield network prefix bits, most significant first."""
+        address = int(network.network_address)
+        last_shift = self.max_prefixlen - network.prefixlen
+        for shift in range(self.max_prefixlen - 1, last_shift - 1, -1):
+            yield (address >> shift) & 1
+
+    def add(self, network):
+        """Add network (ipaddress.IPv4Network/IPv6Network) to the trie."""
+        if network.version != self.version:
+            raise ValueError(f"{network} is not an IPv{self.version} network")
+        node = self.root
+        for bit in self._bits(network):
+            if node[bit] is None:
+                node[bit] = _new_node()
+            node = node[bit]
+        if node[_NETWORK] is None:
+            node[_NETWORK] = network
+            self.size += 1
+
+    def find_overlap(self, network):
+        """
+        Return a network of the trie that overlaps network.
+
+        It returns a network that contains network (supernet or the same
+        network) or, if none, a network contained by it (subnet).
+        If there is no overlap, it returns None.
+        """
+        if network.version != self.version or not self.size:
+            return None
+        node = self.root
+        for bit in self._bits(network):
+            if node[_NETWORK] is not None:
+                return node[_NETWORK]
+            node = node[bit]
+            if node is None:
+                return None
+        # the trie is not empty, so every node leads to at least one network
+        while node[_NETWORK] is None:
+            node = node[_ZERO] if node[_ZERO] is not None else node[_ONE]
+        return node[_NETWORK]
+
+
+class CidrMatcher:
+    """
+    Compiled list of forbidden cidrs.
+
+    Params:
+        cidrs (list): list with cidrs (IPv4 and/or IPv6)
+    """
+
+    def __init__(self, cidrs=()):
+        """CidrMatcher."""
+        self.cidrs = frozenset(cidrs)
+        self.tries = {4: CidrTrie(4), 6: CidrTrie(6)}
+        for cidr in self.cidrs:
+            try:
+                network = ipaddress.ip_network(cidr)
+            except ValueError as error:
+                raise ValueError(f"Invalid cidr {cidr!r}: {error}") from None
+            self.tries[network.version].add(network)
+
+    def __len__(self):
+        """Return number of cidrs."""
+        return len(self.cidrs)
+
+    def __contains__(self, cidr):
+        """Return True if cidr (str) is exactly one of the cidrs."""
+        return cidr in self.cidrs
+
+    def __eq__(self, other):
+        """Compare cidrs."""
+        if not isinstance(other, CidrMatcher):
+            return NotImplemented
+        return self.cidrs == other.cidrs
+
+    def __hash__(self):
+        """Hash cidrs."""
+        return hash(self.cidrs)
+
+    def __repr__(self):
+        """Return cidrs representation."""
+        return f"CidrMatcher({sorted(self.cidrs)})"
+
+    def find_overlap(self, network):
+        """
+        Return a cidr that overlaps network or None.
+
+        Params:
+            network (str/ipaddress network): network to check
+        """
+        if isinstance(network, str):
+            network = ipaddress.ip_network(network)
+        return self.tries[network.version].find_overlap(network)
+
+
+# vim: ts=4
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Module to handle sorted port intervals."""
+
+import bisect
+
+MIN_PORT = 0
+MAX_PORT = 65535
+
+
+def parse_port_interval(value):
+    """
+    Parse a forbidden port definition.
+
+    Params:
+        value (int/str/list): single port (22), range as string ("6000-6063")
+                              or range as a two items list ([6000, 6063])
+
+    Return a tuple (first_port, last_port).
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid port definition: {value!r}")
+
+    if isinstance(value, int):
+        first = last = value
+    elif isinstance(value, str):
+        first, sep, last = value.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if sep else first
+        except ValueError:
+            raise ValueError(f"Invalid port definition: {value!r}") from None
+    elif isinstance(value, (list, tuple)) and len(value) == 2:
+        first, last = value
+        if not isinstance(first, int) or not isinstance(last, int):
+            raise ValueError(f"Invalid port definition: {value!r}")
+    else:
+        raise ValueError(f"Invalid port definition: {value!r}")
+
+    if not MIN_PORT <= first <= last <= MAX_PORT:
+        raise ValueError(
+            f"Invalid port definition: {value!r} "
+            f"(ports must be between {MIN_PORT} and {MAX_PORT})"
+        )
+
+    return (first, last)
+
+
+class PortIntervals:
+    """
+    Sorted and merged set of port intervals.
+
+    The intervals are compiled once and each query is answered with a
+    binary search, i.e., the cost does not depend on the size of the
+    port range being checked.
+
+    Params:
+        ports (list): list of ports or port ranges, see parse_port_interval
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ports=()):
+        """PortIntervals."""
+        merged = []
+        for first, last in sorted(parse_port_interval(i) for i in ports):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+
+        self.starts = tuple(i[0] for i in merged)
+        self.ends = tuple(i[1] for i in merged)
+
+    def __len__(self):
+        """Return number of intervals."""
+        return len(self.starts)
+
+    def __bool__(self):
+        """Return True if there is any interval."""
+        return bool(self.starts)
+
+    def __iter__(self):
+        """Iterate over intervals as (first_port, last_port) tuples."""
+        return iter(zip(self.starts, self.ends))
+
+    def __contains__(self, port):
+        """Return True if port is inside any interval."""
+        return bool(self.overlapping(port, port))
+
+    def __eq__(self, other):
+        """Compare intervals."""
+        if not isinstance(other, PortIntervals):
+            return NotImplemented
+        return self.starts == other.starts and self.ends == other.ends
+
+    def __hash__(self):
+        """Hash intervals."""
+        return hash((self.starts, self.ends))
+
+    def __repr__(self):
+        """Return intervals representation."""
+        return f"PortIntervals({list(self)})"
+
+    def overlapping(self, first, last):
+        """
+        Return the intervals that overlap the range first-last.
+
+        Params:
+            first (int): first port of the range
+            last  (int): last port of the range
+
+        Return a list with (first_port, last_port) tuples.
+        """
+        # first interval that ends at or after the beginning of the range
+        idx = bisect.bisect_left(self.ends, first)
+        hits = []
+        while idx < len(self.starts) and self.starts[idx] <= last:
+            hits.append((self.starts[idx], self.ends[idx]))
+            idx += 1
+        return hits
+
+
+def format_port_intervals(intervals):
+    """Return intervals as string, e.g., '21, 23, 6000-6063'."""
+    return ", ".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in intervals
+    )
+
+
+# vim: ts=4
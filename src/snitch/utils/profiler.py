@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Module to measure where the scan time goes (--profile)."""
+
+import contextlib
+import functools
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# path segments replaced by {id} in the HTTP requests names
+_ID_SEGMENT = re.compile(r"^[0-9a-fA-F-]{16,}$")
+
+
+class Histogram:
+    """
+    Latency histogram with power of two buckets in microseconds.
+
+    Bucket n counts the values from 2**(n-1) to 2**n microseconds.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        """Histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = Counter()
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+
+    def percentile(self, percent):
+        """Return upper bound in seconds of the bucket with the percentile."""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2**bucket / 1e6, self.max)
+        return self.max
+
+
+class Profiler:
+    """
+    Timings and counters of the scan phases and checks.
+
+    While disabled, timer() returns a shared no-op context manager and
+    iter_timed() returns the iterable as is, and the checks are not
+    instrumented, so the overhead is negligible.
+    """
+
+    def __init__(self):
+        """Profiler."""
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self._null_timer = contextlib.nullcontext()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = Counter()
+
+    def record(self, name, seconds):
+        """Add a latency to the histogram name."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    @contextlib.contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timer(self, name):
+        """Return context manager that records the time spent in it."""
+        if not self.enabled:
+            return self._null_timer
+        return self._timer(name)
+
+    def iter_timed(self, name, iterable):
+        """
+        Return iterable recording the time waiting for each item.
+
+        Used for the API listings: most items come from a page already
+        received, so the slow percentiles show the page requests.
+        """
+        if not self.enabled:
+            return iterable
+        return self._iter_timed(name, iterable)
+
+    def _iter_timed(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            self.count(f"{name}.items")
+            yield item
+
+    def wrap(self, name, func):
+        """Return func recording the time of each call."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        wrapper.profiled = func
+        return wrapper
+
+    def instrument(self, cls, method_names):
+        """Replace cls methods by wrappers recording their time."""
+        for method_name in method_names:
+            method = getattr(cls, method_name)
+            if not hasattr(method, "profiled"):
+                name = f"{cls.__name__}.{method_name}"
+                setattr(cls, method_name, self.wrap(name, method))
+
+    def record_http_timings(self, os_conn):
+        """
+        Record the HTTP requests timed by the connection session.
+
+        The session collects them only if the connection was created with
+        timing enabled. Ids in the URL path are replaced by {id}, so the
+        count of each name is the number of requests (pages) to it.
+        """
+        session = getattr(os_conn, "session", None)
+        get_timings = getattr(session, "get_timings", None)
+        if get_timings is None:
+            return
+        for timing in get_timings():
+            path = "/".join(
+                "{id}" if _ID_SEGMENT.match(i) else i
+                for i in urlsplit(timing.url).path.split("/")
+            )
+            self.record(f"http {timing.method} {path}", timing.elapsed.total_seconds())
+        session.reset_timings()
+
+    def report(self):
+        """Return the profile summary as text."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = [
+            f"{'name':52} {'count':>8} {'total':>9} {'mean':>9} "
+            f"{'p50':>9} {'p99':>9} {'max':>9}"
+        ]
+        for name, histogram in histograms:
+            lines.append(
+                f"{name:52} {histogram.count:8d} {histogram.total:8.3f}s "
+                f"{histogram.total / histogram.count * 1e3:7.3f}ms "
+                f"{histogram.percentile(50) * 1e3:7.3f}ms "
+                f"{histogram.percentile(99) * 1e3:7.3f}ms "
+                f"{histogram.max * 1e3:7.3f}ms"
+            )
+        for name, value in counters:
+            lines.append(f"{name:52} {value:8d}")
+        return "\n".join(lines)
+
+
+# shared instance used by the scanner
+PROFILER = Profiler()
+
+
+# vim: ts=4
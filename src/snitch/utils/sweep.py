@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Module to find ranges and networks covered by others with a sweep line."""
+
+# trie node layout: [child bit 0, child bit 1, (last, index) with the max last]
+_BEST = 2
+
+
+def find_covered(items):
+    """
+    Return dict with the index of each covered item and of an item covering it.
+
+    Item B covers item A if the range of B contains the range of A and the
+    network of B contains the network of A (same network or supernet).
+    Of two equal items, one with queryable False covers the other one, or
+    else the first one covers the second one.
+
+    Items are swept by the start of their range. When an item is reached,
+    the items starting before it are in a prefix trie of networks, where
+    each node keeps the one with the highest range end. A is covered if a
+    node in the path to its network (its supernets) ends at or after it.
+    It takes O(n log n + n * address bits), not O(n^2) comparisons.
+
+    Params:
+        items (list): (first, last, network, queryable) tuples. first-last is
+                      the range, network an ipaddress network. Items with
+                      queryable False only cover other items
+    """
+    # at the same start, wider ranges and networks first, so they are in the
+    # trie when the items they cover are reached
+    order = sorted(
+        range(len(items)),
+        key=lambda i: (
+            items[i][0],
+            -items[i][1],
+            items[i][2].prefixlen,
+            items[i][3],
+            i,
+        ),
+    )
+    roots = {}
+    covered = {}
+    for idx in order:
+        _, last, network, queryable = items[idx]
+        node = roots.setdefault(network.version, [None, None, None])
+        address = int(network.network_address)
+        shift = network.max_prefixlen
+        for depth in range(network.prefixlen + 1):
+            best = node[_BEST]
+            if queryable and best is not None and best[0] >= last:
+                covered[idx] = best[1]
+                queryable = False
+            if depth == network.prefixlen:
+                break
+            shift -= 1
+            bit = (address >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[_BEST] is None or node[_BEST][0] < last:
+            node[_BEST] = (last, idx)
+    return covered
+
+
+# vim: ts=4
@@ -16,11 +16,16 @@ color_dic = {
 }
 
 
+def load_yaml_file(filename):
+    """Read yaml file. Raise OSError if it cannot be read."""
+    with open(filename, encoding="utf-8", mode="r") as file_fd:
+        return yaml.safe_load(file_fd)
+
+
 def read_yaml_file(filename):
-    """Read yaml file."""
+    """Read yaml file. Exit if it cannot be read."""
     try:
-        with open(filename, encoding="utf-8", mode="r") as file_fd:
-            return yaml.safe_load(file_fd)
+        return load_yaml_file(filename)
     except FileNotFoundError as error:
         print(str(error))
         sys.exit(1)
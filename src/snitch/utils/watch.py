@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Module to run the scans periodically."""
+
+import os
+import threading
+import time
+
+
+class FileWatcher:
+    """
+    Detect when a file changes, using its modification time and size.
+
+    Params:
+        path (str): file to watch
+    """
+
+    def __init__(self, path):
+        """FileWatcher."""
+        self.path = path
+        self.signature = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def changed(self):
+        """
+        Return True if the file changed since the previous call.
+
+        A missing file is not a change, so a file being replaced is read
+        once it exists again.
+        """
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+    def forget(self):
+        """Make the next changed() call return True if the file exists."""
+        self.signature = None
+
+
+def run_every(interval, func, *, stop=None, max_cycles=None):
+    """
+    Call func(cycle) every interval seconds until stop is set.
+
+    Params:
+        interval     (float): seconds between the start of two cycles. If a
+                              cycle takes longer, the next one starts at once
+        func      (callable): called with the cycle number, starting at 1
+        stop (threading.Event): stop the loop when it is set
+        max_cycles     (int): stop after this number of cycles, default never
+
+    Return the number of cycles run.
+    """
+    if stop is None:
+        stop = threading.Event()
+
+    cycle = 0
+    while not stop.is_set():
+        cycle += 1
+        start = time.monotonic()
+        func(cycle)
+        if max_cycles is not None and cycle >= max_cycles:
+            break
+        stop.wait(max(0.0, interval - (time.monotonic() - start)))
+
+    return cycle
+
+
+# vim: ts=4
@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 """Module that defines Violation structure."""
 
-from dataclasses import asdict, dataclass
+from array import array
+from typing import NamedTuple
 
 
-@dataclass(frozen=True)
-class Violation:
-    """Violation structure."""
+class Violation(NamedTuple):
+    """Violation structure. cloud and region are set by the scanner."""
 
     project_name: str
     resource_type: str
@@ -14,10 +14,75 @@ class Violation:
     resource_id: str
     resource_created_at: str
     message: str
+    cloud: str = ""
+    region: str = ""
 
     @property
     def to_dict(self):
-        return asdict(self)
+        return dict(zip(self._fields, self))
+
+
+class ViolationStore:
+    """
+    Compact store of violations.
+
+    Values are dictionary encoded: each distinct value (project name,
+    resource type, message, ...) is kept once, and each field is an array
+    with 4 bytes indexes into the distinct values. Violations are rebuilt
+    when iterating, in the order they were added.
+
+    Params:
+        violations (iterable): Violation objects to add
+    """
+
+    __slots__ = ("_index", "_values", "_columns")
+
+    def __init__(self, violations=()):
+        """ViolationStore."""
+        self.clear()
+        self.extend(violations)
+
+    def _encode(self, value):
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self._values)
+            self._values.append(value)
+        return index
+
+    def append(self, violation):
+        """Add a violation."""
+        for column, value in zip(self._columns, violation):
+            column.append(self._encode(value))
+
+    def extend(self, violations):
+        """Add all violations."""
+        for violation in violations:
+            self.append(violation)
+
+    def clear(self):
+        """Remove all violations."""
+        self._index = {}
+        self._values = []
+        self._columns = tuple(array("I") for _ in Violation._fields)
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def __iter__(self):
+        values = self._values
+        for row in zip(*self._columns):
+            yield Violation._make(values[i] for i in row)
+
+    def column(self, field):
+        """Yield the values of a field, without building Violation objects."""
+        values = self._values
+        for i in self._columns[Violation._fields.index(field)]:
+            yield values[i]
+
+    @property
+    def distinct_values(self):
+        """Return number of distinct values kept."""
+        return len(self._values)
 
 
 # vim: ts=4
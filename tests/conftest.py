@@ -6,6 +6,43 @@ from unittest.mock import MagicMock
 import pytest
 
 
+def _make_os_sg(sg_id, tags, rules=()):
+    os_sg = MagicMock()
+    os_sg.id = sg_id
+    os_sg.name = f"name-{sg_id}"
+    os_sg.created_at = "2000-01-01T00:00:00Z"
+    os_sg.updated_at = "2000-01-01T00:00:00Z"
+    os_sg.revision_number = 1
+    os_sg.tags = tags
+    os_sg.security_group_rules = list(rules)
+    return os_sg
+
+
+def _make_os_conn(project_name, os_sgs, used_sgs_ids=()):
+    os_conn = MagicMock()
+    os_conn.config.name = "my_cloud"
+    os_conn.config.region_name = "my_region"
+    os_conn.current_project.id = f"id-{project_name}"
+    os_conn.current_project.name = project_name
+    os_conn.network.security_groups.return_value = os_sgs
+    port = MagicMock()
+    port.security_group_ids = list(used_sgs_ids)
+    os_conn.network.ports.return_value = [port]
+    return os_conn
+
+
+@pytest.fixture(name="make_os_sg")
+def fixture_make_os_sg():
+    """Return function to build an openstack security group mock."""
+    return _make_os_sg
+
+
+@pytest.fixture(name="make_os_conn")
+def fixture_make_os_conn():
+    """Return function to build a project scoped connection mock."""
+    return _make_os_conn
+
+
 @pytest.fixture(name="sg_compliance_rules")
 def fixture_sg_compliance_rules():
     sg_rules = {
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Test benchmarks generator and runner."""
+
+import json
+import multiprocessing
+
+from benchmarks import bench_checks, bench_startup
+from benchmarks.generator import FakeConnection, FakeInventory
+from snitch.inventory.inventory import Inventory
+from snitch.scanner.scanner import return_all_used_sgs
+
+
+def test_fake_inventory_is_seeded():
+    first = FakeInventory(1, sgs=20, servers=10)
+    second = FakeInventory(1, sgs=20, servers=10)
+    other = FakeInventory(2, sgs=20, servers=10)
+
+    assert first.security_groups == second.security_groups
+    assert first.servers == second.servers
+    assert first.security_groups != other.security_groups
+    assert len(first.security_groups) == 20
+    assert first.rules_count == sum(
+        len(i.security_group_rules) for i in first.security_groups
+    )
+
+
+def test_fake_connection():
+    inventory = FakeInventory(1, sgs=50, servers=10, unused_ratio=0.5)
+    os_conn = FakeConnection([inventory])
+
+    used_sgs = return_all_used_sgs(Inventory(os_conn))
+    assert 0 < len(used_sgs) < 50
+    missing_team = os_conn.network.security_groups(not_tags="Team")
+    assert all("Team" not in i.tags for i in missing_team)
+    assert os_conn.connect_as_project("project_1").current_project.name == "project_1"
+
+
+def test_bench_checks(tmp_path):
+    output = tmp_path / "results.json"
+    args = ["--sgs", "20", "--servers", "10", "--repeat", "1"]
+    assert bench_checks.main(args + ["--output", str(output)]) == 0
+
+    results = json.loads(output.read_text())
+    assert set(results["results"]) == set(bench_checks.BENCHMARKS)
+    assert results["inventory"]["security_groups"] == 20
+    assert results["results"]["scan_project"]["peak_memory_bytes"] > 0
+    # the process engine workers are stopped
+    assert not multiprocessing.active_children()
+
+    # a baseline 1000 times faster than current fails the comparison
+    for result in results["results"].values():
+        result["seconds"] /= 1000
+    output.write_text(json.dumps(results))
+    args += ["--bench", "sg_ingress", "--compare", str(output), "--max-ratio", "2"]
+    assert bench_checks.main(args) == 1
+
+
+def test_startup_imports_are_lazy():
+    result = bench_startup.run_startup_benchmark(1)
+    assert result["seconds"] > 0
+    assert result["lazy_loaded"] == []
+
+
+# vim: ts=4
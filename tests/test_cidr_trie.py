@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Test CidrTrie and CidrMatcher classes."""
+
+import ipaddress
+import random
+
+import pytest
+
+from snitch.utils.cidrtrie import CidrMatcher, CidrTrie
+
+
+@pytest.mark.parametrize(
+    "forbidden, remote_cidr, result",
+    [
+        (["0.0.0.0/0"], "10.0.0.0/8", "0.0.0.0/0"),
+        (["10.0.0.0/8"], "10.1.2.0/24", "10.0.0.0/8"),
+        (["10.1.2.0/24"], "10.0.0.0/8", "10.1.2.0/24"),
+        (["10.1.2.0/24"], "10.1.2.0/24", "10.1.2.0/24"),
+        (["10.1.2.0/24"], "10.1.3.0/24", None),
+        (["10.1.2.0/24", "192.168.0.0/16"], "192.168.10.1/32", "192.168.0.0/16"),
+        (["::/0"], "10.0.0.0/8", None),
+        (["0.0.0.0/0"], "2001:db8::/32", None),
+        (["2001:db8::/32"], "2001:db8:1::/48", "2001:db8::/32"),
+        (["2001:db8:1::/48"], "2001:db8::/32", "2001:db8:1::/48"),
+        (["2001:db8::/32"], "2001:db9::/32", None),
+        (["2001:db8::/32", "10.0.0.0/8"], "::/0", "2001:db8::/32"),
+        # no network of the address family, /0 queries walk no bits
+        (["0.0.0.0/0"], "::/0", None),
+        (["10.0.0.0/8"], "::/0", None),
+        (["::/0"], "0.0.0.0/0", None),
+        ([], "0.0.0.0/0", None),
+        ([], "::/0", None),
+        ([], "10.0.0.0/8", None),
+    ],
+)
+def test_cidr_matcher_find_overlap(forbidden, remote_cidr, result):
+    matcher = CidrMatcher(forbidden)
+    overlap = matcher.find_overlap(remote_cidr)
+    assert overlap == (ipaddress.ip_network(result) if result else None)
+
+
+def test_cidr_matcher_exact_match():
+    matcher = CidrMatcher(["0.0.0.0/0", "10.0.0.0/8"])
+    assert "10.0.0.0/8" in matcher
+    assert "10.0.0.0/16" not in matcher
+    assert len(matcher) == 2
+
+
+def test_cidr_matcher_invalid_cidr():
+    with pytest.raises(ValueError):
+        CidrMatcher(["10.0.0.1/8"])
+
+
+def test_cidr_trie_wrong_version():
+    with pytest.raises(ValueError):
+        CidrTrie(4).add(ipaddress.ip_network("::/0"))
+
+
+def test_cidr_trie_empty():
+    assert CidrTrie(6).find_overlap(ipaddress.ip_network("::/0")) is None
+    assert CidrTrie(4).find_overlap(ipaddress.ip_network("0.0.0.0/0")) is None
+
+
+def test_cidr_trie_same_result_as_overlaps():
+    """Compare trie answers with ipaddress linear scan."""
+    rnd = random.Random(42)
+    forbidden = [
+        ipaddress.ip_network((rnd.getrandbits(32), rnd.randint(8, 28)), strict=False)
+        for _ in range(200)
+    ]
+    trie = CidrTrie(4)
+    for network in forbidden:
+        trie.add(network)
+
+    for _ in range(500):
+        network = ipaddress.ip_network(
+            (rnd.getrandbits(32), rnd.randint(0, 32)), strict=False
+        )
+        expected = any(i.overlaps(network) for i in forbidden)
+        overlap = trie.find_overlap(network)
+        assert (overlap is not None) == expected
+        if overlap is not None:
+            assert overlap.overlaps(network)
+
+
+# vim: ts=4
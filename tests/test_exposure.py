@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Test ingress exposure through remote security groups."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from snitch.policy.policy import compile_policy
+from snitch.scanner.exposure import RemoteGroupGraph
+
+
+def make_rule(rule_id, **kwargs):
+    rule = {
+        "id": rule_id,
+        "direction": "ingress",
+        "protocol": "tcp",
+        "port_range_min": 22,
+        "port_range_max": 22,
+        "remote_ip_prefix": "10.0.0.0/24",
+        "remote_group_id": None,
+    }
+    rule.update(kwargs)
+    return rule
+
+
+def group_rule(remote_group_id):
+    return make_rule(
+        f"to-{remote_group_id}", remote_ip_prefix=None, remote_group_id=remote_group_id
+    )
+
+
+def make_os_sg(sg_id, rules=()):
+    return SimpleNamespace(id=sg_id, security_group_rules=list(rules))
+
+
+def ingress_policy(forbid_cidrs=("0.0.0.0/0",), match_subnets=False):
+    sg_rules = {
+        "mandatory_tags": [],
+        "alert_if_not_used": False,
+        "ingress": {
+            "forbid_cidrs": list(forbid_cidrs),
+            "forbid_cidrs_match_subnets": match_subnets,
+            "max_netmask_allowed": None,
+            "forbid_tcp_port": [],
+            "forbid_udp_port": [],
+            "max_number_port_per_rule": None,
+            "forbid_all_ports": False,
+            "forbid_all_protocols": False,
+        },
+        "egress": {"forbid_cidrs": [], "forbid_cidrs_match_subnets": False},
+    }
+    return compile_policy({"my_project": {"sg": sg_rules}}, "my_project").sg.ingress
+
+
+def test_chain():
+    os_sgs = [
+        make_os_sg("web", [make_rule("any", remote_ip_prefix="0.0.0.0/0")]),
+        make_os_sg("app", [group_rule("web")]),
+        make_os_sg("db", [group_rule("app"), make_rule("ssh")]),
+        make_os_sg("backup", [make_rule("ssh")]),
+    ]
+    graph = RemoteGroupGraph(os_sgs, ingress_policy())
+    # its own rules are reported by the forbidden cidr check
+    assert graph.exposed_cidrs("web") == []
+    assert graph.exposed_cidrs("app") == ["0.0.0.0/0"]
+    assert graph.exposed_cidrs("db") == ["0.0.0.0/0"]
+    assert graph.exposed_cidrs("backup") == []
+    assert graph.exposed_cidrs("unknown") == []
+
+
+def test_cycle():
+    os_sgs = [
+        make_os_sg("a", [group_rule("b"), group_rule("a")]),
+        make_os_sg("b", [group_rule("c")]),
+        make_os_sg("c", [group_rule("a"), make_rule("any", remote_ip_prefix=None)]),
+        make_os_sg("d", [group_rule("d"), make_rule("any", remote_ip_prefix=None)]),
+    ]
+    graph = RemoteGroupGraph(os_sgs, ingress_policy())
+    assert graph.exposed_cidrs("a") == ["0.0.0.0/0"]
+    assert graph.exposed_cidrs("b") == ["0.0.0.0/0"]
+    # through a -> b -> c
+    assert graph.exposed_cidrs("c") == ["0.0.0.0/0"]
+    # self references are ignored
+    assert graph.exposed_cidrs("d") == []
+
+
+@pytest.mark.parametrize(
+    "match_subnets, expected",
+    [(False, ["192.168.0.0/16"]), (True, ["10.0.0.0/8", "192.168.0.0/16"])],
+)
+def test_match_subnets(match_subnets, expected):
+    os_sgs = [
+        make_os_sg("a", [group_rule("b"), group_rule("c"), group_rule("other")]),
+        make_os_sg("b", [make_rule("net", remote_ip_prefix="10.1.0.0/16")]),
+        make_os_sg("c", [make_rule("net", remote_ip_prefix="192.168.0.0/16")]),
+        make_os_sg("e", [make_rule("net", direction="egress", remote_ip_prefix=None)]),
+        make_os_sg("f", [group_rule("e")]),
+    ]
+    graph = RemoteGroupGraph(
+        os_sgs, ingress_policy(["10.0.0.0/8", "192.168.0.0/16"], match_subnets)
+    )
+    assert graph.exposed_cidrs("a") == expected
+    assert graph.exposed_cidrs("f") == []
+
+
+@pytest.mark.parametrize("match_subnets", [False, True])
+def test_any_address_ethertype(match_subnets):
+    """A rule without remote_ip_prefix allows any address of its ethertype."""
+    os_sgs = [
+        make_os_sg("v4", [make_rule("any", remote_ip_prefix=None, ethertype="IPv4")]),
+        make_os_sg("v6", [make_rule("any", remote_ip_prefix=None, ethertype="IPv6")]),
+        make_os_sg("a", [group_rule("v4")]),
+        make_os_sg("b", [group_rule("v6")]),
+    ]
+    graph = RemoteGroupGraph(
+        os_sgs, ingress_policy(["0.0.0.0/0", "::/0"], match_subnets)
+    )
+    assert graph.exposed_cidrs("a") == ["0.0.0.0/0"]
+    assert graph.exposed_cidrs("b") == ["::/0"]
+
+    graph = RemoteGroupGraph(os_sgs, ingress_policy(["::/0"], match_subnets))
+    assert graph.exposed_cidrs("a") == []
+    assert graph.exposed_cidrs("b") == ["::/0"]
+
+
+def test_invalid_prefix():
+    os_sgs = [
+        make_os_sg("a", [make_rule("bad", remote_ip_prefix="10.0.0.1/8")]),
+        make_os_sg("b", [group_rule("a")]),
+    ]
+    graph = RemoteGroupGraph(os_sgs, ingress_policy(["10.0.0.0/8"], True))
+    assert graph.exposed_cidrs("b") == []
+
+
+def test_many_groups():
+    """A long chain and a large cycle are resolved without recursion."""
+    count = 5000
+    os_sgs = [
+        make_os_sg(f"chain-{i}", [group_rule(f"chain-{i + 1}")]) for i in range(count)
+    ]
+    os_sgs.append(
+        make_os_sg(f"chain-{count}", [make_rule("any", remote_ip_prefix=None)])
+    )
+    os_sgs.extend(
+        make_os_sg(f"cycle-{i}", [group_rule(f"cycle-{(i + 1) % count}")])
+        for i in range(count)
+    )
+    os_sgs[-1].security_group_rules.append(group_rule("chain-0"))
+
+    graph = RemoteGroupGraph(os_sgs, ingress_policy())
+    assert all(graph.exposed_cidrs(f"chain-{i}") == ["0.0.0.0/0"] for i in range(count))
+    assert all(graph.exposed_cidrs(f"cycle-{i}") == ["0.0.0.0/0"] for i in range(count))
+    assert graph.exposed_cidrs(f"chain-{count}") == []
+
+
+# vim: ts=4
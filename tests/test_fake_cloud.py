@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Test fake OpenStack API."""
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.fake_cloud import FakeCloud, create_inventories
+
+
+@pytest.fixture(name="fake_cloud")
+def fixture_fake_cloud(request):
+    options = getattr(request, "param", {})
+    inventories = create_inventories(1, 2, sgs=25, servers=10)
+    server = FakeCloud(("127.0.0.1", 0), inventories, **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["X-Auth-Token"] = token
+    data = json.dumps(body).encode() if body is not None else None
+    with urllib.request.urlopen(
+        urllib.request.Request(url, data=data, headers=headers), timeout=5
+    ) as response:
+        return response.headers, json.loads(response.read())
+
+
+def get_token(fake_cloud, project_name="project_1"):
+    scope = {"project": {"name": project_name, "domain": {"name": "Default"}}}
+    headers, body = request(
+        f"{fake_cloud.base_url}/v3/auth/tokens",
+        {"auth": {"identity": {"methods": ["password"]}, "scope": scope}},
+    )
+    return headers["X-Subject-Token"], body["token"]
+
+
+def list_all(url, key, token):
+    resources, requests = [], 0
+    while url:
+        _, body = request(url, token=token)
+        requests += 1
+        resources.extend(body[key])
+        url = next(
+            (i["href"] for i in body.get(f"{key}_links", []) if i["rel"] == "next"),
+            None,
+        )
+    return resources, requests
+
+
+def test_fake_cloud_auth(fake_cloud):
+    _, token = get_token(fake_cloud, "project_2")
+    assert token["project"]["name"] == "project_2"
+    services = {i["type"]: i["endpoints"][0]["url"] for i in token["catalog"]}
+    assert services["network"] == f"{fake_cloud.base_url}/network"
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(f"{fake_cloud.base_url}/network/v2.0/ports", token="invalid")
+    assert error.value.code == 401
+
+
+@pytest.mark.parametrize("fake_cloud", [{"page_size": 7}], indirect=True)
+def test_fake_cloud_pagination(fake_cloud):
+    token, body = get_token(fake_cloud)
+    project_id = body["project"]["id"]
+    inventory = fake_cloud.projects[project_id]
+
+    url = f"{fake_cloud.base_url}/network/v2.0/security-groups?project_id={project_id}"
+    sgs, requests = list_all(url, "security_groups", token)
+    assert [i["id"] for i in sgs] == [i.id for i in inventory.security_groups]
+    assert requests == 4
+
+    url = f"{fake_cloud.base_url}/compute/v2.1/servers/detail?limit=3&not-tags=Team"
+    servers, _ = list_all(url, "servers", token)
+    expected = [i.id for i in inventory.servers if "Team" not in i.tags]
+    assert [i["id"] for i in servers] == expected
+
+    url = f"{fake_cloud.base_url}/network/v2.0/ports?fields=id&fields=security_groups"
+    ports, _ = list_all(url, "ports", token)
+    assert len(ports) == len(inventory.ports)
+    assert set(ports[0]) == {"id", "security_groups"}
+
+    _, stats = request(f"{fake_cloud.base_url}/_stats")
+    assert stats["GET /network/v2.0/security-groups"] == 4
+    assert stats["POST /v3/auth/tokens"] == 1
+
+
+@pytest.mark.parametrize(
+    "fake_cloud", [{"latency": 0.1, "error_rate": 1.0}], indirect=True
+)
+def test_fake_cloud_latency_and_errors(fake_cloud):
+    start = time.monotonic()
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(f"{fake_cloud.base_url}/v3")
+    assert error.value.code == 503
+    assert time.monotonic() - start >= 0.1
+    assert fake_cloud.stats["errors"] == 1
+
+
+# vim: ts=4
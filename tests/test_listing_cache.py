@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Test ListingCache class."""
+
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from snitch.inventory.cache import ListingCache
+
+KEY = ("mycloud", "RegionOne", "project_id", "servers")
+FIELDS = ("id", "tags", "metadata")
+
+
+def make_fetch(calls):
+    def fetch():
+        calls.append(1)
+        yield SimpleNamespace(id="s1", name="x", tags=["Team"], metadata={"a": "1"})
+        yield SimpleNamespace(id="s2", name="y", tags=[], metadata={})
+
+    return fetch
+
+
+def test_listing_cache_miss_and_hit(tmp_path):
+    cache = ListingCache(str(tmp_path), max_age=60)
+    calls = []
+
+    first = list(cache.listing(KEY, FIELDS, make_fetch(calls)))
+    second = list(cache.listing(KEY, FIELDS, make_fetch(calls)))
+
+    assert len(calls) == 1
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert [i.id for i in first] == ["s1", "s2"]
+    assert [vars(i) for i in second] == [
+        {"id": "s1", "tags": ["Team"], "metadata": {"a": "1"}},
+        {"id": "s2", "tags": [], "metadata": {}},
+    ]
+    assert os.path.exists(
+        tmp_path / "mycloud" / "RegionOne" / "project_id" / "servers.jsonl.gz"
+    )
+
+
+def test_listing_cache_expired(tmp_path):
+    cache = ListingCache(str(tmp_path), max_age=60)
+    calls = []
+    list(cache.listing(KEY, FIELDS, make_fetch(calls)))
+
+    old = time.time() - 120
+    os.utime(cache.path(KEY), (old, old))
+    list(cache.listing(KEY, FIELDS, make_fetch(calls)))
+
+    assert len(calls) == 2
+
+
+def test_listing_cache_different_fields(tmp_path):
+    cache = ListingCache(str(tmp_path), max_age=60)
+    calls = []
+    list(cache.listing(KEY, FIELDS, make_fetch(calls)))
+    result = list(cache.listing(KEY, ("id", "name"), make_fetch(calls)))
+
+    assert len(calls) == 2
+    assert result[0].name == "x"
+
+
+def test_listing_cache_incomplete_listing_not_stored(tmp_path):
+    cache = ListingCache(str(tmp_path), max_age=60)
+
+    def fetch():
+        yield SimpleNamespace(id="s1", tags=[], metadata={})
+        raise RuntimeError("API error")
+
+    with pytest.raises(RuntimeError):
+        list(cache.listing(KEY, FIELDS, fetch))
+
+    assert not os.path.exists(cache.path(KEY))
+    assert os.listdir(os.path.dirname(cache.path(KEY))) == []
+
+
+def test_listing_cache_safe_path(tmp_path):
+    cache = ListingCache(str(tmp_path), max_age=60)
+    path = cache.path(("..", "region/1", "id", "ports"))
+    assert os.path.relpath(path, str(tmp_path)).split(os.sep) == [
+        "__",
+        "region_1",
+        "id",
+        "ports.jsonl.gz",
+    ]
+
+
+# vim: ts=4
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""Test notification backends."""
+
+import csv
+import dataclasses
+import gzip
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from influxdb import InfluxDBClient
+
+from snitch.notification import notification as notification_registry
+from snitch.notification.dispatcher import dispatch_violations
+from snitch.notification.influxdb import (
+    InfluxdbClient,
+    InfluxdbError,
+    InfluxdbWriter,
+    fmt_violation_line,
+)
+from snitch.notification.notificationbase import NotificationBase, SendAbandoned
+from snitch.notification.stdout import Stdout
+from snitch.violation.violation import Violation
+
+
+class ListNotification(NotificationBase):
+    def __init__(self):
+        self.events = []
+
+    def open(self):
+        self.events.append("open")
+
+    def write_violation(self, violation):
+        self.events.append(violation.resource_id)
+
+    def close(self):
+        self.events.append("close")
+
+
+def make_violation(resource_id):
+    return Violation(
+        project_name="my_project",
+        resource_type="SG",
+        resource_name=f"name-{resource_id}",
+        resource_id=resource_id,
+        resource_created_at="2000-01-01T00:00:00Z",
+        message="Security group not used",
+    )
+
+
+def test_send_violations_streams_generator():
+    notification = ListNotification()
+
+    def violations():
+        yield make_violation("sg1")
+        # first violation was written before the generator resumed
+        assert notification.events == ["open", "sg1"]
+        yield make_violation("sg2")
+
+    notification.send_violations(violations())
+
+    assert notification.events == ["open", "sg1", "sg2", "close"]
+
+
+class SlowNotification(ListNotification):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def write_violation(self, violation):
+        time.sleep(self.delay)
+        super().write_violation(violation)
+
+
+class FailNotification(ListNotification):
+    def write_violation(self, violation):
+        raise RuntimeError("backend down")
+
+
+def test_dispatch_violations_concurrently():
+    notifications = {"slow1": SlowNotification(0.05), "slow2": SlowNotification(0.05)}
+    violations = [make_violation(f"sg{i}") for i in range(10)]
+
+    start = time.monotonic()
+    reports = dispatch_violations(notifications, violations)
+    elapsed = time.monotonic() - start
+
+    # backends run at the same time: about 0.5s instead of 1s
+    assert elapsed < 0.9
+    expected = ["open"] + [f"sg{i}" for i in range(10)] + ["close"]
+    assert notifications["slow1"].events == expected
+    assert notifications["slow2"].events == expected
+    assert [(i.backend, i.delivered, i.failed) for i in reports] == [
+        ("slow1", 10, False),
+        ("slow2", 10, False),
+    ]
+
+
+def test_dispatch_violations_backend_failure():
+    notifications = {"fail": FailNotification(), "list": ListNotification()}
+    violations = [make_violation(f"sg{i}") for i in range(3)]
+
+    reports = dispatch_violations(notifications, violations)
+
+    assert reports[0].error == "backend down"
+    assert reports[0].delivered == 0
+    assert notifications["fail"].events == ["open", "close"]
+    assert not reports[1].failed
+    assert reports[1].delivered == 3
+
+
+def test_dispatch_violations_timeout():
+    notifications = {"slow": SlowNotification(0.6), "list": ListNotification()}
+    violations = [make_violation(f"sg{i}") for i in range(20)]
+
+    start = time.monotonic()
+    reports = dispatch_violations(notifications, violations, timeout=0.3, maxsize=2)
+
+    assert time.monotonic() - start < 1.5
+    assert reports[0].error == "timeout"
+    assert reports[0].delivered < 20
+    assert not reports[1].failed
+    assert reports[1].delivered == 20
+
+    # the abandoned backend stops without flushing, its report is kept
+    report = dataclasses.replace(reports[0])
+    time.sleep(0.8)
+    assert reports[0] == report
+    assert "close" not in notifications["slow"].events
+    assert len(notifications["slow"].events) < 21
+
+
+def test_send_violations_abandoned():
+    notification = ListNotification()
+
+    def violations():
+        yield make_violation("sg1")
+        raise SendAbandoned()
+
+    with pytest.raises(SendAbandoned):
+        notification.send_violations(violations())
+    assert notification.events == ["open", "sg1"]
+
+    notification = ListNotification()
+    with pytest.raises(RuntimeError):
+        notification.send_violations(FailNotification().write_violation(i) for i in "a")
+    assert notification.events == ["open", "close"]
+
+
+class InfluxdbStub(ThreadingHTTPServer):
+    """Local stand-in for InfluxDB /write endpoint."""
+
+    def __init__(self, fail_first=0, fail_status=503):
+        super().__init__(("127.0.0.1", 0), InfluxdbStubHandler)
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.requests = []
+        self.lines = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class InfluxdbStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):  # noqa: N802
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.server.requests.append((self.path, dict(self.headers), body))
+        if self.server.fail_first:
+            self.server.fail_first -= 1
+            self.send_response(self.server.fail_status)
+            self.end_headers()
+            self.wfile.write(b'{"error": "stub failure"}')
+            return
+        self.server.lines.extend(body.decode().splitlines())
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture(name="influxdb_stub")
+def fixture_influxdb_stub(request):
+    stub = InfluxdbStub(**getattr(request, "param", {}))
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+
+def test_fmt_violation_line():
+    violation = Violation(
+        project_name="my project",
+        resource_type="SG",
+        resource_name="",
+        resource_id="xxxx",
+        resource_created_at='2000-01-01"',
+        message="rule id 1 - Forbidden cidr ingress, a=b",
+    )
+    assert fmt_violation_line(violation, 946684800) == (
+        r"SG,message=rule\ id\ 1\ -\ Forbidden\ cidr\ ingress\,\ a\=b,"
+        r"project_name=my\ project,resource_id=xxxx "
+        r'resource_created_at="2000-01-01\"" 946684800'
+    )
+    assert fmt_violation_line(
+        violation._replace(cloud="my_cloud", region="RegionOne"), 1
+    ).startswith(r"SG,cloud=my_cloud,message=")
+
+
+@pytest.mark.parametrize(
+    "resource_name, expected",
+    [
+        ("web,db", r"web\,db"),
+        ("web db", r"web\ db"),
+        ("a=b", r"a\=b"),
+        ("web\ndb", r"web\ndb"),
+        ("web\\", r"web\\"),
+        ("c:\\,=", r"c:\\\,\="),
+    ],
+)
+def test_fmt_violation_line_escape(resource_name, expected):
+    violation = make_violation("sg1")._replace(
+        resource_type="S G,", resource_name=resource_name, message=""
+    )
+    line = fmt_violation_line(violation, 1)
+    assert "\n" not in line
+    assert line == (
+        r"S\ G\,,project_name=my_project,resource_id=sg1,"
+        f'resource_name={expected} resource_created_at="2000-01-01T00:00:00Z" 1'
+    )
+
+
+def influxdb_writer(stub, **kwargs):
+    client = InfluxDBClient(
+        *stub.server_address,
+        username="user",
+        password="pass",
+        database="snitch",
+        gzip=True,
+        retries=1,
+    )
+    return InfluxdbWriter(client, **kwargs)
+
+
+def test_influxdb_writer_batches(influxdb_stub):
+    writer = influxdb_writer(influxdb_stub, batch_size=3)
+    for i in range(7):
+        writer.write(f'SG,resource_id=sg{i} resource_created_at="x" 1')
+    writer.flush()
+
+    assert writer.points_written == 7
+    assert len(influxdb_stub.requests) == 3
+    path, headers, _ = influxdb_stub.requests[0]
+    assert path == "/write?db=snitch&precision=s"
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Authorization"] == "Basic dXNlcjpwYXNz"
+    assert len(influxdb_stub.lines) == 7
+
+
+def test_influxdb_writer_batch_bytes(influxdb_stub):
+    writer = influxdb_writer(influxdb_stub, batch_bytes=100)
+    for i in range(10):
+        writer.write(f"SG,resource_id=sg{i:02} value=1 1")  # 29 bytes + newline
+    writer.flush()
+
+    assert [len(body.splitlines()) for _, _, body in influxdb_stub.requests] == [
+        3,
+        3,
+        3,
+        1,
+    ]
+    assert all(len(body) <= 100 for _, _, body in influxdb_stub.requests)
+
+
+@pytest.mark.parametrize("influxdb_stub", [{"fail_first": 2}], indirect=True)
+def test_influxdb_writer_retry(influxdb_stub):
+    writer = influxdb_writer(influxdb_stub, retries=2, backoff=0)
+    writer.write("SG value=1 1")
+    writer.flush()
+
+    assert len(influxdb_stub.requests) == 3
+    assert influxdb_stub.lines == ["SG value=1 1"]
+
+
+@pytest.mark.parametrize(
+    "influxdb_stub", [{"fail_first": 1, "fail_status": 400}], indirect=True
+)
+def test_influxdb_writer_no_retry_client_error(influxdb_stub):
+    writer = influxdb_writer(influxdb_stub, retries=2, backoff=0)
+    writer.write("SG value=1 1")
+    with pytest.raises(InfluxdbError, match="HTTP 400"):
+        writer.flush()
+    assert len(influxdb_stub.requests) == 1
+
+
+def set_influx_env(influxdb_stub, monkeypatch, **env):
+    host, port = influxdb_stub.server_address
+    for var, value in {
+        "INFLUX_HOST": host,
+        "INFLUX_PORT": str(port),
+        "INFLUX_USERNAME": "user",
+        "INFLUX_PASSWORD": "pass",
+        "INFLUX_DATABASE": "snitch",
+        **env,
+    }.items():
+        monkeypatch.setenv(var, value)
+
+
+def test_influxdb_client_shared_timestamp(influxdb_stub, monkeypatch, capsys):
+    set_influx_env(influxdb_stub, monkeypatch)
+
+    client = InfluxdbClient()
+    client.send_violations([make_violation("sg1"), make_violation("sg2")])
+
+    assert len(influxdb_stub.requests) == 1
+    timestamps = {line.rsplit(" ", 1)[1] for line in influxdb_stub.lines}
+    assert len(influxdb_stub.lines) == 2
+    assert len(timestamps) == 1
+    assert not capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "influxdb_stub", [{"fail_first": 10, "fail_status": 400}], indirect=True
+)
+def test_influxdb_client_failed_batch_not_retried_on_close(influxdb_stub, monkeypatch):
+    set_influx_env(influxdb_stub, monkeypatch, INFLUX_BATCH_BYTES="1")
+
+    client = InfluxdbClient()
+    with pytest.raises(InfluxdbError, match="HTTP 400"):
+        client.send_violations([make_violation("sg1"), make_violation("sg2")])
+
+    # the failed batch is not sent again by close()
+    assert len(influxdb_stub.requests) == 1
+    assert not influxdb_stub.lines
+    assert client.writer.points_dropped == 1
+
+
+class StreamSpy(io.StringIO):
+    """StringIO that counts the write calls."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def test_stdout_jsonl():
+    stream = StreamSpy()
+    violations = [make_violation("sg1"), make_violation("sg2")]
+    Stdout(stdout_fmt="jsonl", stdout_stream=stream).send_violations(violations)
+
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(i) for i in lines] == [i.to_dict for i in violations]
+    # small outputs are written at once when the backend is closed
+    assert stream.writes == 1
+
+
+def test_stdout_csv():
+    stream = io.StringIO()
+    violations = [make_violation("sg1"), make_violation("sg,2")]
+    Stdout(stdout_fmt="csv", stdout_stream=stream).send_violations(violations)
+
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    assert rows == [i.to_dict for i in violations]
+
+
+def test_stdout_jsonl_streams():
+    stream = StreamSpy()
+    notification = Stdout(stdout_fmt="jsonl", stdout_stream=stream)
+
+    def violations():
+        for i in range(5000):
+            yield make_violation(f"sg{i}")
+        # buffer was written before the last violation
+        assert stream.writes > 0
+
+    notification.send_violations(violations())
+    assert len(stream.getvalue().splitlines()) == 5000
+
+
+def test_stdout_dict():
+    stream = io.StringIO()
+    violation = make_violation("sg1")
+    Stdout(stdout_fmt="dict", stdout_stream=stream).send_violations([violation])
+    assert stream.getvalue() == f"{violation.to_dict}\n"
+
+
+def test_stdout_table_max_rows():
+    pytest.importorskip("rich")
+    stream = io.StringIO()
+    notification = Stdout(stdout_fmt="table", stdout_max_rows=2, stdout_stream=stream)
+    notification.send_violations(make_violation(f"sg{i}") for i in range(5))
+
+    output = stream.getvalue()
+    assert "sg1" in output
+    assert "sg2" not in output
+    assert "Showing 2 of 5 violations" in output
+
+
+def test_stdout_invalid_format():
+    with pytest.raises(ValueError, match="Invalid stdout format"):
+        Stdout(stdout_fmt="xml")
+
+
+##############################################################################
+# Notification systems registry
+##############################################################################
+class FakeEntryPoint:  # pylint: disable=too-few-public-methods
+    def __init__(self, name, cls):
+        self.name = name
+        self.cls = cls
+
+    def load(self):
+        return self.cls
+
+
+def test_create_notification(monkeypatch):
+    monkeypatch.setattr(notification_registry, "_entry_points", dict)
+    assert notification_registry.available_notifications() == ["influxdb", "stdout"]
+    notification = notification_registry.create_notification(
+        "stdout", stdout_fmt="jsonl"
+    )
+    assert isinstance(notification, Stdout)
+    assert notification.format == "jsonl"
+
+    with pytest.raises(ValueError, match="Unknown notification system: slack"):
+        notification_registry.create_notification("slack")
+
+
+def test_unknown_notifications(monkeypatch):
+    def entry_points():
+        calls.append(1)
+        return {"list": FakeEntryPoint("list", ListNotification)}
+
+    calls = []
+    monkeypatch.setattr(notification_registry, "_entry_points", entry_points)
+    # plugins are not looked up for the built-in systems
+    assert not notification_registry.unknown_notifications(["stdout", "influxdb"])
+    assert not calls
+    assert notification_registry.unknown_notifications(["stdout", "list", "x"]) == ["x"]
+    assert calls == [1]
+
+
+def test_entry_points_cached():
+    notification_registry._entry_points.cache_clear()
+    try:
+        notification_registry._entry_points()
+        notification_registry._entry_points()
+        assert notification_registry._entry_points.cache_info().misses == 1
+    finally:
+        notification_registry._entry_points.cache_clear()
+
+
+def test_create_notification_plugin(monkeypatch):
+    monkeypatch.setattr(
+        notification_registry,
+        "_entry_points",
+        lambda: {"list": FakeEntryPoint("list", ListNotification)},
+    )
+    assert notification_registry.available_notifications() == [
+        "influxdb",
+        "stdout",
+        "list",
+    ]
+    assert isinstance(
+        notification_registry.create_notification("list"), ListNotification
+    )
+
+
+# vim: ts=4
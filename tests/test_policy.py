@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Test compliance policy compilation."""
+
+import copy
+import os
+
+import pytest
+
+import snitch
+from snitch.policy.policy import (
+    PolicyError,
+    compile_policies,
+    compile_policy,
+    load_policy,
+)
+from snitch.utils.intervals import PortIntervals
+
+MISSING = object()
+
+INGRESS_DISABLED = {
+    "forbid_all_ports": False,
+    "forbid_all_protocols": False,
+    "forbid_cidrs": [],
+    "forbid_tcp_port": [],
+    "forbid_udp_port": [],
+    "max_netmask_allowed": None,
+    "max_number_port_per_rule": None,
+}
+
+
+@pytest.fixture(name="compliance_rules")
+def fixture_compliance_rules(sg_compliance_rules):
+    return {
+        "my_project": {
+            "sg": copy.deepcopy(sg_compliance_rules),
+            "server": {
+                "mandatory_tags": ["Team"],
+                "mandatory_metadata": ["owner"],
+                "ignore_server_ids": ["server_id"],
+            },
+        }
+    }
+
+
+def test_load_policy_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_policy(str(tmp_path / "missing.yaml"), "project_1")
+
+
+def test_load_policy_bundled_file():
+    filename = os.path.join(os.path.dirname(snitch.__file__), "compliance_rules.yaml")
+    policy = load_policy(filename, "project_1")
+    assert policy.project_name == "project_1"
+    assert policy.sg.mandatory_tags == ("Team", "Department")
+    assert policy.sg.ingress.forbid_ports == (
+        ("tcp", PortIntervals([20, 21, 23, 25, 137, 139, 445])),
+    )
+    assert policy.sg.ingress.forbid_ports_protocols == {"tcp"}
+
+
+def test_compile_policy(compliance_rules):
+    compliance_rules["my_project"]["sg"]["ingress"]["forbid_udp_port"] = ["500-600"]
+    compliance_rules["my_project"]["sg"]["mandatory_tags"] = ["a", "b", "a"]
+    policy = compile_policy(compliance_rules, "my_project")
+
+    assert policy.sg.mandatory_tags == ("a", "b")
+    assert policy.sg.ignore_sg_ids == frozenset(
+        ["ad8b5502-fef5-4cb4-9950-9bbbb701a7f7"]
+    )
+    assert "0.0.0.0/0" in policy.sg.egress.forbid_cidrs
+    assert policy.sg.ingress.forbid_ports == (("udp", PortIntervals(["500-600"])),)
+    assert policy.server.mandatory_metadata == ("owner",)
+    assert policy.server.ignore_server_ids == frozenset(["server_id"])
+
+
+def test_compile_policy_is_immutable(compliance_rules):
+    policy = compile_policy(compliance_rules, "my_project")
+    with pytest.raises(AttributeError):
+        policy.sg.alert_if_not_used = False
+
+
+def test_compile_policy_optional_sections(compliance_rules):
+    del compliance_rules["my_project"]["server"]
+    del compliance_rules["my_project"]["sg"]["ignore_sg_ids"]
+    policy = compile_policy(compliance_rules, "my_project")
+    assert policy.server is None
+    assert policy.sg.ignore_sg_ids == frozenset()
+    assert policy.sg.forbid_redundant_rules is False
+    assert policy.sg.forbid_remote_group_exposure is False
+
+
+@pytest.mark.parametrize(
+    "sg_rules, only_tag_checks",
+    [
+        ({}, False),
+        ({"alert_if_not_used": False}, False),
+        ({"alert_if_not_used": False, "ingress": INGRESS_DISABLED}, False),
+        (
+            {
+                "alert_if_not_used": False,
+                "ingress": INGRESS_DISABLED,
+                "egress": {"forbid_cidrs": []},
+            },
+            True,
+        ),
+        (
+            {
+                "alert_if_not_used": False,
+                "ingress": INGRESS_DISABLED,
+                "egress": {"forbid_cidrs": []},
+                "mandatory_tags": [],
+            },
+            False,
+        ),
+        (
+            {
+                "alert_if_not_used": False,
+                "ingress": INGRESS_DISABLED,
+                "egress": {"forbid_cidrs": []},
+                "forbid_redundant_rules": True,
+            },
+            False,
+        ),
+        (
+            {
+                "alert_if_not_used": False,
+                "ingress": INGRESS_DISABLED,
+                "egress": {"forbid_cidrs": []},
+                "forbid_remote_group_exposure": True,
+            },
+            False,
+        ),
+    ],
+)
+def test_sg_policy_only_tag_checks(compliance_rules, sg_rules, only_tag_checks):
+    sg = compliance_rules["my_project"]["sg"]
+    for key, value in sg_rules.items():
+        if isinstance(value, dict):
+            sg[key].update(value)
+        else:
+            sg[key] = value
+    policy = compile_policy(compliance_rules, "my_project")
+    assert policy.sg.only_tag_checks is only_tag_checks
+
+
+def test_server_policy_only_tag_checks(compliance_rules):
+    server = compliance_rules["my_project"]["server"]
+    assert not compile_policy(compliance_rules, "my_project").server.only_tag_checks
+    server["mandatory_metadata"] = []
+    assert compile_policy(compliance_rules, "my_project").server.only_tag_checks
+
+
+def test_compile_policy_disabled_checks(compliance_rules):
+    compliance_rules["my_project"]["sg"]["ingress"]["max_netmask_allowed"] = None
+    compliance_rules["my_project"]["sg"]["ingress"]["max_number_port_per_rule"] = None
+    policy = compile_policy(compliance_rules, "my_project")
+    assert policy.sg.ingress.max_netmask_allowed is None
+    assert policy.sg.ingress.max_number_port_per_rule is None
+
+
+@pytest.mark.parametrize(
+    "section, key, value, error",
+    [
+        ("ingress", "forbid_cidrs", ["10.0.0.1/8"], "sg.ingress.forbid_cidrs"),
+        ("ingress", "forbid_tcp_port", ["a-b"], "sg.ingress.forbid_tcp_port"),
+        ("ingress", "forbid_all_ports", "yes", "expected true/false"),
+        ("ingress", "max_netmask_allowed", "16", "expected an integer"),
+        ("ingress", "max_netmask_allowed", 200, "expected a value between"),
+        ("ingress", "forbid_cidrs_exactly_match", False, "unknown option"),
+        ("egress", "forbid_cidrs", "0.0.0.0/0", "^[^:]*: expected a list"),
+        ("egress", "forbid_cidrs_match_subnets", MISSING, "mandatory"),
+        ("ingress", "forbid_udp_port", MISSING, "^[^:]*: mandatory"),
+    ],
+)
+def test_compile_policy_invalid(compliance_rules, section, key, value, error):
+    rules = compliance_rules["my_project"]["sg"][section]
+    if value is MISSING:
+        del rules[key]
+    else:
+        rules[key] = value
+    with pytest.raises(PolicyError, match=error):
+        compile_policy(compliance_rules, "my_project")
+
+
+def test_compile_policy_unknown_project(compliance_rules):
+    with pytest.raises(PolicyError, match="not found"):
+        compile_policy(compliance_rules, "another_project")
+
+
+def test_compile_policies_only_listed_projects(compliance_rules):
+    compliance_rules["invalid_project"] = {"sg": {"unknown_option": True}}
+    policies = compile_policies(compliance_rules, ["my_project"])
+    assert list(policies) == ["my_project"]
+
+    with pytest.raises(PolicyError, match="invalid_project"):
+        compile_policies(compliance_rules)
+    with pytest.raises(PolicyError, match="another_project, other"):
+        compile_policies(compliance_rules, ["another_project", "my_project", "other"])
+
+
+def test_compile_policies_errors(compliance_rules):
+    compliance_rules["invalid_project"] = {"sg": {"unknown_option": True}}
+    errors = {}
+    policies = compile_policies(compliance_rules, errors=errors)
+    assert list(policies) == ["my_project"]
+    assert list(errors) == ["invalid_project"]
+    assert isinstance(errors["invalid_project"], PolicyError)
+
+
+# vim: ts=4
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Test PortIntervals class."""
+
+import pytest
+
+from snitch.utils.intervals import (
+    PortIntervals,
+    format_port_intervals,
+    parse_port_interval,
+)
+
+
+@pytest.mark.parametrize(
+    "value, result",
+    [
+        (22, (22, 22)),
+        ("22", (22, 22)),
+        ("6000-6063", (6000, 6063)),
+        ([6000, 6063], (6000, 6063)),
+        ((1, 65535), (1, 65535)),
+    ],
+)
+def test_parse_port_interval(value, result):
+    assert parse_port_interval(value) == result
+
+
+@pytest.mark.parametrize(
+    "value", [True, "abc", "10-", "100-10", 70000, -1, [1], [1, "2"], 1.5, None]
+)
+def test_parse_port_interval_invalid(value):
+    with pytest.raises(ValueError):
+        parse_port_interval(value)
+
+
+def test_port_intervals_merge():
+    intervals = PortIntervals([25, 23, "20-22", 80, "6000-6010", "6005-6063", 81])
+    assert list(intervals) == [(20, 23), (25, 25), (80, 81), (6000, 6063)]
+    assert len(intervals) == 4
+
+
+@pytest.mark.parametrize(
+    "first, last, result",
+    [
+        (1, 19, []),
+        (1, 20, [(20, 23)]),
+        (23, 24, [(20, 23)]),
+        (24, 24, []),
+        (24, 80, [(25, 25), (80, 81)]),
+        (1, 65535, [(20, 23), (25, 25), (80, 81), (6000, 6063)]),
+        (6063, 7000, [(6000, 6063)]),
+        (6064, 65535, []),
+    ],
+)
+def test_port_intervals_overlapping(first, last, result):
+    intervals = PortIntervals([20, 21, 22, 23, 25, 80, 81, "6000-6063"])
+    assert intervals.overlapping(first, last) == result
+
+
+def test_port_intervals_contains():
+    intervals = PortIntervals(["6000-6063"])
+    assert 6000 in intervals
+    assert 6063 in intervals
+    assert 6064 not in intervals
+    assert not PortIntervals([])
+
+
+def test_format_port_intervals():
+    assert format_port_intervals([(21, 21), (6000, 6063)]) == "21, 6000-6063"
+
+
+# vim: ts=4
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Test process pool security group rules engine."""
+
+import copy
+import multiprocessing
+
+import pytest
+
+from benchmarks.bench_checks import BENCH_RULES
+from benchmarks.generator import FakeConnection, FakeInventory
+from snitch.inventory.inventory import Inventory
+from snitch.policy.policy import compile_policy
+from snitch.resources.process_engine import (
+    ProcessRulesEngine,
+    check_rule_tuples,
+    rule_tuple,
+)
+from snitch.resources.security_group import SecurityGroup
+from snitch.scanner.scanner import check_sg_compliance
+
+
+@pytest.fixture(scope="module")
+def engine():
+    process_engine = ProcessRulesEngine(workers=2, batch_size=50, chunk_size=100)
+    yield process_engine
+    process_engine.close()
+
+
+def sg_policy(match_subnets=True):
+    rules = copy.deepcopy(BENCH_RULES)
+    rules["project_1"]["sg"]["ingress"]["forbid_cidrs_match_subnets"] = match_subnets
+    return compile_policy(rules, "project_1").sg
+
+
+def sg_violations(security_groups):
+    return [i for sg in security_groups for i in sg.return_violations()]
+
+
+def test_check_rule_tuples():
+    policy = sg_policy()
+    os_sg = FakeInventory(5, sgs=30, servers=1).security_groups[0]
+    expected = SecurityGroup("project_1", os_sg)
+    expected.check_egress_rules(policy.egress)
+    expected.check_ingress_rules(policy.ingress)
+
+    issues = check_rule_tuples(policy, [rule_tuple(i) for i in expected.rules])
+    assert issues == [i.issues for i in expected.rules]
+
+
+@pytest.mark.parametrize("match_subnets", [True, False])
+def test_engine_same_violations(engine, match_subnets):
+    policy = sg_policy(match_subnets)
+    inventory = Inventory(
+        FakeConnection([FakeInventory(3, sgs=200, servers=50, max_rules=50)])
+    )
+
+    expected = check_sg_compliance(inventory, policy)
+    result = check_sg_compliance(inventory, policy, engine=engine)
+    assert len(result) == len(expected) == 200
+    assert sg_violations(result) == sg_violations(expected)
+
+
+def test_engine_no_rules(engine):
+    engine.check_rules([], sg_policy())
+
+
+def test_engine_policies_sent_once():
+    policy = sg_policy()
+    os_sgs = FakeInventory(7, sgs=20, servers=1).security_groups
+    expected = [SecurityGroup("project_1", i) for i in os_sgs]
+    for securitygroup in expected:
+        securitygroup.check_egress_rules(policy.egress)
+        securitygroup.check_ingress_rules(policy.ingress)
+
+    children = set(multiprocessing.active_children())
+    process_engine = ProcessRulesEngine(workers=2, chunk_size=10, sg_policies=[policy])
+    try:
+        executor = process_engine.executor
+        result = [SecurityGroup("project_1", i) for i in os_sgs]
+        process_engine.check_rules([j for i in result for j in i.rules], policy)
+        # the pool is started again only for a policy not sent yet
+        assert process_engine.executor is executor
+        assert [j.issues for i in result for j in i.rules] == [
+            j.issues for i in expected for j in i.rules
+        ]
+
+        other_policy = sg_policy(match_subnets=False)
+        process_engine.check_rules(result[0].rules, other_policy)
+        assert process_engine.executor is not executor
+        assert process_engine.sg_policies == [policy, other_policy]
+
+        process_engine.set_policies([other_policy])
+        assert process_engine.sg_policies == [other_policy]
+    finally:
+        process_engine.close()
+    # the workers of both pools are stopped
+    assert set(multiprocessing.active_children()) <= children
+
+
+# vim: ts=4
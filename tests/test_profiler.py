@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Test scan profiler."""
+
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.bench_checks import BENCH_RULES
+from benchmarks.generator import FakeConnection, FakeInventory
+from snitch.policy.policy import compile_policy
+from snitch.resources.security_group import SecurityGroup, SecurityGroupRule
+from snitch.resources.server import Server
+from snitch.scanner.scanner import enable_profiling, scan_project
+from snitch.utils.profiler import PROFILER, Histogram, Profiler
+
+
+@pytest.fixture
+def profiling():
+    """Enable PROFILER, and restore the resources classes after the test."""
+    classes = (SecurityGroupRule, SecurityGroup, Server)
+    saved = [dict(vars(cls)) for cls in classes]
+    enable_profiling()
+    yield PROFILER
+    PROFILER.enabled = False
+    PROFILER.reset()
+    for cls, attributes in zip(classes, saved):
+        for name, value in attributes.items():
+            if name.startswith("check_") or name == "__init__":
+                setattr(cls, name, value)
+
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in [0.001] * 98 + [0.5, 1.0]:
+        histogram.add(seconds)
+    assert histogram.count == 100
+    assert histogram.min == 0.001
+    assert histogram.max == 1.0
+    # upper bound of the power of two bucket
+    assert 0.001 <= histogram.percentile(50) < 0.002
+    assert 0.5 <= histogram.percentile(99) <= 1.0
+    assert histogram.percentile(100) == 1.0
+
+
+def test_profiler_disabled():
+    profiler = Profiler()
+    items = [1, 2]
+    assert profiler.iter_timed("api.x", items) is items
+    assert profiler.timer("a") is profiler.timer("b")
+    with profiler.timer("a"):
+        profiler.count("c")
+    assert not profiler.histograms
+    assert not profiler.counters
+
+
+def test_profiler_enabled():
+    profiler = Profiler()
+    profiler.enable()
+    with profiler.timer("phase"):
+        pass
+    assert list(profiler.iter_timed("api.x", [1, 2, 3])) == [1, 2, 3]
+    # one wait per item and the last one for the end of the listing
+    assert profiler.histograms["api.x"].count == 4
+    assert profiler.counters["api.x.items"] == 3
+    assert profiler.histograms["phase"].count == 1
+
+    report = profiler.report()
+    assert "api.x.items" in report
+    assert "phase" in report
+
+    profiler.reset()
+    assert not profiler.histograms
+
+
+def test_profiler_http_timings():
+    timings = [
+        SimpleNamespace(
+            method="GET",
+            url="https://cloud:9696/v2.0/security-groups?limit=2&marker=x",
+            elapsed=datetime.timedelta(milliseconds=20),
+        )
+        for _ in range(3)
+    ]
+    timings.append(
+        SimpleNamespace(
+            method="GET",
+            url="https://cloud:8774/v2.1/servers/6e1a37d8-ffbc-4b3b-a5a6-3c0c1a84f2ad",
+            elapsed=datetime.timedelta(milliseconds=5),
+        )
+    )
+    session = SimpleNamespace(
+        get_timings=lambda: list(timings), reset_timings=timings.clear
+    )
+    profiler = Profiler()
+    profiler.enable()
+    profiler.record_http_timings(SimpleNamespace(session=session))
+    assert profiler.histograms["http GET /v2.0/security-groups"].count == 3
+    assert profiler.histograms["http GET /v2.1/servers/{id}"].count == 1
+    assert not timings
+
+    # connections without timings are ignored
+    profiler.record_http_timings(SimpleNamespace())
+
+
+def test_scan_project_profile(profiling):
+    inventory = FakeInventory(1, sgs=20, servers=10, max_rules=20)
+    policy = compile_policy(BENCH_RULES, "project_1")
+    violations = scan_project(FakeConnection([inventory]), policy, ["sg", "server"])
+    assert violations
+
+    histograms = profiling.histograms
+    assert histograms["api.security_groups"].count == 21
+    assert histograms["api.servers"].count == 11
+    assert histograms["SecurityGroup.__init__"].count == 20
+    assert histograms["SecurityGroup.check_ingress_rules"].count == 20
+    assert histograms["Server.check_server_metadata"].count == 10
+    assert "SecurityGroupRule.check_cidr" in histograms
+
+    # instrumenting twice does not time the checks twice
+    enable_profiling()
+    assert not hasattr(SecurityGroup.check_sg_tags.profiled, "profiled")
+
+
+# vim: ts=4
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Test numpy security group rules engine."""
+
+import copy
+
+import pytest
+
+from benchmarks.bench_checks import BENCH_RULES
+from benchmarks.generator import FakeConnection, FakeInventory
+from snitch.inventory.inventory import Inventory
+from snitch.policy.policy import compile_policy
+from snitch.resources.security_group import SecurityGroup
+from snitch.scanner.scanner import check_sg_compliance
+
+numpy = pytest.importorskip("numpy")
+
+# pylint: disable=wrong-import-position
+from snitch.resources.rules_engine import NumpyRulesEngine  # noqa: E402
+
+
+def make_rule(rule_id, **kwargs):
+    rule = {
+        "id": rule_id,
+        "direction": "ingress",
+        "ethertype": "IPv4",
+        "protocol": "tcp",
+        "port_range_min": 22,
+        "port_range_max": 22,
+        "remote_ip_prefix": "10.0.0.0/24",
+        "remote_group_id": None,
+    }
+    rule.update(kwargs)
+    return rule
+
+
+EDGE_RULES = [
+    make_rule("ssh"),
+    make_rule("telnet", port_range_min=23, port_range_max=23),
+    make_rule("any", remote_ip_prefix="0.0.0.0/0"),
+    make_rule("no-prefix", remote_ip_prefix=None),
+    make_rule("group", remote_ip_prefix=None, remote_group_id="sg-x"),
+    make_rule("all-ports", port_range_min=None, port_range_max=None),
+    make_rule("zero-ports", port_range_min=0, port_range_max=0),
+    make_rule("no-max", port_range_min=6001, port_range_max=None),
+    make_rule("range", port_range_min=100, port_range_max=5000),
+    make_rule("udp", protocol="udp", port_range_min=53, port_range_max=53),
+    make_rule("icmp", protocol="icmp", port_range_min=None, port_range_max=None),
+    make_rule("all-protocols", protocol=None, port_range_min=None),
+    make_rule("ipv6", ethertype="IPv6", remote_ip_prefix="::/0"),
+    make_rule("egress-any", direction="egress", remote_ip_prefix=None),
+    make_rule("egress-net", direction="egress", remote_ip_prefix="10.1.0.0/16"),
+]
+
+
+def sg_violations(security_groups):
+    return [i for sg in security_groups for i in sg.return_violations()]
+
+
+def policies():
+    """Yield policies covering enabled and disabled checks."""
+    yield compile_policy(BENCH_RULES, "project_1").sg
+    rules = copy.deepcopy(BENCH_RULES)
+    ingress = rules["project_1"]["sg"]["ingress"]
+    ingress["forbid_cidrs_match_subnets"] = False
+    ingress["max_netmask_allowed"] = None
+    ingress["max_number_port_per_rule"] = None
+    ingress["forbid_udp_port"] = []
+    rules["project_1"]["sg"]["egress"]["forbid_cidrs_match_subnets"] = True
+    yield compile_policy(rules, "project_1").sg
+
+
+@pytest.mark.parametrize("sg_policy", list(policies()))
+def test_engine_edge_rules(sg_policy, os_sg):
+    os_sg.security_group_rules = EDGE_RULES
+
+    expected = SecurityGroup("my_project", os_sg)
+    expected.check_egress_rules(sg_policy.egress)
+    expected.check_ingress_rules(sg_policy.ingress)
+
+    securitygroup = SecurityGroup("my_project", os_sg)
+    NumpyRulesEngine().check_rules(securitygroup.rules, sg_policy)
+    securitygroup.add_rules_violations("egress")
+    securitygroup.add_rules_violations("ingress")
+
+    assert [i.issues for i in securitygroup.rules] == [i.issues for i in expected.rules]
+    assert securitygroup.return_violations() == expected.return_violations()
+    assert expected.return_violations()
+
+
+@pytest.mark.parametrize("sg_policy", list(policies()))
+@pytest.mark.parametrize("batch_size", [1, 7, 1000])
+def test_engine_same_violations(sg_policy, batch_size):
+    fake_inventory = FakeInventory(3, sgs=200, servers=50, max_rules=50)
+    inventory = Inventory(FakeConnection([fake_inventory]))
+
+    expected = check_sg_compliance(inventory, sg_policy)
+    result = check_sg_compliance(
+        inventory, sg_policy, engine=NumpyRulesEngine(batch_size=batch_size)
+    )
+    assert len(result) == len(expected) == 200
+    assert sg_violations(result) == sg_violations(expected)
+
+
+def test_engine_no_rules():
+    NumpyRulesEngine().check_rules([], compile_policy(BENCH_RULES, "project_1").sg)
+
+
+# vim: ts=4
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""Test project scanner."""
+
+import copy
+import dataclasses
+import os
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from benchmarks.bench_checks import BENCH_RULES
+from benchmarks.fake_cloud import FakeCloud, create_inventories
+from benchmarks.generator import FakeConnection
+from snitch.inventory.cache import ListingCache
+from snitch.policy.policy import compile_policy
+from snitch.scanner import scanner
+from snitch.scanner.scanner import (
+    iter_project_violations,
+    merge_producers,
+    scan_project,
+    scan_projects,
+    scan_regions,
+)
+
+
+@pytest.fixture(name="policy")
+def fixture_policy(sg_compliance_rules):
+    return compile_policy(
+        {"my_project": {"sg": copy.deepcopy(sg_compliance_rules)}}, "my_project"
+    )
+
+
+def test_scan_project(policy, make_os_sg, make_os_conn):
+    rule = {
+        "id": "rule1",
+        "direction": "ingress",
+        "protocol": "tcp",
+        "remote_ip_prefix": "0.0.0.0/0",
+        "remote_group_id": None,
+        "port_range_min": 22,
+        "port_range_max": 22,
+    }
+    os_conn = make_os_conn(
+        "my_project",
+        [
+            make_os_sg("sg1", ["Team", "Department"], [rule]),
+            make_os_sg("sg2", ["Team"]),
+            make_os_sg("ad8b5502-fef5-4cb4-9950-9bbbb701a7f7", []),
+        ],
+        used_sgs_ids=["sg1", "sg2"],
+    )
+
+    violations = scan_project(os_conn, policy, ["sg"])
+
+    assert sorted((v.resource_id, v.message) for v in violations) == [
+        (
+            "sg1",
+            "rule id rule1 - Forbidden cidr ingress, Violation of ingress max netmask",
+        ),
+        ("sg2", "Missing tags Department"),
+    ]
+    assert {(v.cloud, v.region) for v in violations} == {("my_cloud", "my_region")}
+    # only the port attributes used by the checks are listed
+    os_conn.network.ports.assert_called_once_with(
+        project_id=os_conn.current_project.id,
+        fields=["id", "security_groups", "device_id"],
+    )
+
+
+def test_scan_project_remote_group_exposure(policy, make_os_sg, make_os_conn):
+    rule = {
+        "id": "rule1",
+        "direction": "ingress",
+        "protocol": "tcp",
+        "remote_ip_prefix": None,
+        "remote_group_id": "sg2",
+        "port_range_min": 22,
+        "port_range_max": 22,
+    }
+    # sg2 is listed after sg1, and sg3 is exposed through sg1 -> sg2
+    os_conn = make_os_conn(
+        "my_project",
+        [
+            make_os_sg("sg1", ["Team", "Department"], [rule]),
+            make_os_sg(
+                "sg2",
+                ["Team", "Department"],
+                [dict(rule, id="rule2", remote_ip_prefix="0.0.0.0/0")],
+            ),
+            make_os_sg(
+                "sg3", ["Team", "Department"], [dict(rule, remote_group_id="sg1")]
+            ),
+        ],
+        used_sgs_ids=["sg1", "sg2", "sg3"],
+    )
+    sg_policy = dataclasses.replace(policy.sg, forbid_remote_group_exposure=True)
+    policy = dataclasses.replace(policy, sg=sg_policy)
+
+    violations = scan_project(os_conn, policy, ["sg"])
+
+    message = "Ingress exposed through remote groups to forbidden cidr 0.0.0.0/0"
+    # rules without remote_ip_prefix are checked as 0.0.0.0/0
+    rule_message = "rule id rule1 - Forbidden cidr ingress"
+    assert sorted((v.resource_id, v.message) for v in violations) == [
+        ("sg1", message),
+        ("sg1", rule_message),
+        (
+            "sg2",
+            "rule id rule2 - Forbidden cidr ingress, Violation of ingress max netmask",
+        ),
+        ("sg3", message),
+        ("sg3", rule_message),
+    ]
+
+
+def test_scan_project_lists_resources_in_parallel(
+    sg_compliance_rules, make_os_sg, make_os_conn
+):
+    compliance_rules = {"my_project": {"sg": sg_compliance_rules}}
+    compliance_rules["my_project"]["server"] = {
+        "mandatory_tags": ["Team"],
+        "mandatory_metadata": [],
+    }
+    policy = compile_policy(compliance_rules, "my_project")
+    # all listings must be running at the same time to cross the barrier
+    barrier = threading.Barrier(3, timeout=5)
+
+    def listing(resources):
+        def side_effect(**_kwargs):
+            barrier.wait()
+            return resources
+
+        return side_effect
+
+    os_server = MagicMock()
+    os_server.id = "server1"
+    os_server.tags = []
+    os_server.metadata = {}
+    os_conn = make_os_conn("my_project", [])
+    os_conn.network.ports.side_effect = listing([])
+    os_conn.network.security_groups.side_effect = listing([make_os_sg("sg1", [])])
+    os_conn.compute.servers.side_effect = listing([os_server])
+
+    violations = scan_project(os_conn, policy, ["sg", "server"])
+
+    assert sorted((v.resource_id, v.message) for v in violations) == [
+        ("server1", "Missing tags Team"),
+        ("sg1", "Missing tags Team, Department"),
+        ("sg1", "Security group not used"),
+    ]
+
+
+def test_scan_project_with_cache(policy, tmp_path, make_os_sg, make_os_conn):
+    cache = ListingCache(str(tmp_path), max_age=60)
+    os_sg = make_os_sg("sg1", ["Team"])
+    os_sg.updated_at = "2000-01-01T00:00:00Z"
+    os_sg.revision_number = 1
+    os_conn = make_os_conn("my_project", [os_sg], used_sgs_ids=["sg1"])
+    os_conn.config.name = "mycloud"
+    os_conn.config.region_name = "RegionOne"
+    os_conn.current_project.id = "project_id"
+    port = os_conn.network.ports.return_value[0]
+    port.id = "port1"
+    port.device_id = "server1"
+
+    first = scan_project(os_conn, policy, ["sg"], cache)
+    second = scan_project(os_conn, policy, ["sg"], cache)
+
+    assert first == second
+    assert [v.message for v in second] == ["Missing tags Department"]
+    assert os_conn.network.security_groups.call_count == 1
+    assert os_conn.network.ports.call_count == 1
+    assert cache.hits == 2
+
+
+def test_scan_project_lists_only_missing_tags(tmp_path, make_os_sg, make_os_conn):
+    rules = {
+        "my_project": {
+            "sg": {
+                "mandatory_tags": ["Team", "Department"],
+                "alert_if_not_used": False,
+                "egress": {"forbid_cidrs": [], "forbid_cidrs_match_subnets": False},
+                "ingress": {
+                    "forbid_all_ports": False,
+                    "forbid_all_protocols": False,
+                    "forbid_cidrs": [],
+                    "forbid_cidrs_match_subnets": False,
+                    "forbid_tcp_port": [],
+                    "forbid_udp_port": [],
+                    "max_netmask_allowed": None,
+                    "max_number_port_per_rule": None,
+                },
+            },
+            "server": {"mandatory_tags": ["Team"], "mandatory_metadata": []},
+        }
+    }
+    policy = compile_policy(rules, "my_project")
+    # the API filters the listing; tags are still checked on what it returns
+    os_conn = make_os_conn("my_project", [make_os_sg("sg1", ["Team"])])
+    os_conn.compute.servers.return_value = []
+    cache = ListingCache(str(tmp_path), max_age=60)
+
+    violations = scan_project(os_conn, policy, ["sg", "server"], cache)
+
+    assert [v.message for v in violations] == ["Missing tags Department"]
+    os_conn.network.security_groups.assert_called_once_with(
+        project_id=os_conn.current_project.id, not_tags="Team,Department"
+    )
+    os_conn.compute.servers.assert_called_once_with(
+        project_id=os_conn.current_project.id, not_tags="Team"
+    )
+    os_conn.network.ports.assert_not_called()
+    # filtered listings are not cached as full listings
+    cached = sorted(os.listdir(tmp_path / "my_cloud" / "my_region" / "id-my_project"))
+    assert [i.split("-not-tags-")[0] for i in cached] == ["security_groups", "servers"]
+
+
+def test_scan_projects_in_parallel(sg_compliance_rules, make_os_sg, make_os_conn):
+    projects = ["project_a", "project_b", "project_c"]
+    compliance_rules = {i: {"sg": sg_compliance_rules} for i in projects}
+    barrier = threading.Barrier(len(projects), timeout=5)
+
+    def connect_as_project(project):
+        # all projects must be scanned at the same time to cross the barrier
+        barrier.wait()
+        return make_os_conn(project, [make_os_sg(f"{project}-sg", [])])
+
+    os_conn = MagicMock()
+    os_conn.connect_as_project.side_effect = connect_as_project
+    targets = [(i, compile_policy(compliance_rules, i)) for i in projects]
+
+    results = []
+    violations = list(
+        scan_projects(
+            os_conn,
+            targets,
+            ["sg"],
+            workers=len(projects),
+            on_project_done=results.append,
+        )
+    )
+
+    assert sorted(i.project_name for i in results) == projects
+    assert all(i.error is None for i in results)
+    assert all(i.violations_count == 2 for i in results)
+    assert sorted(v.resource_id for v in violations) == [
+        "project_a-sg",
+        "project_a-sg",
+        "project_b-sg",
+        "project_b-sg",
+        "project_c-sg",
+        "project_c-sg",
+    ]
+
+
+def test_scan_projects_error(policy):
+    os_conn = MagicMock()
+    os_conn.connect_as_project.side_effect = RuntimeError("auth failed")
+
+    results = []
+    violations = list(
+        scan_projects(
+            os_conn, [("project_a", policy)], ["sg"], on_project_done=results.append
+        )
+    )
+
+    assert not violations
+    assert len(results) == 1
+    assert results[0].error == "auth failed"
+
+
+def test_scan_regions(policy, make_os_sg, make_os_conn):
+    regions = [("cloud_a", "region_1"), ("cloud_a", "region_2"), ("cloud_b", "")]
+    barrier = threading.Barrier(len(regions), timeout=5)
+
+    def make_scan(os_conn):
+        def scan():
+            # all regions must be scanned at the same time to cross the barrier
+            barrier.wait()
+            return iter_project_violations(os_conn, policy, ["sg"])
+
+        return scan
+
+    scans = []
+    for cloud, region in regions:
+        os_conn = make_os_conn("my_project", [make_os_sg("sg", [])], ["sg"])
+        os_conn.config.name = cloud
+        os_conn.config.region_name = region or None
+        scans.append((os_conn, make_scan(os_conn)))
+    failing_conn = make_os_conn("my_project", [])
+    failing_conn.config.name = "cloud_c"
+    failing_conn.network.security_groups.side_effect = RuntimeError("auth failed")
+    scans.append(
+        (failing_conn, lambda: iter_project_violations(failing_conn, policy, ["sg"]))
+    )
+
+    results = []
+    violations = list(scan_regions(scans, on_region_done=results.append))
+
+    assert sorted((v.cloud, v.region, v.message) for v in violations) == [
+        (cloud, region, "Missing tags Team, Department") for cloud, region in regions
+    ]
+    assert sorted((i.cloud, i.violations_count, i.error) for i in results) == [
+        ("cloud_a", 1, None),
+        ("cloud_a", 1, None),
+        ("cloud_b", 1, None),
+        ("cloud_c", 0, "auth failed"),
+    ]
+
+
+def test_scan_projects_reuses_connections(policy, make_os_sg, make_os_conn):
+    os_conn = MagicMock()
+    os_conn.connect_as_project.side_effect = lambda project: make_os_conn(
+        project["name"], [make_os_sg("sg1", [])]
+    )
+    targets = [({"id": "id-a", "name": "project_a", "domain_id": "d"}, policy)]
+
+    connections = {}
+    for _ in range(2):
+        violations = list(
+            scan_projects(os_conn, targets, ["sg"], connections=connections)
+        )
+        assert len(violations) == 2
+
+    assert os_conn.connect_as_project.call_count == 1
+    assert list(connections) == ["id-a"]
+
+
+def test_iter_project_violations_streams(policy, make_os_sg, make_os_conn):
+    """Violations are yielded before the security groups listing ends."""
+    listing_may_end = threading.Event()
+
+    def security_groups(**_kwargs):
+        yield make_os_sg("sg1", [])
+        assert listing_may_end.wait(timeout=5)
+        yield make_os_sg("sg2", [])
+
+    os_conn = make_os_conn("my_project", [], used_sgs_ids=["sg1", "sg2"])
+    os_conn.network.security_groups.side_effect = security_groups
+
+    violations = iter_project_violations(os_conn, policy, ["sg"])
+    first = next(violations)
+    assert first.resource_id == "sg1"
+    listing_may_end.set()
+    assert [v.resource_id for v in violations] == ["sg2"]
+
+
+def test_iter_project_violations_error(policy, make_os_sg, make_os_conn):
+    os_conn = make_os_conn("my_project", [make_os_sg("sg1", [])])
+    os_conn.network.ports.side_effect = RuntimeError("ports failed")
+
+    with pytest.raises(RuntimeError, match="ports failed"):
+        list(iter_project_violations(os_conn, policy, ["sg"]))
+
+
+def test_iter_project_violations_ports_skipped(
+    policy, monkeypatch, make_os_sg, make_os_conn
+):
+    """Security groups check does not wait for a ports listing never started."""
+
+    def merge_ports_last(producers, **kwargs):
+        # list_ports starts only when another producer is done
+        return merge_producers([*producers[1:], producers[0]], workers=2, **kwargs)
+
+    monkeypatch.setattr(scanner, "merge_producers", merge_ports_last)
+    os_server = MagicMock()
+    os_server.id = "server1"
+    os_server.tags = []
+    os_server.metadata = {}
+    os_conn = make_os_conn("my_project", [make_os_sg("sg1", [])])
+    os_conn.compute.servers.return_value = [os_server]
+    policy = dataclasses.replace(
+        policy,
+        server=compile_policy(
+            {
+                "my_project": {
+                    "server": {"mandatory_tags": ["Team"], "mandatory_metadata": []}
+                }
+            },
+            "my_project",
+        ).server,
+    )
+
+    violations = iter_project_violations(os_conn, policy, ["sg", "server"])
+    next(violations)
+    closed = threading.Thread(target=violations.close, daemon=True)
+    closed.start()
+    closed.join(timeout=5)
+    assert not closed.is_alive()
+    os_conn.network.ports.assert_not_called()
+
+
+def test_scan_project_openstack_sdk():
+    """Listings in parallel share the connection session, and its token."""
+    openstack = pytest.importorskip("openstack")
+    inventories = create_inventories(1, 1, sgs=60, servers=30)
+    fake_cloud = FakeCloud(("127.0.0.1", 0), inventories, page_size=7)
+    thread = threading.Thread(target=fake_cloud.serve_forever, daemon=True)
+    thread.start()
+    try:
+        os_conn = openstack.connection.Connection(
+            auth_url=f"{fake_cloud.base_url}/v3",
+            username="user",
+            password="password",
+            project_name="project_1",
+            user_domain_name="Default",
+            project_domain_name="Default",
+            region_name="RegionOne",
+        )
+        policy = compile_policy(BENCH_RULES, "project_1")
+
+        violations = scan_project(os_conn, policy, ["sg", "server"])
+    finally:
+        fake_cloud.shutdown()
+        fake_cloud.server_close()
+
+    expected = scan_project(FakeConnection(inventories), policy, ["sg", "server"])
+    assert sorted(i._replace(cloud="") for i in violations) == sorted(
+        i._replace(cloud="") for i in expected
+    )
+    assert fake_cloud.stats["POST /v3/auth/tokens"] == 1
+    assert fake_cloud.stats["GET /network/v2.0/ports"] > 1
+
+
+def test_merge_producers_skipped():
+    """Producers not started when the generator stops are passed to on_skip."""
+    stop = threading.Event()
+    skipped = []
+
+    def failing(_emit):
+        raise RuntimeError("failed")
+
+    def producer(emit):
+        emit(1)
+
+    merged = merge_producers(
+        [failing, producer], workers=1, stop=stop, on_skip=skipped.append
+    )
+    with pytest.raises(RuntimeError, match="failed"):
+        list(merged)
+    assert stop.is_set()
+    assert skipped == [producer]
+
+
+def test_merge_producers_consumer_stops():
+    """Producers stop when the consumer closes the generator."""
+    stopped = threading.Event()
+
+    def producer(emit):
+        try:
+            for i in range(1000000):
+                emit(i)
+        finally:
+            stopped.set()
+
+    merged = merge_producers([producer], maxsize=10)
+    assert next(merged) == 0
+    merged.close()
+    assert stopped.wait(timeout=5)
+
+
+# vim: ts=4
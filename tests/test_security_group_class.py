@@ -3,7 +3,8 @@
 
 import pytest
 
-from snitch.resources.security_group import SecurityGroup
+from snitch.policy.policy import compile_egress_policy
+from snitch.resources.security_group import SG_REDUNDANT_RULE, SecurityGroup
 from snitch.violation.violation import Violation
 
 
@@ -60,4 +61,134 @@ def test_not_in_use_check_sg_not_used(os_sg):
     ]
 
 
+def test_return_violations_ordered_without_duplicates(os_sg):
+    os_sg.tags = []
+    os_sg.security_group_rules = [
+        {"id": f"rule{i}", "direction": "egress", "remote_ip_prefix": None}
+        for i in (3, 1, 2)
+    ]
+    egress = compile_egress_policy(
+        {"forbid_cidrs": ["0.0.0.0/0"], "forbid_cidrs_match_subnets": False}, "egress"
+    )
+    sg = SecurityGroup("my_project", os_sg)
+    sg.check_sg_tags(["Team"])
+    sg.check_egress_rules(egress)
+    sg.check_sg_tags(["Team"])
+    sg.compute_rules_violations()
+
+    expected = [
+        "Missing tags Team",
+        "rule id rule3 - Forbidden cidr egress",
+        "rule id rule1 - Forbidden cidr egress",
+        "rule id rule2 - Forbidden cidr egress",
+    ]
+    assert [i.message for i in sg.return_violations()] == expected
+    assert sg.return_violations() == sg.return_violations()
+
+
+def make_rule(rule_id, **kwargs):
+    rule = {
+        "id": rule_id,
+        "direction": "ingress",
+        "ethertype": "IPv4",
+        "protocol": "tcp",
+        "port_range_min": 22,
+        "port_range_max": 22,
+        "remote_ip_prefix": "10.0.0.0/24",
+        "remote_group_id": None,
+    }
+    rule.update(kwargs)
+    return rule
+
+
+@pytest.mark.parametrize(
+    "rules, redundant",
+    [
+        # port range and cidr covered
+        (
+            [
+                make_rule("a", port_range_min=1, port_range_max=1024),
+                make_rule("b", remote_ip_prefix="10.0.0.128/25"),
+            ],
+            {"b": "a"},
+        ),
+        # cidr not covered
+        (
+            [
+                make_rule("a", remote_ip_prefix="10.0.0.0/25"),
+                make_rule("b", remote_ip_prefix="10.0.0.0/24"),
+            ],
+            {"a": "b"},
+        ),
+        # ports overlap, but not covered
+        (
+            [
+                make_rule("a", port_range_min=20, port_range_max=22),
+                make_rule("b", port_range_min=22, port_range_max=25),
+            ],
+            {},
+        ),
+        # duplicates: the first one covers the second one
+        ([make_rule("a"), make_rule("b")], {"b": "a"}),
+        # all ports, no remote prefix
+        (
+            [
+                make_rule("a", remote_ip_prefix=None, port_range_min=None),
+                make_rule("b", remote_ip_prefix="192.168.0.0/16"),
+            ],
+            {"b": "a"},
+        ),
+        # any protocol covers other protocols, not the opposite
+        (
+            [
+                make_rule("a", protocol="udp", port_range_min=None),
+                make_rule("b", protocol=None, port_range_min=None),
+                make_rule("c", protocol=None, port_range_min=None),
+            ],
+            {"a": "b", "c": "b"},
+        ),
+        # other direction, protocol, ethertype or remote group
+        (
+            [
+                make_rule("a", remote_ip_prefix=None, port_range_min=None),
+                make_rule("b", direction="egress"),
+                make_rule("c", protocol="udp"),
+                make_rule("d", ethertype="IPv6", remote_ip_prefix="::/0"),
+                make_rule("e", remote_ip_prefix=None, remote_group_id="sg-x"),
+            ],
+            {},
+        ),
+        (
+            [
+                make_rule("a", remote_ip_prefix=None, remote_group_id="sg-x"),
+                make_rule("b", remote_ip_prefix=None, remote_group_id="sg-x"),
+                make_rule("c", ethertype="IPv6", remote_ip_prefix="2001:db8::/64"),
+                make_rule("d", ethertype="IPv6", remote_ip_prefix=None),
+            ],
+            {"b": "a", "c": "d"},
+        ),
+        # icmp type without code covers its codes
+        (
+            [
+                make_rule("a", protocol="icmp", port_range_min=8, port_range_max=None),
+                make_rule("b", protocol="icmp", port_range_min=8, port_range_max=0),
+                make_rule("c", protocol="icmp", port_range_min=3, port_range_max=0),
+            ],
+            {"b": "a"},
+        ),
+    ],
+)
+def test_check_redundant_rules(os_sg, rules, redundant):
+    os_sg.security_group_rules = rules
+    sg = SecurityGroup("my_project", os_sg)
+    sg.check_redundant_rules()
+
+    expected = [
+        f"rule id {rule['id']} - {SG_REDUNDANT_RULE} {redundant[rule['id']]}"
+        for rule in rules
+        if rule["id"] in redundant
+    ]
+    assert [i.message for i in sg.return_violations()] == expected
+
+
 # vim: ts=4
@@ -122,8 +122,12 @@ def test_check_ingress_max_number_port(
         ([23, 80], "tcp", 80, 80, "Violation of ingress forbidden port tcp"),
         ([20, 23, 80], "tcp", 23, 23, "Violation of ingress forbidden port tcp"),
         ([20, 23, 80], "tcp", 1, 21, "Violation of ingress forbidden port tcp"),
+        ([80], "tcp", None, None, "Violation of ingress forbidden port tcp"),
+        (["6000-6063"], "tcp", 6010, 6010, "Violation of ingress forbidden port tcp"),
+        ([22, "6000-6063"], "tcp", 1, 65535, "Violation of ingress forbidden port tcp"),
         ([80], "tcp", 443, 443, ""),
         ([80], "tcp", 81, 123, ""),
+        (["6000-6063"], "tcp", 6064, 7000, ""),
     ],
 )
 def test_check_ingress_port(forbidden_ports, protocol, port_min, port_max, result):
@@ -69,4 +69,18 @@ def test_check_server_metadata_keys(server_compliance_rules_metadata, os_server)
     assert server.violations == result
 
 
+def test_return_violations_ordered_without_duplicates(os_server):
+    os_server.tags = []
+    os_server.metadata = {}
+    server = Server("my_project", os_server)
+    for _ in range(2):
+        server.check_server_metadata(["owner"])
+        server.check_server_tags(["Team"])
+
+    assert [i.message for i in server.return_violations()] == [
+        "Missing metadata key owner",
+        "Missing tags Team",
+    ]
+
+
 # vim: ts=4
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Test security group state store."""
+
+import copy
+
+import pytest
+
+from snitch.policy.policy import compile_policy
+from snitch.scanner.scanner import scan_project
+from snitch.scanner.state import SgStateStore, sg_policy_hash
+
+RULE = {
+    "id": "rule1",
+    "direction": "ingress",
+    "protocol": "tcp",
+    "remote_ip_prefix": "0.0.0.0/0",
+    "remote_group_id": None,
+    "port_range_min": 22,
+    "port_range_max": 22,
+}
+
+
+@pytest.fixture(name="rules")
+def fixture_rules(sg_compliance_rules):
+    return {"my_project": {"sg": copy.deepcopy(sg_compliance_rules)}}
+
+
+@pytest.fixture(name="state")
+def fixture_state(tmp_path):
+    state = SgStateStore(str(tmp_path / "state.db"))
+    yield state
+    state.close()
+
+
+def messages(violations):
+    return sorted((i.resource_id, i.message) for i in violations)
+
+
+def test_unchanged_sg_is_replayed(rules, state, make_os_sg, make_os_conn):
+    policy = compile_policy(rules, "my_project")
+    os_sgs = [make_os_sg("sg1", ["Team"], [RULE]), make_os_sg("sg2", [])]
+    os_conn = make_os_conn("my_project", os_sgs, ["sg1"])
+
+    first = scan_project(os_conn, policy, ["sg"], state=state)
+    assert (state.checked, state.replayed) == (2, 0)
+    second = scan_project(os_conn, policy, ["sg"], state=state)
+    assert (state.checked, state.replayed) == (2, 2)
+
+    assert messages(first) == messages(second)
+    assert messages(first) == messages(scan_project(os_conn, policy, ["sg"]))
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "revision_number",
+        "rules",
+        "tags",
+    ],
+)
+def test_changed_sg_is_checked(rules, state, change, make_os_sg, make_os_conn):
+    policy = compile_policy(rules, "my_project")
+    os_sg = make_os_sg("sg1", ["Team", "Department"])
+    os_conn = make_os_conn("my_project", [os_sg], ["sg1"])
+    assert not scan_project(os_conn, policy, ["sg"], state=state)
+
+    if change == "revision_number":
+        os_sg.revision_number = 2
+    elif change == "rules":
+        os_sg.security_group_rules = [RULE]
+    else:
+        os_sg.tags = ["Team"]
+
+    violations = scan_project(os_conn, policy, ["sg"], state=state)
+    assert state.replayed == 0
+    assert state.checked == 2
+    if change != "revision_number":
+        assert violations
+
+
+def test_policy_change_checks_again(rules, state, make_os_sg, make_os_conn):
+    os_conn = make_os_conn("my_project", [make_os_sg("sg1", ["Team"])], ["sg1"])
+    scan_project(os_conn, compile_policy(rules, "my_project"), ["sg"], state=state)
+
+    rules["my_project"]["sg"]["mandatory_tags"] = ["Team"]
+    policy = compile_policy(rules, "my_project")
+    assert not scan_project(os_conn, policy, ["sg"], state=state)
+    assert state.replayed == 0
+
+
+def test_not_used_check_is_not_stored(rules, state, make_os_sg, make_os_conn):
+    policy = compile_policy(rules, "my_project")
+    os_sgs = [make_os_sg("sg1", ["Team", "Department"])]
+    os_conn = make_os_conn("my_project", os_sgs, ["sg1"])
+    assert not scan_project(os_conn, policy, ["sg"], state=state)
+
+    violations = scan_project(
+        make_os_conn("my_project", os_sgs), policy, ["sg"], state=state
+    )
+    assert state.replayed == 1
+    assert [i.message for i in violations] == ["Security group not used"]
+
+
+def test_deleted_sg_is_pruned(rules, state, make_os_sg, make_os_conn):
+    policy = compile_policy(rules, "my_project")
+    os_sgs = [make_os_sg("sg1", []), make_os_sg("sg2", [])]
+    scan_project(make_os_conn("my_project", os_sgs), policy, ["sg"], state=state)
+    scan_project(make_os_conn("my_project", os_sgs[:1]), policy, ["sg"], state=state)
+
+    rows = state.db.execute("SELECT sg_id FROM sg_state").fetchall()
+    assert rows == [("sg1",)]
+
+
+def test_policy_hash_is_canonical(rules):
+    sg_rules = rules["my_project"]["sg"]
+    sg_rules["ingress"]["forbid_cidrs"] = ["0.0.0.0/0", "10.0.0.0/8", "::/0"]
+    sg_rules["ingress"]["forbid_tcp_port"] = [22, "6000-6063", 23]
+    first = sg_policy_hash(compile_policy(rules, "my_project").sg)
+
+    sg_rules["ingress"]["forbid_cidrs"] = ["::/0", "10.0.0.0/8", "0.0.0.0/0"]
+    sg_rules["ingress"]["forbid_tcp_port"] = ["6000-6063", 23, 22]
+    assert sg_policy_hash(compile_policy(rules, "my_project").sg) == first
+
+    sg_rules["ingress"]["forbid_tcp_port"] = [22]
+    assert sg_policy_hash(compile_policy(rules, "my_project").sg) != first
+
+
+def test_unset_cloud_scope(rules, state, make_os_sg, make_os_conn):
+    policy = compile_policy(rules, "my_project")
+    os_conn = make_os_conn("my_project", [make_os_sg("sg1", [])], ["sg1"])
+    os_conn.config.name = None
+    os_conn.config.region_name = None
+    violations = scan_project(os_conn, policy, ["sg"], state=state)
+
+    # stored with the same cloud and region as the violations
+    rows = state.db.execute("SELECT cloud, region FROM sg_state").fetchall()
+    assert rows == [(i.cloud, i.region) for i in violations[:1]] == [("", "")]
+
+
+# vim: ts=4
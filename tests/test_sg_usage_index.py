@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Test SgUsageIndex class."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from snitch.inventory.usage import SgUsageIndex
+
+
+def make_port(port_id, sg_ids, device_id=""):
+    return SimpleNamespace(id=port_id, security_group_ids=sg_ids, device_id=device_id)
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    return SgUsageIndex(
+        [
+            make_port("p1", ["sg1", "sg2"], "server1"),
+            make_port("p2", ["sg1"], "server2"),
+            make_port("p3", ["sg1"], "server1"),
+            make_port("p4", ["sg3"]),
+            make_port("p5", [], "server3"),
+            make_port("p6", None, "server4"),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "sg_id, used, ports, devices",
+    [
+        ("sg1", True, ("p1", "p2", "p3"), {"server1", "server2"}),
+        ("sg2", True, ("p1",), {"server1"}),
+        ("sg3", True, ("p4",), set()),
+        ("sg4", False, (), set()),
+    ],
+)
+def test_sg_usage_index(index, sg_id, used, ports, devices):
+    assert (sg_id in index) is used
+    assert index.ports_of(sg_id) == ports
+    assert index.devices_of(sg_id) == devices
+
+
+def test_sg_usage_index_used_sg_ids(index):
+    assert len(index) == 3
+    assert index.used_sg_ids == {"sg1", "sg2", "sg3"}
+    assert sorted(index) == ["sg1", "sg2", "sg3"]
+
+
+# vim: ts=4
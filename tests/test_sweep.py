@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Test sweep line of covered ranges and networks."""
+
+import ipaddress
+import random
+
+import pytest
+
+from snitch.utils.sweep import find_covered
+
+
+def covers(item, other):
+    return (
+        item[0] <= other[0]
+        and item[1] >= other[1]
+        and item[2].version == other[2].version
+        and other[2].subnet_of(item[2])
+    )
+
+
+def random_network(rnd):
+    if rnd.random() < 0.2:
+        prefixlen = rnd.choice((0, 32, 64, 128))
+        address = rnd.getrandbits(2) << 126
+        return ipaddress.ip_network(
+            (address >> (128 - prefixlen) << (128 - prefixlen), prefixlen)
+        )
+    prefixlen = rnd.choice((0, 8, 16, 24, 25, 32))
+    address = rnd.getrandbits(3) << 29 | rnd.getrandbits(1) << 7
+    return ipaddress.ip_network(
+        (address >> (32 - prefixlen) << (32 - prefixlen), prefixlen)
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_covered_matches_pairwise(seed):
+    rnd = random.Random(seed)
+    items = []
+    for _ in range(200):
+        first = rnd.choice((0, 20, 22, 80, 443, 1000))
+        last = first + rnd.choice((0, 0, 2, 100, 65535 - first))
+        items.append((first, last, random_network(rnd), rnd.random() < 0.9))
+
+    covered = find_covered(items)
+
+    for idx, item in enumerate(items):
+        # covered by an item not queryable or not after it, when both are equal
+        expected = item[3] and any(
+            covers(other, item)
+            and (other[:3] != item[:3] or not other[3] or other_idx < idx)
+            for other_idx, other in enumerate(items)
+            if other_idx != idx
+        )
+        assert (idx in covered) is expected
+        if idx in covered:
+            assert covers(items[covered[idx]], item)
+
+
+def test_find_covered_empty():
+    assert find_covered([]) == {}
+
+
+# vim: ts=4
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Test Violation and ViolationStore classes."""
+
+import pytest
+
+from snitch.violation.violation import Violation, ViolationStore
+
+
+def make_violation(resource_id, message="Security group not used"):
+    return Violation(
+        project_name="my_project",
+        resource_type="SG",
+        resource_name=f"name-{resource_id}",
+        resource_id=resource_id,
+        resource_created_at="2000-01-01T00:00:00Z",
+        message=message,
+    )
+
+
+def test_violation_to_dict():
+    assert make_violation("sg1").to_dict == {
+        "project_name": "my_project",
+        "resource_type": "SG",
+        "resource_name": "name-sg1",
+        "resource_id": "sg1",
+        "resource_created_at": "2000-01-01T00:00:00Z",
+        "message": "Security group not used",
+        "cloud": "",
+        "region": "",
+    }
+
+
+def test_violation_is_immutable():
+    violation = make_violation("sg1")
+    with pytest.raises(AttributeError):
+        violation.message = "other"
+    assert not hasattr(violation, "__dict__")
+
+
+def test_violation_store():
+    violations = [
+        make_violation("sg1"),
+        make_violation("sg1", "Missing tags Team"),
+        make_violation("sg2"),
+        make_violation("sg1"),
+    ]
+    store = ViolationStore(violations)
+
+    assert len(store) == 4
+    assert list(store) == violations
+    assert list(store.column("resource_id")) == ["sg1", "sg1", "sg2", "sg1"]
+    # my_project, SG, 2000-01-01..., 2 names, 2 ids, 2 messages and "" (cloud
+    # and region)
+    assert store.distinct_values == 10
+
+    store.append(make_violation("sg3"))
+    assert list(store)[-1] == make_violation("sg3")
+
+    store.clear()
+    assert not list(store)
+    assert store.distinct_values == 0
+
+
+def test_violation_store_none_values():
+    violation = make_violation("sg1")._replace(resource_created_at=None)
+    assert list(ViolationStore([violation])) == [violation]
+
+
+# vim: ts=4
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Test periodic scans helpers."""
+
+import argparse
+import os
+import shutil
+import threading
+import time
+
+import pytest
+import yaml
+
+import snitch
+from snitch import os_snitch
+from snitch.utils.watch import FileWatcher, run_every
+
+
+def test_file_watcher(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text("a: 1\n")
+    watcher = FileWatcher(str(path))
+    assert not watcher.changed()
+
+    path.write_text("a: 22\n")
+    assert watcher.changed()
+    assert not watcher.changed()
+
+    # a file being replaced is not a change until it exists again
+    os.unlink(path)
+    assert not watcher.changed()
+    path.write_text("a: 333\n")
+    assert watcher.changed()
+
+
+def test_file_watcher_forget(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text("a: 1\n")
+    watcher = FileWatcher(str(path))
+
+    # e.g. the file could not be read, read it again
+    watcher.forget()
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_run_every_max_cycles():
+    cycles = []
+    assert run_every(0, cycles.append, max_cycles=3) == 3
+    assert cycles == [1, 2, 3]
+
+
+def test_run_every_interval():
+    starts = []
+    run_every(0.1, lambda _: starts.append(time.monotonic()), max_cycles=3)
+    assert starts[2] - starts[0] >= 0.2
+
+
+def test_run_every_stop():
+    """Setting stop ends the wait for the next cycle."""
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+
+    start = time.monotonic()
+    assert run_every(60, lambda _: None, stop=stop) == 1
+    assert time.monotonic() - start < 5
+
+
+def test_watch_compliance_unreadable_file(tmp_path, monkeypatch):
+    """The previous rules are kept while the file cannot be read."""
+    path = tmp_path / "rules.yaml"
+    shutil.copy(
+        os.path.join(os.path.dirname(snitch.__file__), "compliance_rules.yaml"), path
+    )
+    options = argparse.Namespace(compliance_file=str(path), resource=["sg"], watch=0)
+    policies = os_snitch.read_compliance_policies(str(path), None, ["sg"])
+    scanned = []
+
+    def run_scan(_os_conns, _options, scan_policies, **_kwargs):
+        scanned.append(scan_policies)
+        if len(scanned) == 1:
+            # being replaced
+            path.unlink()
+            path.mkdir()
+        elif len(scanned) == 2:
+            path.rmdir()
+            path.write_text("project_1:\n  sg: {}\n")
+        else:
+            raise KeyboardInterrupt()
+        return True
+
+    monkeypatch.setattr(os_snitch, "run_scan", run_scan)
+    monkeypatch.setattr(os_snitch.signal, "signal", lambda *_: None)
+    os_snitch.watch_compliance([], options, policies, None)
+
+    assert scanned[1] is policies
+    assert list(scanned[2]) == ["project_1"]
+
+
+def test_read_compliance_policies_invalid_project(tmp_path, sg_compliance_rules):
+    """An invalid section of a project not scanned does not stop the scan."""
+    path = tmp_path / "rules.yaml"
+    rules = {
+        "project_1": {"sg": sg_compliance_rules},
+        "project_2": {"sg": {"unknown_option": True}},
+        "project_3": {"server": {"mandatory_tags": [], "mandatory_metadata": []}},
+    }
+    path.write_text(yaml.safe_dump(rules))
+    policies = os_snitch.read_compliance_policies(str(path), ["project_1"], ["sg"])
+    assert list(policies) == ["project_1"]
+
+    errors = {}
+    policies = os_snitch.read_compliance_policies(str(path), None, ["sg"], errors)
+    assert list(policies) == ["project_1"]
+    assert sorted(errors) == ["project_2", "project_3"]
+    with pytest.raises(os_snitch.PolicyError, match="project_3.sg: compliance"):
+        raise errors["project_3"]
+
+    with pytest.raises(os_snitch.PolicyError, match="project_2"):
+        os_snitch.read_compliance_policies(str(path), None, ["sg"])
+
+
+def test_scan_region_current_project_invalid():
+    os_conn = argparse.Namespace(current_project=argparse.Namespace(name="project_2"))
+    options = argparse.Namespace(projects="current")
+    error = os_snitch.PolicyError("project_2.sg: unknown option")
+    with pytest.raises(os_snitch.PolicyError, match="unknown option"):
+        os_snitch.scan_region(os_conn, options, {}, policy_errors={"project_2": error})
+
+
+# vim: ts=4